@@ -0,0 +1,400 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Benchmark of the ingest pipeline.
+
+Builds a temporary Butler repo, generates synthetic Hermes messages for a
+data type and feeds them through IngestD.process with an in-memory stand-in
+for the Kafka consumer.  For each data type and batch size, reports
+messages/sec, the p50 and p99 batch latency and the number of Butler and
+registry calls made.
+
+Messages can be generated for data_product, dim_file and zip_file; raw_file
+needs real raw files and the obs packages for their instrument, so it is
+not generated.  A fraction of the messages (--bad-ratio) refer to files
+which can't be ingested, to exercise the retry paths of RseButler.  With
+--replay, the messages are ingested once before the measurement, which then
+covers a replay of the same messages.
+
+Usage: python benchmarks/bench_ingest.py [--data-type T ...]
+           [--batch-size N ...] [--batches B] [--bad-ratio R]
+           [--config KEY=VALUE ...] [--replay]
+"""
+
+import argparse
+import collections
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+import uuid
+
+import yaml
+
+from lsst.ctrl.ingestd.config import Config
+from lsst.ctrl.ingestd.entries.dataType import DataType
+from lsst.ctrl.ingestd.ingestd import IngestD
+from lsst.daf.butler import Butler, DatasetRef, FileDataset
+
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "data")
+PREP_FILE = os.path.join(TEST_DATA_DIR, "prep.yaml")
+FITS_FILE = os.path.join(
+    TEST_DATA_DIR, "visitSummary_HSC_y_HSC-Y_330_HSC_runs_RC2_w_2023_32_DM-40356_20230814T170253Z.fits"
+)
+RSE = "BENCH"
+SCOPE = "bench"
+TOPIC = f"{RSE}-{SCOPE}"
+RUCIO_PREFIX = "root://bench:1094//rucio/"
+# run collection of the generated data products
+RUN = "bench/run"
+# the i-th good data product is of visit FIRST_VISIT + i, registered as a
+# copy of the visit of the test data; bad ones are of BAD_VISIT, which isn't
+FIRST_VISIT = 100000
+BAD_VISIT = 328
+
+# Butler and registry methods whose calls are counted
+COUNTED_BUTLER_CALLS = ("ingest", "ingest_zip", "import_", "get_many_datasets", "stored_many", "get_dataset")
+COUNTED_REGISTRY_CALLS = ("insertDimensionData",)
+
+
+class InMemoryMessage:
+    """Stand-in for a confluent_kafka.Message"""
+
+    def __init__(self, value: bytes, offset: int):
+        self._value = value
+        self._offset = offset
+
+    def value(self) -> bytes:
+        return self._value
+
+    def topic(self) -> str:
+        return TOPIC
+
+    def partition(self) -> int:
+        return 0
+
+    def offset(self) -> int:
+        return self._offset
+
+    def error(self):
+        return None
+
+
+class InMemoryConsumer:
+    """Stand-in for a confluent_kafka.Consumer which hands out a fixed list
+    of messages
+    """
+
+    def __init__(self, messages: list):
+        self._messages = collections.deque(messages)
+
+    def consume(self, num_messages: int = 1, timeout: float = -1) -> list:
+        count = min(num_messages, len(self._messages))
+        return [self._messages.popleft() for _ in range(count)]
+
+    def commit(self, offsets=None, asynchronous: bool = True):
+        pass
+
+    def assignment(self) -> list:
+        return []
+
+    def pause(self, partitions: list):
+        pass
+
+    def resume(self, partitions: list):
+        pass
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+
+class CallCounter:
+    """Count calls made to methods of an object"""
+
+    def __init__(self):
+        self.counts = collections.Counter()
+
+    def wrap(self, obj, names: tuple):
+        for name in names:
+            method = getattr(obj, name, None)
+            if method is not None:
+                setattr(obj, name, self._counting(name, method))
+
+    def _counting(self, name, method):
+        def wrapper(*args, **kwargs):
+            self.counts[name] += 1
+            return method(*args, **kwargs)
+
+        return wrapper
+
+
+def hermes_message(data_type: str, name: str, sidecar: str = "") -> dict:
+    """Return a synthetic Hermes transfer-done message"""
+    return {
+        "event_type": "transfer-done",
+        "payload": {
+            "scope": SCOPE,
+            "name": name,
+            "dst-rse": RSE,
+            "dst-url": f"{RUCIO_PREFIX}{name}",
+            "rubin_butler": data_type,
+            "rubin_sidecar": sidecar,
+        },
+    }
+
+
+def data_product_sidecar(visit: int) -> str:
+    """Return the sidecar of a visitSummary dataset of a visit"""
+    return json.dumps(
+        {
+            "id": str(uuid.uuid4()),
+            "datasetType": {
+                "name": "visitSummary",
+                "storageClass": "ExposureCatalog",
+                "dimensions": ["instrument", "visit"],
+            },
+            "dataId": {
+                "dataId": {"instrument": "HSC", "visit": visit, "band": "y", "physical_filter": "HSC-Y"}
+            },
+            "run": RUN,
+        }
+    )
+
+
+def register_visits(butler: Butler, count: int):
+    """Register visits FIRST_VISIT to FIRST_VISIT + count - 1 as copies of
+    the visit of the test data
+    """
+    (record,) = butler.registry.queryDimensionRecords("visit", instrument="HSC", visit=330)
+    template = record.toDict()
+    visits = range(FIRST_VISIT, FIRST_VISIT + count)
+    records = [dict(template, id=visit, name=f"BENCH{visit}", seq_num=visit) for visit in visits]
+    butler.registry.insertDimensionData("visit", *records)
+
+
+def make_data_products(files_dir: str, count: int, bad: list[bool]) -> list[dict]:
+    """Good files are links to a real visitSummary, each of a visit of its
+    own; bad ones refer to a visit which isn't registered
+    """
+    messages = []
+    for i in range(count):
+        name = f"dp_{i}.fits"
+        os.link(FITS_FILE, os.path.join(files_dir, name))
+        visit = BAD_VISIT if bad[i] else FIRST_VISIT + i
+        messages.append(hermes_message(DataType.DATA_PRODUCT, name, data_product_sidecar(visit)))
+    return messages
+
+
+def make_dim_files(files_dir: str, count: int, bad: list[bool]) -> list[dict]:
+    """Good files are copies of the test dimension export; bad ones can't be
+    parsed
+    """
+    messages = []
+    for i in range(count):
+        name = f"dim_{i}.yaml"
+        path = os.path.join(files_dir, name)
+        if bad[i]:
+            with open(path, "w") as f:
+                f.write("data: [not yaml\n")
+        else:
+            os.link(PREP_FILE, path)
+        messages.append(hermes_message(DataType.DIM_FILE, name))
+    return messages
+
+
+def make_zip_files(files_dir: str, count: int, bad: list[bool]) -> list[dict]:
+    """Good files are zips made from a separate repo holding one visitSummary
+    each, of a visit of its own; bad ones aren't zip files
+    """
+    source_dir = tempfile.mkdtemp()
+    try:
+        Butler.makeRepo(source_dir)
+        source = Butler(source_dir, writeable=True)
+        source.import_(filename=PREP_FILE)
+        register_visits(source, count)
+        messages = []
+        for i in range(count):
+            if bad[i]:
+                name = f"bad_{i}.zip"
+                with open(os.path.join(files_dir, name), "w") as f:
+                    f.write("not a zip file")
+            else:
+                sidecar = data_product_sidecar(FIRST_VISIT + i)
+                ref = DatasetRef.from_json(sidecar, registry=source.registry)
+                source.ingest(FileDataset(FITS_FILE, ref), transfer="copy")
+                zip_path = source.retrieve_artifacts_zip([ref], files_dir)
+                name = zip_path.basename()
+            messages.append(hermes_message(DataType.ZIP_FILE, name))
+        return messages
+    finally:
+        shutil.rmtree(source_dir, ignore_errors=True)
+
+
+GENERATORS = {
+    DataType.DATA_PRODUCT: make_data_products,
+    DataType.DIM_FILE: make_dim_files,
+    DataType.ZIP_FILE: make_zip_files,
+}
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_case(
+    data_type: str,
+    batch_size: int,
+    batches: int,
+    bad_ratio: float,
+    seed: int,
+    overrides: dict,
+    replay: bool = False,
+) -> dict:
+    """Ingest batches * batch_size synthetic messages of a data type into a
+    new repo, and return the measurements; overrides are extra Config
+    settings.  With replay, the messages are ingested once before being
+    measured.
+    """
+    work_dir = tempfile.mkdtemp()
+    try:
+        repo_dir = os.path.join(work_dir, "repo")
+        files_dir = os.path.join(work_dir, "files")
+        os.makedirs(files_dir)
+
+        count = batch_size * batches
+        rng = random.Random(seed)
+        bad = [rng.random() < bad_ratio for _ in range(count)]
+        payloads = GENERATORS[data_type](files_dir, count, bad)
+        messages = [InMemoryMessage(json.dumps(p).encode(), i) for i, p in enumerate(payloads)]
+
+        Butler.makeRepo(repo_dir)
+        config = Config(
+            brokers=["localhost:9092"],
+            group_id="bench",
+            num_messages=batch_size,
+            butler_repo=repo_dir,
+            topics={TOPIC: {"rucio_prefix": RUCIO_PREFIX, "fs_prefix": f"file://{files_dir}/"}},
+            **overrides,
+        )
+        consumer = InMemoryConsumer(messages)
+        ingestd = IngestD(config=config, consumer=consumer)
+        butler = ingestd.rse_butler.butler
+        if data_type != DataType.DIM_FILE:
+            butler.import_(filename=PREP_FILE)
+            register_visits(butler, count)
+        if replay:
+            while len(consumer) > 0:
+                ingestd.process()
+            consumer = ingestd.consumer = InMemoryConsumer(messages)
+
+        counter = CallCounter()
+        counter.wrap(butler, COUNTED_BUTLER_CALLS)
+        # butler.registry is a new shim on each access; count calls on the
+        # registry behind it
+        counter.wrap(getattr(butler, "_registry", butler.registry), COUNTED_REGISTRY_CALLS)
+
+        latencies = []
+        start = time.perf_counter()
+        while len(consumer) > 0:
+            batch_start = time.perf_counter()
+            ingestd.process()
+            latencies.append(time.perf_counter() - batch_start)
+        elapsed = time.perf_counter() - start
+
+        return {
+            "data_type": data_type,
+            "batch_size": batch_size,
+            "messages": count,
+            "bad": sum(bad),
+            "msgs_per_sec": count / elapsed,
+            "p50": percentile(latencies, 0.5),
+            "p99": percentile(latencies, 0.99),
+            "calls": dict(counter.counts),
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--data-type",
+        action="append",
+        choices=sorted(GENERATORS),
+        help="data type to benchmark; may be repeated (default: all)",
+    )
+    parser.add_argument(
+        "--batch-size", action="append", type=int, help="batch size; may be repeated (default: 10, 100)"
+    )
+    parser.add_argument("--batches", type=int, default=5, help="number of batches per case")
+    parser.add_argument("--bad-ratio", type=float, default=0.0, help="fraction of bad files")
+    parser.add_argument("--seed", type=int, default=1, help="seed used to pick bad files")
+    parser.add_argument(
+        "--config",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="ingestd configuration setting, in YAML; may be repeated",
+    )
+    parser.add_argument(
+        "--replay", action="store_true", help="measure a replay of messages which were already ingested"
+    )
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show ingestd logging")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+
+    overrides = {}
+    for setting in args.config:
+        key, _, value = setting.partition("=")
+        overrides[key] = yaml.safe_load(value)
+
+    results = []
+    for data_type in args.data_type or sorted(GENERATORS):
+        for batch_size in args.batch_size or [10, 100]:
+            results.append(
+                run_case(
+                    data_type, batch_size, args.batches, args.bad_ratio, args.seed, overrides, args.replay
+                )
+            )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    header = f"{'data_type':<14}{'batch':>7}{'msgs':>7}{'bad':>6}{'msgs/sec':>11}{'p50 s':>9}{'p99 s':>9}"
+    print(f"{header}  calls")
+    for r in results:
+        calls = " ".join(f"{name}={count}" for name, count in sorted(r["calls"].items()))
+        print(
+            f"{r['data_type']:<14}{r['batch_size']:>7}{r['messages']:>7}{r['bad']:>6}"
+            f"{r['msgs_per_sec']:>11.1f}{r['p50']:>9.3f}{r['p99']:>9.3f}  {calls}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Micro-benchmark of Message decoding.
+
+Compares the rate at which Hermes messages are turned into Message
+objects against the previous implementation, which kept the fully
+decoded message and the Kafka message object.
+
+Usage: python benchmarks/bench_message.py [--count N] [--repeat R]
+"""
+
+import argparse
+import json
+import os.path
+import time
+
+from lsst.ctrl.ingestd.message import Message
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "data")
+
+
+class FakeKafkaMessage:
+    def __init__(self, value: bytes, offset: int):
+        self._value = value
+        self._offset = offset
+
+    def value(self) -> bytes:
+        return self._value
+
+    def topic(self) -> str:
+        return "XRD5-test"
+
+    def partition(self) -> int:
+        return 0
+
+    def offset(self) -> int:
+        return self._offset
+
+
+class PreviousMessage:
+    """Message decoding as it was before Message kept only the fields
+    ingestd uses
+    """
+
+    def __init__(self, kafka_message):
+        self._message = kafka_message
+        value = self._message.value()
+        self.msg = json.loads(value)
+        self.payload = self.msg["payload"]
+
+
+def run(cls, kafka_messages: list, repeat: int) -> float:
+    """Return the best rate, in messages per second, of decoding
+    kafka_messages with cls
+    """
+    best = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        messages = [cls(m) for m in kafka_messages]
+        elapsed = time.perf_counter() - start
+        best = max(best, len(messages) / elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100000, help="number of messages per run")
+    parser.add_argument("--repeat", type=int, default=5, help="number of runs; the best is reported")
+    args = parser.parse_args()
+
+    with open(os.path.join(DATA_DIR, "message440.json"), "rb") as f:
+        value = f.read()
+    kafka_messages = [FakeKafkaMessage(value, i) for i in range(args.count)]
+
+    before = run(PreviousMessage, kafka_messages, args.repeat)
+    after = run(Message, kafka_messages, args.repeat)
+    print(f"before: {before:12,.0f} msgs/sec")
+    print(f"after:  {after:12,.0f} msgs/sec  ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,523 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections.abc import Iterator
+
+from lsst.ctrl.ingestd.config import Config
+from lsst.ctrl.ingestd.entries.dataType import DataType
+from lsst.ctrl.ingestd.entries.entryFactory import EntryFactory
+from lsst.ctrl.ingestd.ingestedIndex import IngestedIndex
+from lsst.ctrl.ingestd.mapper import Mapper
+from lsst.ctrl.ingestd.message import Message
+from lsst.ctrl.ingestd.metrics import Metrics
+from lsst.ctrl.ingestd.rseButler import RseButler
+from lsst.resources import ResourcePath
+
+LOGGER = logging.getLogger(__name__)
+
+SIDECAR_SUFFIX = ".json"
+
+# data types of files without a sidecar, by file name suffix
+SUFFIX_DATA_TYPES = {
+    ".zip": DataType.ZIP_FILE,
+    ".yaml": DataType.DIM_FILE,
+    ".yml": DataType.DIM_FILE,
+}
+
+# suffixes of raw file names; raw files need a sidecar
+RAW_SUFFIXES = (".fits", ".fz")
+
+# dataset type of raw files
+RAW_DATASET_TYPE = "raw"
+
+
+def data_type_of(name: str, sidecar: str | None) -> str | None:
+    """Return the data type of a file found by a scan
+
+    A file with a sidecar is a raw file if its name has a raw suffix and
+    the sidecar's dataset type is "raw", and a data product otherwise.  A
+    file without a sidecar gets its data type from the suffix of its name,
+    see SUFFIX_DATA_TYPES; raw files without a sidecar can't be ingested,
+    so their data type isn't known.
+
+    Parameters
+    ----------
+    name : `str`
+        name of the file
+    sidecar : `str` or `None`
+        content of the file's sidecar, if it has one
+
+    Returns
+    -------
+    data_type : `str` or `None`
+        data type of the file, or None if it isn't known
+    """
+    if sidecar is not None:
+        if name.endswith(RAW_SUFFIXES) and _dataset_type_name(sidecar) == RAW_DATASET_TYPE:
+            return DataType.RAW_FILE
+        return DataType.DATA_PRODUCT
+    for suffix, data_type in SUFFIX_DATA_TYPES.items():
+        if name.endswith(suffix):
+            return data_type
+    return None
+
+
+def _dataset_type_name(sidecar: str) -> str | None:
+    """Return the dataset type name of a sidecar, or None if it has none"""
+    try:
+        dataset_type = json.loads(sidecar).get("datasetType") or {}
+        return dataset_type.get("name")
+    except (ValueError, AttributeError):
+        return None
+
+
+class DirectoryScanner:
+    """Lists the files of directory trees, with several directories listed
+    at the same time
+
+    Parameters
+    ----------
+    roots : `list` [`tuple` [`str`, `str`]]
+        (topic, directory) for each tree to scan
+    workers : `int`, optional
+        number of threads listing directories
+    """
+
+    def __init__(self, roots: list[tuple[str, str]], workers: int = 8):
+        self.roots = roots
+        self.workers = workers
+
+    def scan(self) -> Iterator[tuple[str, str, list[str]]]:
+        """List all the directories of the trees, in no particular order
+
+        Yields
+        ------
+        topic : `str`
+            topic of the tree the directory is in
+        directory : `str`
+            path of the directory
+        names : `list` [`str`]
+            sorted names of the files in the directory
+        """
+        if not self.roots:
+            return
+        todo = queue.Queue()
+        results = queue.Queue(maxsize=16 * self.workers)
+        # directories queued but not yet listed
+        outstanding = [len(self.roots)]
+        lock = threading.Lock()
+        done = object()
+
+        def work():
+            while True:
+                item = todo.get()
+                if item is None:
+                    return
+                topic, directory = item
+                try:
+                    names, subdirectories = _list_directory(directory)
+                except OSError as e:
+                    LOGGER.warning("couldn't list %s: %s", directory, e)
+                    names, subdirectories = None, []
+                with lock:
+                    outstanding[0] += len(subdirectories)
+                for subdirectory in subdirectories:
+                    todo.put((topic, subdirectory))
+                if names is not None:
+                    results.put((topic, directory, names))
+                with lock:
+                    outstanding[0] -= 1
+                    finished = outstanding[0] == 0
+                if finished:
+                    for _ in range(self.workers):
+                        todo.put(None)
+                    results.put(done)
+
+        for root in self.roots:
+            todo.put(root)
+        threads = [
+            threading.Thread(target=work, name=f"scanner-{i}", daemon=True) for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        while (result := results.get()) is not done:
+            yield result
+        for thread in threads:
+            thread.join()
+
+
+def _list_directory(directory: str) -> tuple[list[str], list[str]]:
+    """Return the sorted names of the files, and the paths of the
+    subdirectories, of a directory
+    """
+    names = []
+    subdirectories = []
+    with os.scandir(directory) as it:
+        for dir_entry in it:
+            if dir_entry.is_dir(follow_symlinks=False):
+                subdirectories.append(dir_entry.path)
+            else:
+                names.append(dir_entry.name)
+    names.sort()
+    return names, subdirectories
+
+
+class Checkpoint:
+    """Record of the directories whose files have all been ingested, kept
+    in a SQLite database, so an interrupted backfill can be resumed
+
+    Parameters
+    ----------
+    filename : `str`
+        name of the SQLite database file; created if it doesn't exist
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._connection = sqlite3.connect(filename)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS directories (path TEXT PRIMARY KEY) WITHOUT ROWID"
+            )
+
+    def add(self, directories: list[str]):
+        """Record directories as done
+
+        Parameters
+        ----------
+        directories : `list` [`str`]
+            paths of the directories
+        """
+        if not directories:
+            return
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO directories (path) VALUES (?)", [(d,) for d in directories]
+            )
+
+    def __contains__(self, directory: str) -> bool:
+        cursor = self._connection.execute("SELECT 1 FROM directories WHERE path = ?", (directory,))
+        return cursor.fetchone() is not None
+
+    def close(self):
+        self._connection.close()
+
+
+class Backfill:
+    """Ingests the files found under the fs_prefix of topics, for files
+    whose messages are no longer available from Kafka
+
+    The directories are listed by a DirectoryScanner.  Each file is
+    turned into the message Hermes would have sent for it, with its URL
+    rewritten back to a Rucio URL, and the messages are ingested in
+    batches like those read from Kafka.  A file named after another file
+    plus the sidecar suffix holds the sidecar of that file.  Files get
+    their data type from their names and sidecars, see data_type_of, and
+    files of unknown type are skipped.
+
+    Parameters
+    ----------
+    config : `lsst.ctrl.ingestd.config.Config`
+        configuration; the Kafka settings aren't used
+    topics : `list` [`str`], optional
+        topics to scan the fs_prefix of; defaults to all topics
+    batch_size : `int`, optional
+        number of files ingested together; defaults to the batch_size of
+        the configuration
+    scan_workers : `int`, optional
+        number of threads listing directories
+    checkpoint : `str`, optional
+        checkpoint file; directories it records as done are skipped, and
+        directories are added to it once all their files are ingested;
+        directories with files which couldn't be ingested aren't, so they
+        are tried again by the next run
+    sidecar_suffix : `str`, optional
+        suffix of sidecar file names
+    failed_file : `str`, optional
+        file to write the messages of the files which couldn't be
+        ingested to, one per line, which can be replayed later
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        topics: list[str] | None = None,
+        batch_size: int | None = None,
+        scan_workers: int = 8,
+        checkpoint: str | None = None,
+        sidecar_suffix: str = SIDECAR_SUFFIX,
+        failed_file: str | None = None,
+    ):
+        self.config = config
+        self.batch_size = batch_size if batch_size is not None else config.batch_size
+        self.sidecar_suffix = sidecar_suffix
+        self.checkpoint_file = checkpoint
+        self.failed_file = failed_file
+
+        if topics is None:
+            topics = list(config.topics)
+        self.roots = []
+        # for each topic, its (rse, scope, rucio_prefix, fs_prefix)
+        self._prefixes = {}
+        for topic in topics:
+            if topic not in config.topics:
+                raise ValueError(f"couldn't find {topic} in topics list")
+            if "-" not in topic:
+                raise ValueError(f"topic {topic} isn't named <rse>-<scope>")
+            topic_entry = config.topics[topic]
+            root = ResourcePath(topic_entry.fs_prefix, forceDirectory=True)
+            if not root.isLocal:
+                raise ValueError(f"fs_prefix {topic_entry.fs_prefix} of {topic} isn't a local directory")
+            rse, scope = topic.split("-", 1)
+            # URLs made with the longest rucio_prefix are rewritten with it
+            rucio_prefix = max(topic_entry.rucio_prefixes, key=len)
+            root_path = root.ospath.rstrip("/")
+            self._prefixes[topic] = (rse, scope, rucio_prefix, root_path)
+            self.roots.append((topic, root_path))
+        self.scanner = DirectoryScanner(self.roots, scan_workers)
+
+        self.mapper = Mapper(config.topics)
+        self.metrics = Metrics()
+        ingested_index = None
+        if config.ingested_index is not None:
+            ingested_index = IngestedIndex(config.ingested_index, config.ingested_index_capacity)
+        self.rse_butler = RseButler(
+            config.butler_repo,
+            zip_workers=config.zip_workers,
+            merge_dim_files=config.merge_dim_files,
+            metrics=self.metrics,
+            ingested_index=ingested_index,
+            raw_processes=config.raw_processes,
+            group_size=config.ingest_group_size,
+        )
+        self.entry_factory = EntryFactory(self.rse_butler, self.mapper)
+        self._failed_output = None
+
+    def run(self) -> dict:
+        """Scan the directories and ingest their files
+
+        Returns
+        -------
+        summary : `dict`
+            counts of directories and files, and the time taken; see
+            format_summary
+        """
+        start = time.monotonic()
+        summary = {"directories": 0, "directories_skipped": 0, "files": 0, "unknown": 0}
+        checkpoint = Checkpoint(self.checkpoint_file) if self.checkpoint_file is not None else None
+        if self.failed_file is not None:
+            self._failed_output = open(self.failed_file, "wb")
+        # directories listed whose files haven't been ingested yet, with
+        # the messages of their files
+        listed = []
+        pending = 0
+        try:
+            for topic, directory, names in self.scanner.scan():
+                summary["directories"] += 1
+                if checkpoint is not None and directory in checkpoint:
+                    summary["directories_skipped"] += 1
+                    continue
+                messages, unknown = self._messages(topic, directory, names)
+                summary["files"] += len(messages)
+                summary["unknown"] += unknown
+                listed.append((directory, messages))
+                pending += len(messages)
+                if pending >= self.batch_size:
+                    self._ingest_directories(listed, checkpoint)
+                    listed = []
+                    pending = 0
+            self._ingest_directories(listed, checkpoint)
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+            if self._failed_output is not None:
+                self._failed_output.close()
+                self._failed_output = None
+
+        def total(counter):
+            return int(sum(counter.snapshot().values()))
+
+        summary.update(
+            {
+                "message_errors": total(self.metrics.message_errors),
+                "ingested": total(self.metrics.files_ingested),
+                "failed": total(self.metrics.files_failed),
+                "skipped": total(self.metrics.files_skipped),
+                "seconds": time.monotonic() - start,
+            }
+        )
+        return summary
+
+    def _messages(self, topic: str, directory: str, names: list[str]) -> tuple[list[Message], int]:
+        """Return the messages for the files of a directory; sidecars, and
+        files whose data type isn't known, don't get a message
+
+        Parameters
+        ----------
+        topic : `str`
+            topic of the tree the directory is in
+        directory : `str`
+            path of the directory
+        names : `list` [`str`]
+            names of the files in the directory
+
+        Returns
+        -------
+        messages : `list` [`lsst.ctrl.ingestd.message.Message`]
+            messages of the files
+        unknown : `int`
+            number of files whose data type isn't known
+        """
+        rse, scope, rucio_prefix, root_path = self._prefixes[topic]
+        relative = os.path.relpath(directory, root_path)
+        url_prefix = rucio_prefix if relative == "." else f"{rucio_prefix}{relative}/"
+        present = set(names)
+        messages = []
+        unknown = 0
+        for name in names:
+            if name.endswith(self.sidecar_suffix) and name[: -len(self.sidecar_suffix)] in present:
+                continue
+            sidecar = None
+            if name + self.sidecar_suffix in present:
+                with open(os.path.join(directory, name + self.sidecar_suffix)) as f:
+                    sidecar = f.read()
+            data_type = data_type_of(name, sidecar)
+            if data_type is None:
+                LOGGER.debug("skipping %s/%s, whose data type isn't known", directory, name)
+                unknown += 1
+                continue
+            messages.append(
+                Message.from_dict(
+                    {
+                        "dst_rse": rse,
+                        "dst_url": url_prefix + name,
+                        "rubin_butler": data_type,
+                        "rubin_sidecar": sidecar if sidecar is not None else "",
+                        "scope": scope,
+                        "topic": topic,
+                    }
+                )
+            )
+        return messages, unknown
+
+    def _ingest_directories(self, listed: list[tuple], checkpoint: Checkpoint | None):
+        """Ingest the files of directories, and record the directories all
+        of whose files were ingested in the checkpoint, if there is one
+
+        Parameters
+        ----------
+        listed : `list` [`tuple`]
+            (directory, messages of its files) of each directory
+        checkpoint : `Checkpoint` or `None`
+            checkpoint to record the directories in
+        """
+        failed = {id(message) for message in self._ingest_all([m for _, msgs in listed for m in msgs])}
+        if checkpoint is None:
+            return
+        done = []
+        for directory, messages in listed:
+            if any(id(message) in failed for message in messages):
+                LOGGER.info("not checkpointing %s, some of whose files couldn't be ingested", directory)
+            else:
+                done.append(directory)
+        checkpoint.add(done)
+
+    def _ingest_all(self, messages: list[Message]) -> list[Message]:
+        """Ingest messages in batches of batch_size, returning the messages
+        which failed
+        """
+        failed = []
+        for i in range(0, len(messages), self.batch_size):
+            failed.extend(self._ingest(messages[i : i + self.batch_size]))
+        return failed
+
+    def _ingest(self, messages: list[Message]) -> list[Message]:
+        """Create entries for a batch of messages and ingest them, writing
+        the messages which failed to the failed file
+
+        Parameters
+        ----------
+        messages : `list` [`lsst.ctrl.ingestd.message.Message`]
+            messages to ingest
+
+        Returns
+        -------
+        failed : `list` [`lsst.ctrl.ingestd.message.Message`]
+            messages which couldn't be turned into entries, or whose
+            entries couldn't be ingested
+        """
+        entries, errors = self.entry_factory.create_entries(messages)
+        for message, _ in errors:
+            self.metrics.message_errors.inc(topic=message.topic)
+        failed = self.rse_butler.ingest(entries) if entries else []
+        failed_messages = [message for message, _ in errors] + [entry.message for entry in failed]
+        self._write_failed(failed_messages)
+        return failed_messages
+
+    def _write_failed(self, messages: list[Message]):
+        """Write messages, as Hermes messages, to the failed file, if there
+        is one
+        """
+        if self._failed_output is None:
+            return
+        for message in messages:
+            payload = {
+                "scope": message.scope,
+                "dst-rse": message.dst_rse,
+                "dst-url": message.dst_url,
+                "rubin_butler": message.rubin_butler,
+                "rubin_sidecar": message.rubin_sidecar,
+            }
+            line = json.dumps({"event_type": "transfer-done", "payload": payload})
+            self._failed_output.write(line.encode() + b"\n")
+
+
+def format_summary(summary: dict) -> str:
+    """Return a backfill summary as text
+
+    Parameters
+    ----------
+    summary : `dict`
+        summary returned by Backfill.run
+
+    Returns
+    -------
+    text : `str`
+        the summary
+    """
+    seconds = summary["seconds"]
+    rate = summary["files"] / seconds if seconds > 0 else 0.0
+    return (
+        f"{summary['directories']} directories ({summary['directories_skipped']} already done), "
+        f"{summary['files']} files in {seconds:.1f} seconds ({rate:.1f} files/sec): "
+        f"{summary['ingested']} ingested, {summary['skipped']} skipped as already ingested, "
+        f"{summary['failed']} failed, {summary['message_errors']} unusable, "
+        f"{summary['unknown']} of unknown type"
+    )
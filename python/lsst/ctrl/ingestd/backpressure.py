@@ -0,0 +1,133 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import logging
+import threading
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Backpressure:
+    """Pauses a Kafka consumer's partitions while too many messages are
+    waiting to be ingested, and resumes them once enough have been
+
+    The consumer is paused when the number of pending messages or their
+    size in bytes goes above its high-water mark, and resumed when both
+    are at or below their low-water marks.  A high-water mark of 0 turns
+    that limit off.  While paused, the consumer keeps being polled, which
+    keeps it in its consumer group, but no messages are fetched.
+
+    Parameters
+    ----------
+    consumer : `confluent_kafka.Consumer`
+        consumer to pause and resume
+    high_messages : `int`
+        number of pending messages above which the consumer is paused
+    low_messages : `int`
+        number of pending messages at or below which it is resumed
+    high_bytes : `int`, optional
+        size of the pending messages above which the consumer is paused
+    low_bytes : `int`, optional
+        size of the pending messages at or below which it is resumed
+    metrics : `lsst.ctrl.ingestd.metrics.Metrics`, optional
+        metrics to count pauses in
+    """
+
+    def __init__(
+        self,
+        consumer,
+        high_messages: int,
+        low_messages: int,
+        high_bytes: int = 0,
+        low_bytes: int = 0,
+        metrics=None,
+    ):
+        self.consumer = consumer
+        self.high_messages = high_messages
+        self.low_messages = low_messages
+        self.high_bytes = high_bytes
+        self.low_bytes = low_bytes
+        self.metrics = metrics
+        self.messages = 0
+        self.bytes = 0
+        self.paused = False
+        # messages are added by the fetch stage and removed by the ingest
+        # stage, which may run in different threads
+        self._lock = threading.Lock()
+
+    def add(self, messages: int, nbytes: int):
+        """Record messages which are waiting to be ingested, pausing the
+        consumer if that takes them above a high-water mark
+
+        Parameters
+        ----------
+        messages : `int`
+            number of messages
+        nbytes : `int`
+            size of the messages in bytes
+        """
+        with self._lock:
+            self.messages += messages
+            self.bytes += nbytes
+            if not self.paused and self._above_high():
+                LOGGER.info("pausing consumer: %d messages, %d bytes pending", self.messages, self.bytes)
+                self.consumer.pause(self.consumer.assignment())
+                self.paused = True
+                if self.metrics is not None:
+                    self.metrics.consumer_pauses.inc()
+
+    def remove(self, messages: int, nbytes: int):
+        """Record messages which are no longer waiting to be ingested,
+        resuming the consumer if that takes them below the low-water marks
+
+        Parameters
+        ----------
+        messages : `int`
+            number of messages
+        nbytes : `int`
+            size of the messages in bytes
+        """
+        with self._lock:
+            self.messages -= messages
+            self.bytes -= nbytes
+            if self.paused and self._below_low():
+                LOGGER.info("resuming consumer: %d messages, %d bytes pending", self.messages, self.bytes)
+                self.consumer.resume(self.consumer.assignment())
+                self.paused = False
+
+    def before_consume(self):
+        """Pause any partitions assigned since the consumer was paused;
+        call before each poll of the consumer
+        """
+        with self._lock:
+            if self.paused:
+                self.consumer.pause(self.consumer.assignment())
+
+    def _above_high(self) -> bool:
+        return (self.high_messages > 0 and self.messages > self.high_messages) or (
+            self.high_bytes > 0 and self.bytes > self.high_bytes
+        )
+
+    def _below_low(self) -> bool:
+        return (self.high_messages == 0 or self.messages <= self.low_messages) and (
+            self.high_bytes == 0 or self.bytes <= self.low_bytes
+        )
@@ -0,0 +1,91 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+# fraction of failed entries in a batch above which the batch size is cut
+FAILURE_THRESHOLD = 0.1
+
+
+class BatchController:
+    """Additive-increase/multiplicative-decrease controller for the number
+    of messages ingested in one batch
+
+    The batch size grows by a fixed step after each batch that was full
+    and was ingested within the target latency, and is halved after each
+    batch that was too slow or had too many failures.
+
+    Parameters
+    ----------
+    minimum : `int`
+        smallest batch size
+    maximum : `int`
+        largest batch size
+    target_latency : `float`
+        target time in seconds to ingest one batch
+    """
+
+    def __init__(self, minimum: int, maximum: int, target_latency: float):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.step = max(1, maximum // 20)
+        self.size = minimum
+
+    def update(self, count: int, latency: float, failures: int) -> int:
+        """Adjust the batch size using the results of the last batch
+
+        Parameters
+        ----------
+        count : `int`
+            number of entries in the batch
+        latency : `float`
+            time in seconds it took to ingest the batch
+        failures : `int`
+            number of entries in the batch which failed to ingest
+
+        Returns
+        -------
+        size : `int`
+            the new batch size
+        """
+        previous = self.size
+        failure_rate = failures / count if count else 0.0
+        if latency > self.target_latency or failure_rate > FAILURE_THRESHOLD:
+            self.size = max(self.minimum, self.size // 2)
+        elif count >= self.size:
+            self.size = min(self.maximum, self.size + self.step)
+
+        level = logging.INFO if self.size != previous else logging.DEBUG
+        LOGGER.log(
+            level,
+            "batch size %d -> %d (count=%d latency=%.3fs target=%.3fs failure_rate=%.2f)",
+            previous,
+            self.size,
+            count,
+            latency,
+            self.target_latency,
+            failure_rate,
+        )
+        return self.size
@@ -26,17 +26,28 @@ from pydantic import BaseModel, Field, computed_field, model_validator
 
 
 class _TopicModel(BaseModel):
-    rucio_prefix: str
+    rucio_prefix: str | list[str]
     fs_prefix: str = ""
+    concurrency: int = Field(default=1, ge=1)
 
     @model_validator(mode="after")
     def process_strings(self) -> "_TopicModel":
-        if not self.rucio_prefix.endswith("/"):
+        if isinstance(self.rucio_prefix, list):
+            if not self.rucio_prefix:
+                raise ValueError("rucio_prefix list is empty")
+            self.rucio_prefix = [p if p.endswith("/") else p + "/" for p in self.rucio_prefix]
+        elif not self.rucio_prefix.endswith("/"):
             self.rucio_prefix += "/"
         if self.fs_prefix and not self.fs_prefix.endswith("/"):
             self.fs_prefix += "/"
         return self
 
+    @computed_field
+    def rucio_prefixes(self) -> list[str]:
+        if isinstance(self.rucio_prefix, list):
+            return list(self.rucio_prefix)
+        return [self.rucio_prefix]
+
 
 class Config(BaseModel):
     brokers: list[str]
@@ -44,7 +55,44 @@ class Config(BaseModel):
     group_id: str
     num_messages: int = 50
     timeout: int = 1
+    batch_size: int | None = Field(default=None, ge=1)
+    batch_bytes: int = Field(default=0, ge=0)
+    linger: float = Field(default=0.0, ge=0.0)
+    adaptive_batching: bool = False
+    min_num_messages: int = Field(default=1, ge=1)
+    target_latency: float = Field(default=5.0, gt=0.0)
+    pipelined: bool = False
+    pipeline_depth: int = Field(default=2, ge=1)
+    backpressure_high_messages: int = Field(default=0, ge=0)
+    backpressure_low_messages: int | None = Field(default=None, ge=0)
+    backpressure_high_bytes: int = Field(default=0, ge=0)
+    backpressure_low_bytes: int | None = Field(default=None, ge=0)
+    enable_auto_commit: bool = True
+    commit_interval: float = Field(default=5.0, gt=0.0)
+    commit_messages: int = Field(default=1000, ge=1)
     butler_repo: str
+    zip_workers: int = Field(default=1, ge=1)
+    merge_dim_files: bool = False
+    raw_processes: int = Field(default=1, ge=1)
+    ingest_group_size: int = Field(default=500, ge=1)
+    metrics_port: int | None = None
+    profile_dir: str | None = None
+    profile_every: int = Field(default=100, ge=1)
+    profile_window: float = Field(default=0.0, ge=0.0)
+    ingested_index: str | None = None
+    ingested_index_capacity: int = Field(default=1_000_000, ge=1)
+    retry_spool_dir: str | None = None
+    retry_base_delay: float = Field(default=30.0, gt=0.0)
+    retry_max_delay: float = Field(default=3600.0, gt=0.0)
+    retry_max_attempts: int = Field(default=10, ge=1)
+    preflight: bool = False
+    preflight_workers: int = Field(default=16, ge=1)
+    preflight_delay: float = Field(default=5.0, gt=0.0)
+    preflight_max_attempts: int = Field(default=12, ge=1)
+    preflight_timeout: float = Field(default=10.0, gt=0.0)
+    lanes: bool = False
+    workers: int = Field(default=1, ge=1)
+    stats_interval: float = Field(default=10.0, gt=0.0)
     topics: dict[str, _TopicModel] = Field(min_length=1)
 
     @classmethod
@@ -58,6 +106,32 @@ class Config(BaseModel):
         except Exception as e:
             raise RuntimeError(f"Unexpected error loading {config_file}: {e}") from e
 
+    @model_validator(mode="after")
+    def default_batch_size(self) -> "Config":
+        if self.batch_size is None:
+            self.batch_size = self.num_messages
+        if self.min_num_messages > self.batch_size:
+            raise ValueError(f"min_num_messages ({self.min_num_messages}) > batch_size ({self.batch_size})")
+        return self
+
+    @model_validator(mode="after")
+    def default_backpressure_low(self) -> "Config":
+        if self.backpressure_low_messages is None:
+            self.backpressure_low_messages = self.backpressure_high_messages // 2
+        if self.backpressure_low_bytes is None:
+            self.backpressure_low_bytes = self.backpressure_high_bytes // 2
+        if self.backpressure_low_messages > self.backpressure_high_messages:
+            raise ValueError(
+                f"backpressure_low_messages ({self.backpressure_low_messages}) > "
+                f"backpressure_high_messages ({self.backpressure_high_messages})"
+            )
+        if self.backpressure_low_bytes > self.backpressure_high_bytes:
+            raise ValueError(
+                f"backpressure_low_bytes ({self.backpressure_low_bytes}) > "
+                f"backpressure_high_bytes ({self.backpressure_high_bytes})"
+            )
+        return self
+
     @computed_field
     def brokers_as_string(self) -> str:
         return ",".join(self.brokers)
@@ -40,24 +40,27 @@ class DataFile(Entry):
         Message representing data to ingest
     mapper : `lsst.ctrl.ingestd.mapper.Mapper`
         Mapping of RSE entry to Butler repo location
+    ref_resolver : `DatasetRefResolver`, optional
+        shared resolver used to build the DatasetRef from the sidecar
     """
 
-    def __init__(self, butler, message, mapper):
+    def __init__(self, butler, message, mapper, ref_resolver=None):
         super().__init__(butler, message, mapper)
+        self.ref_resolver = ref_resolver
         self._populate()
 
     def _populate(self):
         self.data = self._create_file_dataset(self.file_to_ingest, self.sidecar)
 
-    def _create_file_dataset(self, butler_file: str, sidecar: dict) -> FileDataset:
+    def _create_file_dataset(self, butler_file: str, sidecar: str) -> FileDataset:
         """Create a FileDatset with sidecar information
 
         Parameters
         ----------
         butler_file : `str`
             full uri to butler file location
-        sidecar : `dict`
-            dictionary of the 'sidecar' metadata
+        sidecar : `str`
+            JSON representation of the 'sidecar' metadata
 
         Returns
         -------
@@ -65,7 +68,10 @@ class DataFile(Entry):
             FileDataset representing this DataProduct
         """
 
-        ref = DatasetRef.from_json(sidecar, registry=self.butler.registry)
+        if self.ref_resolver is not None:
+            ref = self.ref_resolver.resolve(sidecar)
+        else:
+            ref = DatasetRef.from_json(sidecar, registry=self.butler.registry)
         fds = FileDataset(butler_file, ref)
         return fds
 
@@ -0,0 +1,99 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import logging
+from collections import OrderedDict
+
+from lsst.daf.butler import DatasetRef, DatasetType, SerializedDatasetRef
+
+LOGGER = logging.getLogger(__name__)
+
+
+class DatasetRefResolver:
+    """Build DatasetRefs from 'sidecar' metadata, resolving the dimension
+    universe once and caching the dataset types that are built, so
+    messages for the same dataset type don't resolve it again.
+
+    Parameters
+    ----------
+    butler : `lsst.daf.butler.Butler`
+        Butler to resolve dataset types and the dimension universe with
+    cache_size : `int`, optional
+        maximum number of dataset types to cache; the least recently used
+        one is evicted when the cache is full
+    """
+
+    def __init__(self, butler, cache_size: int = 256):
+        self.butler = butler
+        self.cache_size = cache_size
+        self._universe = None
+        self._dataset_types: OrderedDict[str, DatasetType] = OrderedDict()
+
+    @property
+    def universe(self):
+        """The dimension universe of the butler"""
+        if self._universe is None:
+            self._universe = self.butler.dimensions
+        return self._universe
+
+    def resolve(self, sidecar: str) -> DatasetRef:
+        """Build a DatasetRef from 'sidecar' metadata
+
+        Parameters
+        ----------
+        sidecar : `str`
+            JSON representation of a DatasetRef
+
+        Returns
+        -------
+        ref : `lsst.daf.butler.DatasetRef`
+            the DatasetRef described by the sidecar
+        """
+        simple = SerializedDatasetRef.model_validate_json(sidecar)
+        dataset_type = None
+        if simple.datasetType is not None:
+            dataset_type = self._get_dataset_type(simple)
+        return DatasetRef.from_simple(simple, universe=self.universe, datasetType=dataset_type)
+
+    def _get_dataset_type(self, simple: SerializedDatasetRef) -> DatasetType:
+        """Return the dataset type of a serialized DatasetRef, from the
+        cache if it's there
+
+        Parameters
+        ----------
+        simple : `lsst.daf.butler.SerializedDatasetRef`
+            serialized DatasetRef
+        """
+        key = simple.datasetType.model_dump_json()
+        dataset_type = self._dataset_types.get(key)
+        if dataset_type is not None:
+            self._dataset_types.move_to_end(key)
+            return dataset_type
+
+        dataset_type = DatasetType.from_simple(
+            simple.datasetType, universe=self.universe, registry=self.butler.registry
+        )
+        self._dataset_types[key] = dataset_type
+        if len(self._dataset_types) > self.cache_size:
+            evicted, _ = self._dataset_types.popitem(last=False)
+            LOGGER.debug("evicted dataset type %s", evicted)
+        return dataset_type
@@ -19,12 +19,22 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import logging
+
 from lsst.ctrl.ingestd.entries.dataProduct import DataProduct
+from lsst.ctrl.ingestd.entries.datasetRefResolver import DatasetRefResolver
 from lsst.ctrl.ingestd.entries.dataType import DataType
 from lsst.ctrl.ingestd.entries.dimFile import DimFile
 from lsst.ctrl.ingestd.entries.entry import Entry
 from lsst.ctrl.ingestd.entries.rawFile import RawFile
 from lsst.ctrl.ingestd.entries.zipFile import ZipFile
+from lsst.daf.butler import ButlerUserError
+
+LOGGER = logging.getLogger(__name__)
+
+# errors caused by the content of a message; anything else, such as a
+# registry which can't be reached, isn't the message's fault
+MESSAGE_ERRORS = (ValueError, LookupError, TypeError, RuntimeError, ButlerUserError)
 
 
 class EntryFactory:
@@ -40,8 +50,24 @@ class EntryFactory:
 
     def __init__(self, rse_butler, mapper):
         self.rse_butler = rse_butler
-        self.butler = self.rse_butler.butler
         self.mapper = mapper
+        self._ref_resolver = None
+
+    @property
+    def butler(self):
+        """The Butler of rse_butler; not touched until the first entry is
+        created, so the Butler can be created on first use
+        """
+        return self.rse_butler.butler
+
+    @property
+    def ref_resolver(self) -> DatasetRefResolver:
+        """The DatasetRefResolver shared by the entries this factory
+        creates
+        """
+        if self._ref_resolver is None:
+            self._ref_resolver = DatasetRefResolver(self.butler)
+        return self._ref_resolver
 
     def create_entry(self, message) -> Entry:
         """Create an Entry object
@@ -59,11 +85,50 @@ class EntryFactory:
         data_type = message.get_rubin_butler()
 
         if data_type == DataType.DATA_PRODUCT:
-            return DataProduct(self.butler, message, self.mapper)
+            return DataProduct(self.butler, message, self.mapper, self.ref_resolver)
         if data_type == DataType.RAW_FILE:
-            return RawFile(self.butler, message, self.mapper)
+            return RawFile(self.butler, message, self.mapper, self.ref_resolver)
         if data_type == DataType.ZIP_FILE:
-            return ZipFile(self.butler, message, self.mapper)
+            return ZipFile(self.butler, message, self.mapper, self.ref_resolver)
         if data_type == DataType.DIM_FILE:
-            return DimFile(self.butler, message, self.mapper)
+            return DimFile(self.butler, message, self.mapper, self.ref_resolver)
         raise ValueError(f"Unknown rubin_butler type: {data_type}")
+
+    def create_entries(self, messages: list) -> tuple[list[Entry], list[tuple]]:
+        """Create Entry objects for a batch of messages
+
+        The messages share this factory's DatasetRefResolver, so the
+        dimension universe and each dataset type are only resolved once for
+        the whole batch.  A message which can't be turned into an Entry
+        because of its content is reported in the list of errors instead of
+        raising.  Other errors, such as those of a Butler whose registry
+        can't be reached, are raised, since the messages themselves may be
+        fine.
+
+        Parameters
+        ----------
+        messages : `list` [`lsst.ctrl.ingestd.message.Message`]
+            Objects representing Kafka messages
+
+        Returns
+        -------
+        entries : `list` [`Entry`]
+            Entries created
+        errors : `list` [`tuple`]
+            (message, exception) for each message which failed
+        """
+        entries = []
+        errors = []
+        if not messages:
+            return entries, errors
+        # create the Butler, if it hasn't been, before any message is
+        # looked at, so a Butler which can't be created isn't blamed on
+        # the messages
+        _ = self.ref_resolver.universe
+        for message in messages:
+            try:
+                entries.append(self.create_entry(message))
+            except MESSAGE_ERRORS as e:
+                LOGGER.info("couldn't create entry for %s: %s", message, e)
+                errors.append((message, e))
+        return entries, errors
@@ -37,7 +37,9 @@ class RawFile(DataFile):
         Message representing data to ingest
     mapper : `lsst.ctrl.ingestd.mapper.Mapper`
         Mapping of RSE entry to Butler repo location
+    ref_resolver : `DatasetRefResolver`, optional
+        shared resolver used to build the DatasetRef from the sidecar
     """
 
-    def __init__(self, butler, message, mapper):
-        super().__init__(butler, message, mapper)
+    def __init__(self, butler, message, mapper, ref_resolver=None):
+        super().__init__(butler, message, mapper, ref_resolver)
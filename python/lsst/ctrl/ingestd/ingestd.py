@@ -21,30 +21,84 @@
 
 import logging
 import os
+import queue
+import threading
+import time
 
-from confluent_kafka import Consumer
+from confluent_kafka import Consumer, TopicPartition
 
+from lsst.ctrl.ingestd.backpressure import Backpressure
+from lsst.ctrl.ingestd.batchController import BatchController
 from lsst.ctrl.ingestd.config import Config
 from lsst.ctrl.ingestd.entries.entryFactory import EntryFactory
+from lsst.ctrl.ingestd.ingestedIndex import IngestedIndex
 from lsst.ctrl.ingestd.mapper import Mapper
 from lsst.ctrl.ingestd.message import Message
+from lsst.ctrl.ingestd.metrics import Metrics
+from lsst.ctrl.ingestd.offsetTracker import OffsetTracker
+from lsst.ctrl.ingestd.preflight import Preflight
+from lsst.ctrl.ingestd.profiler import BatchProfiler
+from lsst.ctrl.ingestd.retrySpool import RetryScheduler, RetrySpool
 from lsst.ctrl.ingestd.rseButler import RseButler
 
 LOGGER = logging.getLogger(__name__)
 
 CTRL_INGESTD_CONFIG = "CTRL_INGESTD_CONFIG"
+CTRL_INGESTD_PROFILE_DIR = "CTRL_INGESTD_PROFILE_DIR"
+CTRL_INGESTD_MEASURE_STARTUP = "CTRL_INGESTD_MEASURE_STARTUP"
+
+# seconds between two checks of the stop event by the pipeline stages
+PIPELINE_POLL_INTERVAL = 0.1
+
+# fallback for the process start time, where /proc isn't available
+_IMPORT_TIME = time.time()
+
+
+def load_config() -> Config:
+    """Load the configuration from the file named by the
+    CTRL_INGESTD_CONFIG environment variable
+
+    Returns
+    -------
+    config : `lsst.ctrl.ingestd.config.Config`
+        the configuration
+    """
+    if CTRL_INGESTD_CONFIG not in os.environ:
+        raise FileNotFoundError("CTRL_INGESTD_CONFIG is not set")
+    return Config.load(os.environ[CTRL_INGESTD_CONFIG])
 
 
 class IngestD:
-    """Entry point for ingestd"""
+    """Entry point for ingestd
 
-    def __init__(self):
-        if CTRL_INGESTD_CONFIG in os.environ:
-            self.config_file = os.environ[CTRL_INGESTD_CONFIG]
-        else:
-            raise FileNotFoundError("CTRL_INGESTD_CONFIG is not set")
+    Parameters
+    ----------
+    config : `lsst.ctrl.ingestd.config.Config`, optional
+        configuration; if not given, it is loaded from the file named by
+        the CTRL_INGESTD_CONFIG environment variable
+    consumer : `confluent_kafka.Consumer`, optional
+        consumer to read messages from; if not given, a Kafka consumer is
+        created from the configuration and subscribed to its topics
+    metrics : `lsst.ctrl.ingestd.metrics.Metrics`, optional
+        metrics to record to, shared with other IngestD instances; if not
+        given, new metrics are created and served on metrics_port
+    name : `str`, optional
+        name of this instance, used in profile file names
+    ingested_index : `lsst.ctrl.ingestd.ingestedIndex.IngestedIndex`, optional
+        ingested index shared with other IngestD instances; if not given,
+        one is opened if ingested_index is set in the configuration
+    """
 
-        config = Config.load(self.config_file)
+    def __init__(
+        self,
+        config: Config | None = None,
+        consumer=None,
+        metrics: Metrics | None = None,
+        name: str = "ingestd",
+        ingested_index: IngestedIndex | None = None,
+    ):
+        if config is None:
+            config = load_config()
 
         topic_dict = config.topics
         client_id = config.client_id
@@ -54,61 +108,528 @@ class IngestD:
 
         self.num_messages = config.num_messages
         self.timeout = config.timeout
+        self.batch_size = config.batch_size
+        self.batch_bytes = config.batch_bytes
+        self.linger = config.linger
+        self.controller = None
+        if config.adaptive_batching:
+            self.controller = BatchController(
+                config.min_num_messages, config.batch_size, config.target_latency
+            )
+        self.pipelined = config.pipelined
+        self.pipeline_depth = config.pipeline_depth
 
         self.mapper = Mapper(topic_dict)
 
+        if metrics is None:
+            metrics = Metrics()
+            if config.metrics_port is not None:
+                metrics.start_server(config.metrics_port)
+        self.metrics = metrics
+
+        profile_dir = os.environ.get(CTRL_INGESTD_PROFILE_DIR, config.profile_dir)
+        self.profiler = None
+        if profile_dir:
+            self.profiler = BatchProfiler(profile_dir, config.profile_every, config.profile_window, name)
+
         conf = {
             "bootstrap.servers": brokers,
             "client.id": client_id,
             "group.id": group_id,
             "auto.offset.reset": "earliest",
-            "enable.auto.commit": True,
+            "enable.auto.commit": config.enable_auto_commit,
         }
 
-        self.consumer = Consumer(conf)
-        self.consumer.subscribe(topics)
+        subscribe = consumer is None
+        if consumer is None:
+            consumer = Consumer(conf)
+        self.consumer = consumer
+
+        # without auto commit, offsets are committed once their messages
+        # have been dealt with
+        self.offsets = None
+        if not config.enable_auto_commit:
+            self.offsets = OffsetTracker(consumer, config.commit_interval, config.commit_messages)
+        if subscribe:
+            if self.offsets is not None:
+                consumer.subscribe(topics, on_revoke=lambda _, partitions: self.offsets.revoke(partitions))
+            else:
+                consumer.subscribe(topics)
 
-        self.rse_butler = RseButler(config.butler_repo)
+        self.backpressure = None
+        if config.backpressure_high_messages > 0 or config.backpressure_high_bytes > 0:
+            self.backpressure = Backpressure(
+                consumer,
+                config.backpressure_high_messages,
+                config.backpressure_low_messages,
+                config.backpressure_high_bytes,
+                config.backpressure_low_bytes,
+                self.metrics,
+            )
+
+        # files which aren't complete yet are held back from the batches
+        self.preflight = None
+        if config.preflight:
+            self.preflight = Preflight(
+                config.preflight_workers,
+                config.preflight_delay,
+                config.preflight_max_attempts,
+                self.metrics,
+                timeout=config.preflight_timeout,
+            )
+
+        self.ingested_index = ingested_index
+        if self.ingested_index is None and config.ingested_index is not None:
+            self.ingested_index = IngestedIndex(config.ingested_index, config.ingested_index_capacity)
+
+        self.rse_butler = RseButler(
+            config.butler_repo,
+            zip_workers=config.zip_workers,
+            merge_dim_files=config.merge_dim_files,
+            metrics=self.metrics,
+            ingested_index=self.ingested_index,
+            raw_processes=config.raw_processes,
+            group_size=config.ingest_group_size,
+        )
         self.entry_factory = EntryFactory(self.rse_butler, self.mapper)
 
+        # failed files are retried from a spool by a background thread,
+        # which has a Butler of its own
+        self.retry_spool = None
+        if config.retry_spool_dir is not None:
+            self.retry_spool = RetrySpool(
+                os.path.join(config.retry_spool_dir, f"retry-{config.client_id}.sqlite3"),
+                config.retry_base_delay,
+                config.retry_max_delay,
+                config.retry_max_attempts,
+            )
+            retry_butler = RseButler(
+                config.butler_repo,
+                zip_workers=config.zip_workers,
+                merge_dim_files=config.merge_dim_files,
+                metrics=self.metrics,
+                ingested_index=self.ingested_index,
+                raw_processes=config.raw_processes,
+                group_size=config.ingest_group_size,
+            )
+            self.retry_scheduler = RetryScheduler(
+                self.retry_spool,
+                retry_butler,
+                EntryFactory(retry_butler, self.mapper),
+                config.batch_size,
+                self.metrics,
+            )
+            self.retry_scheduler.start()
+
         LOGGER.info("brokers = %s", config.brokers_as_string)
         LOGGER.info("client.id = %s", config.client_id)
         LOGGER.info("group.id = %s", config.group_id)
         LOGGER.info("num_messages = %d", config.num_messages)
         LOGGER.info("timeout = %d", config.timeout)
+        if config.linger > 0:
+            LOGGER.info("batch_size = %d", config.batch_size)
+            LOGGER.info("batch_bytes = %d", config.batch_bytes)
+            LOGGER.info("linger = %s", config.linger)
+        LOGGER.info("adaptive_batching = %s", config.adaptive_batching)
+        if config.adaptive_batching:
+            LOGGER.info("min_num_messages = %d", config.min_num_messages)
+            LOGGER.info("target_latency = %s", config.target_latency)
+        LOGGER.info("pipelined = %s", config.pipelined)
+        if config.pipelined:
+            LOGGER.info("pipeline_depth = %d", config.pipeline_depth)
+        if self.backpressure is not None:
+            LOGGER.info("backpressure_high_messages = %d", config.backpressure_high_messages)
+            LOGGER.info("backpressure_low_messages = %d", config.backpressure_low_messages)
+            LOGGER.info("backpressure_high_bytes = %d", config.backpressure_high_bytes)
+            LOGGER.info("backpressure_low_bytes = %d", config.backpressure_low_bytes)
+        LOGGER.info("enable_auto_commit = %s", config.enable_auto_commit)
+        if not config.enable_auto_commit:
+            LOGGER.info("commit_interval = %s", config.commit_interval)
+            LOGGER.info("commit_messages = %d", config.commit_messages)
         LOGGER.info("butler_repo= %s", config.butler_repo)
+        LOGGER.info("zip_workers = %d", config.zip_workers)
+        LOGGER.info("merge_dim_files = %s", config.merge_dim_files)
+        LOGGER.info("raw_processes = %d", config.raw_processes)
+        LOGGER.info("ingest_group_size = %d", config.ingest_group_size)
         LOGGER.info("topics = %s", ",".join(config.topics.keys()))
+        if config.metrics_port is not None:
+            LOGGER.info("metrics_port = %d", config.metrics_port)
+        LOGGER.info("preflight = %s", config.preflight)
+        if config.preflight:
+            LOGGER.info("preflight_workers = %d", config.preflight_workers)
+            LOGGER.info("preflight_delay = %s", config.preflight_delay)
+            LOGGER.info("preflight_max_attempts = %d", config.preflight_max_attempts)
+            LOGGER.info("preflight_timeout = %s", config.preflight_timeout)
+        if config.ingested_index is not None:
+            LOGGER.info("ingested_index = %s", config.ingested_index)
+            LOGGER.info("ingested_index_capacity = %d", config.ingested_index_capacity)
+        if config.retry_spool_dir is not None:
+            LOGGER.info("retry_spool = %s", self.retry_spool.filename)
+            LOGGER.info("retry_base_delay = %s", config.retry_base_delay)
+            LOGGER.info("retry_max_delay = %s", config.retry_max_delay)
+            LOGGER.info("retry_max_attempts = %d", config.retry_max_attempts)
+        if profile_dir:
+            LOGGER.info("profile_dir = %s", profile_dir)
+            LOGGER.info("profile_every = %d", config.profile_every)
+            LOGGER.info("profile_window = %s", config.profile_window)
 
     def run(self):
-        """continually process messages"""
+        """continually process messages
+
+        If the CTRL_INGESTD_MEASURE_STARTUP environment variable is set,
+        return as soon as the first message would be read instead, having
+        logged the time since the process started.
+        """
+        LOGGER.info("ready to consume %.2f seconds after process start", process_uptime())
+        if os.environ.get(CTRL_INGESTD_MEASURE_STARTUP):
+            return
+        if self.pipelined:
+            self.run_pipelined()
+            return
         while True:
             self.process()
 
+    def run_pipelined(self):
+        """continually process messages, fetching the next set of messages
+        while the current set is being ingested.
+
+        Messages are read and turned into entries by a background thread,
+        which hands them to this thread through a bounded queue of
+        ``pipeline_depth`` batches.  If the queue is full, the fetch thread
+        blocks until the ingest stage catches up.
+
+        If ingesting fails, the fetch thread is stopped before the
+        exception is raised, and the consumer is rewound to the first
+        message of the batch being ingested and of the batches fetched
+        after it, so they are read again when processing resumes.
+        """
+        batches = queue.Queue(maxsize=self.pipeline_depth)
+        stop = threading.Event()
+        fetcher = threading.Thread(target=self._fetch_loop, args=(batches, stop), name="fetch", daemon=True)
+        fetcher.start()
+
+        # the batch being ingested; kept until its ingest has returned
+        in_flight = []
+        try:
+            while True:
+                entries = batches.get()
+                # the fetch thread hands back any exception that stopped it
+                if isinstance(entries, BaseException):
+                    raise RuntimeError("fetch thread stopped") from entries
+                in_flight = entries
+                # only the ingest stage is profiled in pipelined mode
+                if self.profiler is not None:
+                    self.profiler.begin()
+                self.ingest(entries)
+                in_flight = []
+                if self.profiler is not None:
+                    self.profiler.end(entries)
+        finally:
+            stop.set()
+            queued = []
+            # keep the queue drained until the fetch thread has stopped, so
+            # it isn't left blocked on a full queue
+            while fetcher.is_alive() or not batches.empty():
+                try:
+                    entries = batches.get(timeout=PIPELINE_POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                if not isinstance(entries, BaseException):
+                    queued.extend(entries)
+            fetcher.join()
+            # ingest has released the batch in flight from backpressure
+            if self.backpressure is not None and queued:
+                self.backpressure.remove(len(queued), sum(entry.message.size for entry in queued))
+            self._rewind(in_flight + queued)
+
+    def _fetch_loop(self, batches: queue.Queue, stop: threading.Event):
+        """Fetch stage of the pipeline; runs in its own thread until stop
+        is set
+
+        Parameters
+        ----------
+        batches : `queue.Queue`
+            queue to put lists of entries on
+        stop : `threading.Event`
+            event set to stop the thread
+        """
+        try:
+            while not stop.is_set():
+                entries = self.fetch()
+                if len(entries) > 0:
+                    self._put(batches, entries, stop)
+        except BaseException as e:
+            LOGGER.exception("fetch thread failed")
+            self._put(batches, e, stop)
+
+    def _put(self, batches: queue.Queue, item, stop: threading.Event):
+        """Put an item on the pipeline queue, waiting for room unless stop
+        is set
+
+        Parameters
+        ----------
+        batches : `queue.Queue`
+            queue to put the item on
+        item : `list` or `BaseException`
+            entries, or the exception which stopped the fetch thread
+        stop : `threading.Event`
+            event set to stop the fetch thread
+        """
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=PIPELINE_POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+        # the ingest stage has stopped, and drains the queue itself
+        if isinstance(item, list):
+            batches.put(item)
+
+    def rewind_uncommitted(self):
+        """Rewind the consumer to the first message of each of its
+        partitions which hasn't been dealt with, before running again
+        after run() raised, so no message fetched before the failure is
+        skipped.  Entries held back by preflight checks are dropped, since
+        their messages are read again.
+
+        With auto commit, messages aren't tracked; the batches which
+        weren't ingested have been rewound as run() stopped.
+        """
+        if self.offsets is None:
+            return
+        if self.preflight is not None:
+            held_back = self.preflight.clear()
+            if self.backpressure is not None and held_back:
+                self.backpressure.remove(len(held_back), sum(entry.message.size for entry in held_back))
+        self._seek(self.offsets.positions())
+
+    def _rewind(self, entries: list):
+        """Rewind the consumer to the first message of each partition among
+        entries which were fetched but weren't ingested, so they are read
+        again.  Without auto commit, their offsets stay pending, so they
+        aren't committed in the meantime.
+
+        Parameters
+        ----------
+        entries : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            entries which weren't ingested
+        """
+        first = {}
+        for entry in entries:
+            topic, partition, offset = _offset(entry.message)
+            if topic is None or partition is None or offset is None:
+                continue
+            key = (topic, partition)
+            first[key] = min(first.get(key, offset), offset)
+        self._seek(first)
+
+    def _seek(self, positions: dict):
+        """Move the consumer to the given offsets
+
+        Parameters
+        ----------
+        positions : `dict` [`tuple`, `int`]
+            offset to read next for each (topic, partition)
+        """
+        for (topic, partition), offset in positions.items():
+            LOGGER.info("rewinding %s [%d] to offset %d", topic, partition, offset)
+            try:
+                self.consumer.seek(TopicPartition(topic, partition, offset))
+            except Exception as e:
+                LOGGER.warning("couldn't rewind %s [%d] to offset %d: %s", topic, partition, offset, e)
+
     def process(self):
         """process one set of messages"""
+        if self.profiler is not None:
+            self.profiler.begin()
+        entries = self.fetch()
+        # if we've got anything in the list, try and ingest it.
+        if len(entries) > 0:
+            try:
+                self.ingest(entries)
+            except BaseException:
+                self._rewind(entries)
+                raise
+        if self.profiler is not None:
+            self.profiler.end(entries)
+
+    def ingest(self, entries: list):
+        """ingest a list of entries, feeding the time it took and the
+        number of failures to the batch size controller, if there is one;
+        the messages of entries which failed are put in the retry spool,
+        if there is one.  The entries are no longer counted as pending by
+        the backpressure control.  Without auto commit, the offsets of the
+        messages of entries which were ingested, or put in the retry spool,
+        can be committed; without a retry spool, those of failed entries
+        stay pending, so the messages are read again after a restart.
+
+        Parameters
+        ----------
+        entries : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            entries to ingest
+        """
+        start = time.monotonic()
+        try:
+            failed = self.rse_butler.ingest(entries)
+        finally:
+            # the entries are no longer pending, even if ingest failed
+            if self.backpressure is not None:
+                self.backpressure.remove(len(entries), sum(entry.message.size for entry in entries))
+        latency = time.monotonic() - start
+        self.metrics.ingest_seconds.observe(latency)
+        if self.controller is not None:
+            self.controller.update(len(entries), latency, len(failed))
+        if self.offsets is not None:
+            failed_ids = {id(entry) for entry in failed}
+            self.offsets.done([_offset(entry.message) for entry in entries if id(entry) not in failed_ids])
+        if self.retry_spool is not None and failed:
+            self.retry_spool.add([entry.message for entry in failed])
+            for entry in failed:
+                self.metrics.retries_spooled.inc(topic=entry.message.topic)
+            # the failed messages are safe in the spool
+            if self.offsets is not None:
+                self.offsets.done([_offset(entry.message) for entry in failed])
+
+    def consume(self) -> list:
+        """read one batch of messages from Kafka, recording the time it
+        took; see _consume
+
+        Returns
+        -------
+        msgs : `list` [`confluent_kafka.Message`]
+            messages read; may be empty
+        """
+        with self.metrics.consume_seconds.time():
+            return self._consume()
+
+    def _consume(self) -> list:
+        """read one batch of messages from Kafka
+
+        Up to num_messages are read, with a timeout of timeout.  If linger
+        is set, reading continues after the first messages arrive until
+        batch_size messages or batch_bytes bytes have been read, or until
+        linger seconds have gone by, whichever comes first.  With adaptive
+        batching, the batch size controller's current size caps both
+        num_messages and batch_size.
+
+        Returns
+        -------
+        msgs : `list` [`confluent_kafka.Message`]
+            messages read; may be empty
+        """
+        if self.backpressure is not None:
+            self.backpressure.before_consume()
+        num_messages = self.num_messages
+        batch_size = self.batch_size
+        if self.controller is not None:
+            num_messages = min(num_messages, self.controller.size)
+            batch_size = self.controller.size
+
+        msgs = self.consumer.consume(num_messages=num_messages, timeout=self.timeout)
+        if not msgs or self.linger <= 0:
+            return msgs or []
 
-        # read up to self.num_messages, with a timeout of self.timeout
-        msgs = self.consumer.consume(num_messages=self.num_messages, timeout=self.timeout)
+        deadline = time.monotonic() + self.linger
+        msgs = list(msgs)
+        nbytes = sum(_message_size(msg) for msg in msgs)
+        while len(msgs) < batch_size and (self.batch_bytes == 0 or nbytes < self.batch_bytes):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            count = min(num_messages, batch_size - len(msgs))
+            more = self.consumer.consume(num_messages=count, timeout=remaining)
+            if more:
+                msgs.extend(more)
+                nbytes += sum(_message_size(msg) for msg in more)
+        LOGGER.debug("accumulated %d messages, %d bytes", len(msgs), nbytes)
+        return msgs
+
+    def fetch(self) -> list:
+        """read one set of messages and turn them into entries, which are
+        counted as pending by the backpressure control until they have
+        been passed to ingest.  With the pre-flight check, entries whose
+        files aren't complete are held back, and held back entries whose
+        files have become complete are returned with a later set.
+
+        Returns
+        -------
+        entries : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            entries created from the messages; may be empty
+        """
+
+        # offsets are committed from this thread, which polls the consumer
+        if self.offsets is not None:
+            self.offsets.maybe_commit()
+
+        msgs = self.consume()
         # just return if there are no messages
-        if msgs is None:
-            return
+        if not msgs:
+            return self.preflight.check([]) if self.preflight is not None else []
+        if self.offsets is not None:
+            self.offsets.track(msgs)
 
         # cycle through all the messages, rewriting the Rucio URL
         # so the files can be directly ingested in their actual location,
         # and put the into a list
-        entries = []
+        start = time.monotonic()
+        messages = []
+        # messages which can't be used are dealt with right away
+        unusable = []
         for msg in msgs:
             try:
                 message = Message(msg)
             except Exception as e:
                 logging.info(msg.value())
                 logging.info(e)
+                self.metrics.message_errors.inc(topic=msg.topic())
+                unusable.append((msg.topic(), msg.partition(), msg.offset()))
                 continue
-            entry = self.entry_factory.create_entry(message)
-            entries.append(entry)
-        # if we've got anything in the list, try and ingest it.
-        if len(entries) > 0:
-            self.rse_butler.ingest(entries)
+            messages.append(message)
+            self.metrics.messages_consumed.inc(topic=message.topic)
+        entries, errors = self.entry_factory.create_entries(messages)
+        self.metrics.entry_creation_seconds.observe(time.monotonic() - start)
+
+        for message, _ in errors:
+            self.metrics.message_errors.inc(topic=message.topic)
+            unusable.append(_offset(message))
+        if self.offsets is not None:
+            self.offsets.done(unusable)
+        for entry in entries:
+            self.metrics.entries_created.inc(topic=entry.message.topic, data_type=entry.get_data_type())
+        if self.backpressure is not None:
+            self.backpressure.add(len(entries), sum(entry.message.size for entry in entries))
+        if self.preflight is not None:
+            entries = self.preflight.check(entries)
+        return entries
+
+
+def process_uptime() -> float:
+    """Return the number of seconds since this process started
+
+    The start time is read from /proc; where that isn't available, the
+    time this module was imported is used instead.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # the command name can hold spaces, so split after it
+            fields = f.read().rpartition(")")[2].split()
+        with open("/proc/uptime") as f:
+            system_uptime = float(f.read().split()[0])
+        # starttime is the 22nd field, counting the pid and command name
+        return system_uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.time() - _IMPORT_TIME
+
+
+def _offset(message: Message) -> tuple:
+    """Return the topic, partition and offset of a message"""
+    return (message.topic, message.partition, message.offset)
+
+
+def _message_size(msg) -> int:
+    """Return the size in bytes of a Kafka message's value"""
+    value = msg.value()
+    return len(value) if value is not None else 0
 
 
 if __name__ == "__main__":
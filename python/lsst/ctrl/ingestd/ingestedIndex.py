@@ -0,0 +1,176 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+
+LOGGER = logging.getLogger(__name__)
+
+# maximum number of keys looked up in a single query
+QUERY_CHUNK_SIZE = 500
+
+
+class BloomFilter:
+    """Set membership test which may give false positives, but never false
+    negatives
+
+    Parameters
+    ----------
+    capacity : `int`
+        number of keys the filter is sized for
+    false_positive_rate : `float`, optional
+        rate of false positives once ``capacity`` keys have been added
+    """
+
+    def __init__(self, capacity: int, false_positive_rate: float = 0.01):
+        self.size = max(8, int(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (first + i * second) % self.size
+
+    def add(self, key: str):
+        """Add a key to the filter"""
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class IngestedIndex:
+    """Local index of the keys (dataset ids or file paths) of files which
+    have been ingested, kept in a SQLite database
+
+    The keys are also added to an in-memory bloom filter, so keys which
+    have never been ingested, usually most of them, are ruled out without a
+    database query.  Keys the filter lets through are checked against the
+    database.
+
+    Several processes, such as supervisor workers, can share the database
+    file.  Before each lookup, the keys other processes have added since
+    the previous lookup are added to the bloom filter, so they aren't
+    ruled out.  Within a process, the threads using the same database
+    should share one IngestedIndex.
+
+    Parameters
+    ----------
+    filename : `str`
+        name of the SQLite database file; created if it doesn't exist
+    capacity : `int`, optional
+        number of keys the bloom filter is sized for; more keys can be
+        added, but more of them then need a database query
+    """
+
+    def __init__(self, filename: str, capacity: int = 1_000_000):
+        self.filename = filename
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        self._bloom = BloomFilter(capacity)
+        # rowid of the last key added to the bloom filter from the database
+        self._last_rowid = 0
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            # rowids only grow, which is how keys added by other processes
+            # are found
+            self._connection.execute("CREATE TABLE IF NOT EXISTS ingested (key TEXT PRIMARY KEY)")
+            count = self._refresh()
+        LOGGER.info("loaded %d keys from %s", count, filename)
+
+    def _refresh(self) -> int:
+        """Add the keys added to the database since the last refresh to the
+        bloom filter; call with the lock held
+
+        Returns
+        -------
+        count : `int`
+            number of keys added
+        """
+        count = 0
+        rows = self._connection.execute(
+            "SELECT rowid, key FROM ingested WHERE rowid > ? ORDER BY rowid", (self._last_rowid,)
+        )
+        for rowid, key in rows:
+            self._bloom.add(key)
+            self._last_rowid = rowid
+            count += 1
+        return count
+
+    def add(self, keys: list[str]):
+        """Record keys as ingested
+
+        Parameters
+        ----------
+        keys : `list` [`str`]
+            keys to add
+        """
+        if not keys:
+            return
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO ingested (key) VALUES (?)", [(k,) for k in keys]
+            )
+            for key in keys:
+                self._bloom.add(key)
+
+    def known(self, keys: list[str]) -> set[str]:
+        """Return the keys which have been recorded as ingested
+
+        Parameters
+        ----------
+        keys : `list` [`str`]
+            keys to look up
+
+        Returns
+        -------
+        known : `set` [`str`]
+            keys among ``keys`` which are in the index
+        """
+        with self._lock:
+            self._refresh()
+            candidates = list({key for key in keys if key in self._bloom})
+            known = set()
+            for i in range(0, len(candidates), QUERY_CHUNK_SIZE):
+                chunk = candidates[i : i + QUERY_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT key FROM ingested WHERE key IN ({placeholders})", chunk
+                )
+                known.update(key for (key,) in rows)
+        return known
+
+    def close(self):
+        """Close the index's database connection"""
+        with self._lock:
+            self._connection.close()
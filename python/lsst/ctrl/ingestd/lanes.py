@@ -0,0 +1,126 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import logging
+import os
+import threading
+import time
+
+from lsst.ctrl.ingestd.config import Config
+from lsst.ctrl.ingestd.ingestd import CTRL_INGESTD_MEASURE_STARTUP, IngestD, process_uptime
+from lsst.ctrl.ingestd.ingestedIndex import IngestedIndex
+from lsst.ctrl.ingestd.metrics import Metrics
+
+LOGGER = logging.getLogger(__name__)
+
+# seconds to wait before restarting a lane which stopped with an exception
+LANE_RESTART_DELAY = 5.0
+
+
+class Lanes:
+    """Ingests each topic in its own lane, so a slow or stuck RSE doesn't
+    hold up the others
+
+    Each topic gets as many lanes as its ``concurrency`` setting.  A lane
+    is an IngestD with its own Kafka
+    consumer, subscribed to that topic alone in the shared consumer group,
+    its own batching and its own Butler, running in its own thread.  The
+    lanes of a topic share its partitions.  All the lanes record to the
+    same metrics, and share the same ingested index, so a lane finds the
+    files other lanes ingested after a rebalance.
+
+    Parameters
+    ----------
+    config : `lsst.ctrl.ingestd.config.Config`
+        configuration
+    """
+
+    def __init__(self, config: Config):
+        self.metrics = Metrics()
+        if config.metrics_port is not None:
+            self.metrics.start_server(config.metrics_port)
+        self.ingested_index = None
+        if config.ingested_index is not None:
+            self.ingested_index = IngestedIndex(config.ingested_index, config.ingested_index_capacity)
+
+        self.lanes: dict[str, IngestD] = {}
+        for topic, topic_model in config.topics.items():
+            for index in range(topic_model.concurrency):
+                name = f"{topic}-{index}"
+                lane_config = config.model_copy(
+                    update={
+                        "client_id": f"{config.client_id}-{name}",
+                        "topics": {topic: topic_model},
+                        "metrics_port": None,
+                        "lanes": False,
+                    }
+                )
+                LOGGER.info("creating lane %s", name)
+                self.lanes[name] = IngestD(
+                    lane_config,
+                    metrics=self.metrics,
+                    name=f"ingestd-{name}",
+                    ingested_index=self.ingested_index,
+                )
+
+    def run(self):
+        """run all the lanes, each in its own thread
+
+        If the CTRL_INGESTD_MEASURE_STARTUP environment variable is set,
+        return once every lane is ready to consume, having logged the time
+        since the process started.
+        """
+        threads = []
+        for name, ingestd in self.lanes.items():
+            thread = threading.Thread(target=self._run_lane, args=(name, ingestd), name=name, daemon=True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        if os.environ.get(CTRL_INGESTD_MEASURE_STARTUP):
+            LOGGER.info(
+                "all %d lanes ready to consume %.2f seconds after process start",
+                len(self.lanes),
+                process_uptime(),
+            )
+
+    def _run_lane(self, name: str, ingestd: IngestD):
+        """Run one lane, restarting it if it stops with an exception; the
+        lane's consumer is first rewound to the messages it hadn't dealt
+        with.  Returns if the lane returns, which it only does when
+        measuring startup.
+
+        Parameters
+        ----------
+        name : `str`
+            name of the lane
+        ingestd : `lsst.ctrl.ingestd.ingestd.IngestD`
+            the lane
+        """
+        while True:
+            try:
+                ingestd.run()
+                return
+            except Exception:
+                LOGGER.exception("lane %s failed; restarting in %s seconds", name, LANE_RESTART_DELAY)
+                ingestd.rewind_uncommitted()
+                time.sleep(LANE_RESTART_DELAY)
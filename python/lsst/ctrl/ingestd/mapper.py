@@ -19,6 +19,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import functools
 import logging
 
 LOGGER = logging.getLogger(__name__)
@@ -31,14 +32,34 @@ class Mapper:
     ----------
     topic_dict : `dict`
         topic prefix to physical location prefix dictionary
+    cache_size : `int`, optional
+        number of rewritten directory prefixes to cache; 0 turns off caching
     """
 
-    def __init__(self, topic_dict: dict):
+    def __init__(self, topic_dict: dict, cache_size: int = 4096):
         self._topic_dict = topic_dict
 
+        # for each topic, the (rucio_prefix, fs_prefix) pairs, longest
+        # rucio_prefix first, so the first prefix which matches is the
+        # longest match
+        self._index: dict[str, list[tuple[str, str]]] = {}
+        for topic, topic_entry in topic_dict.items():
+            prefixes = [(prefix, topic_entry.fs_prefix) for prefix in topic_entry.rucio_prefixes]
+            prefixes.sort(key=lambda pair: len(pair[0]), reverse=True)
+            self._index[topic] = prefixes
+
+        if cache_size > 0:
+            self._rewrite_directory = functools.lru_cache(maxsize=cache_size)(self._rewrite_prefix)
+        else:
+            self._rewrite_directory = self._rewrite_prefix
+
     def rewrite(self, topic: str, url: str) -> str:
         """Rewrite a Rucio URL using topic mapping
 
+        The longest rucio_prefix of the topic which the URL starts with is
+        replaced by the topic's fs_prefix.  A URL which doesn't start with
+        any of the topic's rucio_prefixes is returned unchanged.
+
         Parameters
         ----------
         topic : `str`
@@ -46,12 +67,26 @@ class Mapper:
         url : `str`
             Rucio URL to translate
         """
-        topic_entry = self._topic_dict.get(topic, None)
-        if not topic_entry:
-            raise Exception(f"couldn't find {topic_entry} in topics list")
+        if topic not in self._index:
+            raise ValueError(f"couldn't find {topic} in topics list")
 
-        rucio_prefix = topic_entry.rucio_prefix
-        fs_prefix = topic_entry.fs_prefix
+        # rucio prefixes always end with "/", so only the directory part
+        # of the URL needs to be matched; rewritten directories are cached
+        directory, separator, name = url.rpartition("/")
+        return self._rewrite_directory(topic, directory + separator) + name
 
-        ret = url.replace(rucio_prefix, fs_prefix)
-        return ret
+    def _rewrite_prefix(self, topic: str, url: str) -> str:
+        """Replace the longest rucio_prefix of a topic which a URL starts
+        with by the topic's fs_prefix
+
+        Parameters
+        ----------
+        topic : `str`
+            Kakfa topic name
+        url : `str`
+            Rucio URL, or the directory part of one, to translate
+        """
+        for rucio_prefix, fs_prefix in self._index[topic]:
+            if url.startswith(rucio_prefix):
+                return fs_prefix + url[len(rucio_prefix) :]
+        return url
@@ -22,7 +22,16 @@
 import json
 import logging
 
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
 LOGGER = logging.getLogger(__name__)
+BYTES_KEY = "bytes"
+FILE_SIZE_KEY = "file-size"
 RSE_KEY = "dst-rse"
 URL_KEY = "dst-url"
 RUBIN_BUTLER = "rubin_butler"
@@ -33,40 +42,118 @@ SCOPE = "scope"
 class Message:
     """Kafka Message representation
 
+    Only the payload fields used by ingestd are kept; the rest of the
+    decoded message and the Kafka message itself are dropped.  The
+    'sidecar' metadata is kept as the undecoded JSON string.  If orjson is
+    installed, it is used to decode the message.
+
     Parameters
     ----------
-    kafka_message : `str`
+    kafka_message : `confluent_kafka.Message`
         kafka message
     """
 
+    __slots__ = (
+        "dst_rse",
+        "dst_url",
+        "file_size",
+        "offset",
+        "partition",
+        "rubin_butler",
+        "rubin_sidecar",
+        "scope",
+        "size",
+        "topic",
+    )
+
     def __init__(self, kafka_message):
-        self._message = kafka_message
-        value = self._message.value()
-        self.msg = json.loads(value)
-        self.payload = self.msg["payload"]
+        value = kafka_message.value()
+        payload = _loads(value)["payload"]
+        self.dst_rse = payload.get(RSE_KEY, None)
+        self.dst_url = payload.get(URL_KEY, None)
+        self.rubin_butler = payload.get(RUBIN_BUTLER, None)
+        self.rubin_sidecar = payload.get(RUBIN_SIDECAR, None)
+        self.scope = payload.get(SCOPE, None)
+        self.file_size = payload.get(BYTES_KEY, payload.get(FILE_SIZE_KEY, None))
+        self.size = len(value)
+        self.topic = _get_attribute(kafka_message, "topic")
+        self.partition = _get_attribute(kafka_message, "partition")
+        self.offset = _get_attribute(kafka_message, "offset")
+
+    @classmethod
+    def from_dict(cls, fields: dict) -> "Message":
+        """Create a Message from the fields returned by to_dict
+
+        Parameters
+        ----------
+        fields : `dict`
+            values of the message's fields
+
+        Returns
+        -------
+        message : `Message`
+            the message
+        """
+        message = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(message, name, fields.get(name, None))
+        return message
+
+    def to_dict(self) -> dict:
+        """Return the values of the message's fields, which can be
+        serialized as JSON
+        """
+        return {name: getattr(self, name) for name in self.__slots__}
 
     def get_dst_rse(self) -> str:
         """Getter to retrieve the destination RSE"""
-        return self.payload.get(RSE_KEY, None)
+        return self.dst_rse
 
     def get_dst_url(self) -> str:
         """Getter to retrieve the destination URL"""
-        return self.payload.get(URL_KEY, None)
+        return self.dst_url
 
     def set_dst_url(self, s: str):
-        self.payload[URL_KEY] = s
+        self.dst_url = s
 
     def get_rubin_butler(self) -> int:
         """Getter to retrieve the flag indicating this is a Butler file"""
-        return self.payload.get(RUBIN_BUTLER, None)
+        return self.rubin_butler
 
     def get_rubin_sidecar(self) -> str:
         """Getter to retrieve the 'sidecar' metadata as a string"""
-        return self.payload.get(RUBIN_SIDECAR, None)
+        return self.rubin_sidecar
+
+    def get_file_size(self) -> int | None:
+        """Getter to retrieve the size of the transferred file in bytes, if
+        the message gives it
+        """
+        return self.file_size
 
     def get_scope(self) -> str:
         """Getter to retrieve the 'scope' metadata as a string"""
-        return self.payload.get(SCOPE, None)
+        return self.scope
 
     def __str__(self) -> str:
-        return f"{self._message}"
+        return (
+            f"Message(topic={self.topic}, partition={self.partition}, offset={self.offset}, "
+            f"{RSE_KEY}={self.dst_rse}, {SCOPE}={self.scope}, {URL_KEY}={self.dst_url}, "
+            f"{RUBIN_BUTLER}={self.rubin_butler})"
+        )
+
+
+def _get_attribute(kafka_message, name: str):
+    """Return the value of a Kafka message accessor, or None if the
+    message doesn't have it
+
+    Parameters
+    ----------
+    kafka_message : `confluent_kafka.Message`
+        kafka message
+    name : `str`
+        name of the accessor method
+    """
+    accessor = getattr(kafka_message, name, None)
+    if accessor is None:
+        return None
+    return accessor()
@@ -0,0 +1,340 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import bisect
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LOGGER = logging.getLogger(__name__)
+
+# latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, math.inf)
+
+
+def _format_labels(labelnames: tuple, values: tuple) -> str:
+    if not labelnames:
+        return ""
+    labels = []
+    for name, value in zip(labelnames, values, strict=True):
+        value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        labels.append(f'{name}="{value}"')
+    return "{" + ",".join(labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonically increasing count, with optional labels
+
+    Parameters
+    ----------
+    name : `str`
+        metric name
+    documentation : `str`
+        help text
+    labelnames : `tuple` [`str`], optional
+        names of the labels of this metric
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        """Increase the count
+
+        Parameters
+        ----------
+        amount : `float`, optional
+            amount to increase the count by
+        **labels
+            label values
+        """
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        """Return the count for a set of label values"""
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def snapshot(self) -> dict:
+        """Return a copy of the counts, keyed by label values"""
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, snapshot: dict):
+        """Add the counts of a snapshot to this counter
+
+        Parameters
+        ----------
+        snapshot : `dict`
+            counts keyed by label values, as returned by snapshot
+        """
+        with self._lock:
+            for key, value in snapshot.items():
+                self._values[key] = self._values.get(key, 0.0) + value
+
+    def collect(self) -> list[str]:
+        """Return the lines of this metric in Prometheus text format"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Distribution of observed values, with optional labels
+
+    Parameters
+    ----------
+    name : `str`
+        metric name
+    documentation : `str`
+        help text
+    labelnames : `tuple` [`str`], optional
+        names of the labels of this metric
+    buckets : `tuple` [`float`], optional
+        upper bounds of the buckets, in increasing order, ending with inf
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # label values -> [bucket counts, sum]
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        """Record a value
+
+        Parameters
+        ----------
+        value : `float`
+            value to record
+        **labels
+            label values
+        """
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.setdefault(key, [[0] * len(self.buckets), 0.0])
+            counts[0][index] += 1
+            counts[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Context manager which records the time spent in its block"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def snapshot(self) -> dict:
+        """Return a copy of the bucket counts and sums, keyed by label
+        values
+        """
+        with self._lock:
+            return {key: [list(counts), total] for key, (counts, total) in self._values.items()}
+
+    def merge(self, snapshot: dict):
+        """Add the bucket counts and sums of a snapshot to this histogram
+
+        Parameters
+        ----------
+        snapshot : `dict`
+            bucket counts and sums keyed by label values, as returned by
+            snapshot
+        """
+        with self._lock:
+            for key, (counts, total) in snapshot.items():
+                values = self._values.setdefault(key, [[0] * len(self.buckets), 0.0])
+                for index, count in enumerate(counts):
+                    values[0][index] += count
+                values[1] += total
+
+    def collect(self) -> list[str]:
+        """Return the lines of this metric in Prometheus text format"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        labelnames = self.labelnames + ("le",)
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts, strict=True):
+                    cumulative += count
+                    labels = _format_labels(labelnames, key + (_format_value(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Metrics:
+    """Metrics collected by ingestd, which can be served over HTTP in
+    Prometheus text format
+    """
+
+    def __init__(self):
+        self.messages_consumed = Counter(
+            "ingestd_messages_consumed_total", "Kafka messages consumed", ("topic",)
+        )
+        self.message_errors = Counter(
+            "ingestd_message_errors_total",
+            "Kafka messages which could not be decoded or turned into entries",
+            ("topic",),
+        )
+        self.entries_created = Counter(
+            "ingestd_entries_created_total", "entries created from messages", ("topic", "data_type")
+        )
+        self.files_ingested = Counter(
+            "ingestd_files_ingested_total", "files ingested into the butler", ("topic", "data_type")
+        )
+        self.files_failed = Counter(
+            "ingestd_files_failed_total", "files which could not be ingested", ("topic", "data_type")
+        )
+        self.files_skipped = Counter(
+            "ingestd_files_skipped_total",
+            "files skipped because the ingested index shows them as already ingested",
+            ("topic", "data_type"),
+        )
+        self.files_requeued = Counter(
+            "ingestd_files_requeued_total",
+            "files held back by the pre-flight check because they were missing or incomplete",
+            ("topic", "data_type"),
+        )
+        self.ingest_retries = Counter(
+            "ingestd_ingest_retries_total", "butler ingest calls made after a failed batch ingest", ("stage",)
+        )
+        self.retries_spooled = Counter(
+            "ingestd_retries_spooled_total", "messages put in the retry spool", ("topic",)
+        )
+        self.retries_abandoned = Counter(
+            "ingestd_retries_abandoned_total", "spooled messages given up on", ("topic",)
+        )
+        self.consumer_pauses = Counter(
+            "ingestd_consumer_pauses_total", "times the consumer was paused because too much was pending"
+        )
+        self.consume_seconds = Histogram("ingestd_consume_seconds", "time spent reading a batch from Kafka")
+        self.entry_creation_seconds = Histogram(
+            "ingestd_entry_creation_seconds", "time spent turning a batch of messages into entries"
+        )
+        self.ingest_seconds = Histogram("ingestd_ingest_seconds", "time spent in RseButler.ingest per batch")
+        self._server = None
+
+    def all(self) -> list:
+        """Return all the metrics"""
+        return [
+            self.messages_consumed,
+            self.message_errors,
+            self.entries_created,
+            self.files_ingested,
+            self.files_failed,
+            self.files_skipped,
+            self.files_requeued,
+            self.ingest_retries,
+            self.retries_spooled,
+            self.retries_abandoned,
+            self.consumer_pauses,
+            self.consume_seconds,
+            self.entry_creation_seconds,
+            self.ingest_seconds,
+        ]
+
+    def snapshot(self) -> dict:
+        """Return a copy of the values of all the metrics, keyed by metric
+        name; snapshots can be sent between processes and combined with
+        merge
+        """
+        return {metric.name: metric.snapshot() for metric in self.all()}
+
+    def merge(self, snapshot: dict):
+        """Add the values of a snapshot to these metrics
+
+        Parameters
+        ----------
+        snapshot : `dict`
+            values keyed by metric name, as returned by snapshot
+        """
+        for metric in self.all():
+            if metric.name in snapshot:
+                metric.merge(snapshot[metric.name])
+
+    def render(self) -> str:
+        """Return all the metrics in Prometheus text format"""
+        lines = []
+        for metric in self.all():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+    def start_server(self, port: int, address: str = "") -> ThreadingHTTPServer:
+        """Serve the metrics over HTTP from a background thread
+
+        Parameters
+        ----------
+        port : `int`
+            port to listen on; 0 picks a free port
+        address : `str`, optional
+            address to listen on; defaults to all addresses
+
+        Returns
+        -------
+        server : `http.server.ThreadingHTTPServer`
+            the server
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                LOGGER.debug(format, *args)
+
+        self._server = ThreadingHTTPServer((address, port), Handler)
+        self._server.daemon_threads = True
+        thread = threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True)
+        thread.start()
+        LOGGER.info("serving metrics on port %d", self._server.server_address[1])
+        return self._server
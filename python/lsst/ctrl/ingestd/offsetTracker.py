@@ -0,0 +1,178 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import logging
+import threading
+import time
+
+from confluent_kafka import TopicPartition
+
+LOGGER = logging.getLogger(__name__)
+
+
+class OffsetTracker:
+    """Tracks which Kafka messages have been dealt with, and commits the
+    offsets of the partitions up to the first message which hasn't
+
+    A message is dealt with once its file has been ingested or put in the
+    retry spool, or once it's found to be unusable.  For each partition,
+    the offset committed is that of the earliest message still pending,
+    or the one after the last message read if none are, so a restart only
+    replays messages which weren't dealt with.  Commits are asynchronous,
+    and are made at most every ``interval`` seconds unless ``messages``
+    messages have been dealt with since the last one.
+
+    Parameters
+    ----------
+    consumer : `confluent_kafka.Consumer`
+        consumer to commit offsets with
+    interval : `float`, optional
+        seconds between two commits
+    messages : `int`, optional
+        number of messages dealt with after which a commit is made, even
+        if ``interval`` hasn't gone by
+    """
+
+    def __init__(self, consumer, interval: float = 5.0, messages: int = 1000):
+        self.consumer = consumer
+        self.interval = interval
+        self.messages = messages
+        # (topic, partition) -> offsets read but not dealt with
+        self._pending: dict[tuple, set[int]] = {}
+        # (topic, partition) -> offset after the last message read
+        self._next: dict[tuple, int] = {}
+        # (topic, partition) -> last offset committed
+        self._committed: dict[tuple, int] = {}
+        self._done_count = 0
+        self._last_commit = time.monotonic()
+        # messages are tracked by the fetch stage and dealt with by the
+        # ingest stage, which may run in different threads
+        self._lock = threading.Lock()
+
+    def track(self, msgs: list):
+        """Record messages which have been read from Kafka
+
+        Parameters
+        ----------
+        msgs : `list` [`confluent_kafka.Message`]
+            messages read
+        """
+        with self._lock:
+            for msg in msgs:
+                if msg.error():
+                    continue
+                key = (msg.topic(), msg.partition())
+                offset = msg.offset()
+                self._pending.setdefault(key, set()).add(offset)
+                self._next[key] = max(self._next.get(key, 0), offset + 1)
+
+    def done(self, offsets: list[tuple]):
+        """Record messages which have been dealt with
+
+        Parameters
+        ----------
+        offsets : `list` [`tuple`]
+            (topic, partition, offset) of each message; messages of
+            partitions which are no longer assigned are ignored
+        """
+        with self._lock:
+            for topic, partition, offset in offsets:
+                pending = self._pending.get((topic, partition))
+                if pending is not None and offset in pending:
+                    pending.discard(offset)
+                    self._done_count += 1
+
+    def maybe_commit(self):
+        """Commit the offsets, if enough time has gone by or enough
+        messages have been dealt with since the last commit
+        """
+        if self._done_count >= self.messages or time.monotonic() - self._last_commit >= self.interval:
+            self.commit()
+
+    def commit(self, partitions: list | None = None, asynchronous: bool = True):
+        """Commit the offsets which have moved since the last commit
+
+        Parameters
+        ----------
+        partitions : `list` [`confluent_kafka.TopicPartition`], optional
+            partitions to commit; all of them if not given
+        asynchronous : `bool`, optional
+            return without waiting for the broker
+        """
+        keys = None if partitions is None else {(p.topic, p.partition) for p in partitions}
+        with self._lock:
+            offsets = []
+            for key, offset in self._positions().items():
+                if keys is not None and key not in keys:
+                    continue
+                if self._committed.get(key) != offset:
+                    offsets.append(TopicPartition(key[0], key[1], offset))
+            self._done_count = 0
+            self._last_commit = time.monotonic()
+        if not offsets:
+            return
+        LOGGER.debug("committing %s", offsets)
+        try:
+            self.consumer.commit(offsets=offsets, asynchronous=asynchronous)
+        except Exception as e:
+            # the offsets are committed again with the next commit
+            LOGGER.warning("offset commit failed: %s", e)
+            return
+        with self._lock:
+            for tp in offsets:
+                self._committed[(tp.topic, tp.partition)] = tp.offset
+
+    def positions(self) -> dict[tuple, int]:
+        """Return the offset of the first message which hasn't been dealt
+        with for each partition, or the one after the last message read if
+        all of them have; the offsets commit() would commit
+
+        Returns
+        -------
+        positions : `dict` [`tuple`, `int`]
+            offset for each (topic, partition)
+        """
+        with self._lock:
+            return self._positions()
+
+    def _positions(self) -> dict[tuple, int]:
+        return {
+            key: min(self._pending[key]) if self._pending[key] else next_offset
+            for key, next_offset in self._next.items()
+        }
+
+    def revoke(self, partitions: list):
+        """Commit the offsets of partitions which are being revoked, and
+        stop tracking them; use as the consumer's on_revoke callback
+
+        Parameters
+        ----------
+        partitions : `list` [`confluent_kafka.TopicPartition`]
+            partitions revoked
+        """
+        self.commit(partitions, asynchronous=False)
+        with self._lock:
+            for partition in partitions:
+                key = (partition.topic, partition.partition)
+                self._pending.pop(key, None)
+                self._next.pop(key, None)
+                self._committed.pop(key, None)
@@ -0,0 +1,171 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import unquote, urlparse
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Preflight:
+    """Checks that the files of a batch are complete before they are
+    ingested, so one file which isn't visible on the RSE yet doesn't fail
+    the whole batch
+
+    The files are looked up by a pool of threads.  An entry whose file is
+    missing, or smaller than the size given in its message, is held back
+    and checked again ``delay`` seconds later.  After ``max_attempts``
+    checks, it is let through anyway, so its failure is dealt with by the
+    ingest like any other.  Files which aren't on a local file system
+    aren't checked.  A file whose lookup doesn't return within ``timeout``
+    seconds, such as one on a hung file system, counts as incomplete.
+
+    Parameters
+    ----------
+    workers : `int`, optional
+        number of threads looking up files
+    delay : `float`, optional
+        time in seconds before a held back entry is checked again
+    max_attempts : `int`, optional
+        number of times an entry is checked before it is let through
+    metrics : `lsst.ctrl.ingestd.metrics.Metrics`, optional
+        metrics to count the held back entries in
+    timeout : `float`, optional
+        time in seconds to wait for the files of a batch to be looked up
+    """
+
+    def __init__(
+        self,
+        workers: int = 16,
+        delay: float = 5.0,
+        max_attempts: int = 12,
+        metrics=None,
+        timeout: float = 10.0,
+    ):
+        self.delay = delay
+        self.max_attempts = max_attempts
+        self.metrics = metrics
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="preflight")
+        # (time of the next check, checks made, entry) of held back entries
+        self._waiting = []
+
+    def check(self, entries: list, now: float | None = None) -> list:
+        """Check the files of a batch of entries, along with those of the
+        held back entries which are due to be checked again
+
+        Parameters
+        ----------
+        entries : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            entries to check
+        now : `float`, optional
+            current time.monotonic() value
+
+        Returns
+        -------
+        ready : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            entries which can be ingested
+        """
+        if now is None:
+            now = time.monotonic()
+        candidates = [(0, entry) for entry in entries]
+        if self._waiting:
+            waiting = []
+            for next_check, attempts, entry in self._waiting:
+                if next_check <= now:
+                    candidates.append((attempts, entry))
+                else:
+                    waiting.append((next_check, attempts, entry))
+            self._waiting = waiting
+        if not candidates:
+            return []
+
+        futures = [self._executor.submit(_file_complete, entry) for _, entry in candidates]
+        done, _ = wait(futures, timeout=self.timeout)
+        ready = []
+        for (attempts, entry), future in zip(candidates, futures, strict=True):
+            attempts += 1
+            if future in done:
+                ok = future.result()
+            else:
+                LOGGER.warning("looking up %s timed out after %s seconds", entry.file_to_ingest, self.timeout)
+                ok = False
+            if ok:
+                ready.append(entry)
+            elif attempts >= self.max_attempts:
+                LOGGER.warning(
+                    "%s still incomplete after %d checks; ingesting it anyway", entry.file_to_ingest, attempts
+                )
+                ready.append(entry)
+            else:
+                LOGGER.info(
+                    "%s is incomplete; checking it again in %s seconds", entry.file_to_ingest, self.delay
+                )
+                self._waiting.append((now + self.delay, attempts, entry))
+                if self.metrics is not None:
+                    self.metrics.files_requeued.inc(
+                        topic=entry.message.topic, data_type=entry.get_data_type()
+                    )
+        return ready
+
+    def pending(self) -> int:
+        """Return the number of held back entries"""
+        return len(self._waiting)
+
+    def clear(self) -> list:
+        """Stop holding back entries
+
+        Returns
+        -------
+        entries : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            entries which were held back
+        """
+        entries = [entry for _, _, entry in self._waiting]
+        self._waiting = []
+        return entries
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _file_complete(entry) -> bool:
+    """Return whether the file of an entry exists and, if the message gives
+    its size, is at least that size; files which aren't on a local file
+    system are assumed to be complete
+
+    Parameters
+    ----------
+    entry : `lsst.ctrl.ingestd.entries.Entry`
+        entry whose file is checked
+    """
+    url = urlparse(entry.file_to_ingest)
+    if url.scheme not in ("", "file"):
+        return True
+    try:
+        size = os.stat(unquote(url.path)).st_size
+    except OSError:
+        return False
+    expected = entry.message.file_size
+    return expected is None or size >= expected
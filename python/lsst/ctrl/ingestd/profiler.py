@@ -0,0 +1,152 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import collections
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+
+class BatchProfiler:
+    """Profile batches of the ingest loop and write the profiles to a
+    directory
+
+    A profile starts at every ``every``-th batch, and covers that batch
+    and any batches which follow it until ``window`` seconds have gone by.
+    Batches with no entries are not counted.
+    Each profile is written as a ``.prof`` file, readable with `pstats`,
+    along with a ``.json`` file holding the number of batches and entries
+    it covers and their mix of data types, which are also part of the file
+    name.
+
+    Only one profile can be taken at a time in a process, so when several
+    profilers run in different threads, as with lanes, a profiler skips
+    the profiles due while another one's profile is open.
+
+    Parameters
+    ----------
+    directory : `str`
+        directory to write profiles to
+    every : `int`, optional
+        start a profile every this many batches
+    window : `float`, optional
+        minimum time in seconds a profile covers; with 0, a profile covers
+        a single batch
+    prefix : `str`, optional
+        start of the profile file names
+    """
+
+    # held by the profiler whose profile is open
+    _active = threading.Lock()
+
+    def __init__(self, directory: str, every: int = 100, window: float = 0.0, prefix: str = "ingestd"):
+        self.directory = directory
+        self.every = every
+        self.window = window
+        self.prefix = prefix
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._batch_index = 0
+        self._profile = None
+        self._start_time = 0.0
+        self._first_batch = 0
+        self._batches = 0
+        self._data_types: collections.Counter = collections.Counter()
+
+    def begin(self):
+        """Mark the start of a batch"""
+        if self._profile is None and self._batch_index % self.every == 0:
+            if not BatchProfiler._active.acquire(blocking=False):
+                LOGGER.debug("another profile is open; skipping batch %d", self._batch_index)
+                return
+            self._profile = cProfile.Profile()
+            self._start_time = time.monotonic()
+            self._first_batch = self._batch_index
+            self._batches = 0
+            self._data_types.clear()
+        if self._profile is not None:
+            try:
+                self._profile.enable()
+            except ValueError as e:
+                # another profiler, not a BatchProfiler, is active
+                LOGGER.warning("couldn't start profile: %s", e)
+                self._close()
+
+    def end(self, entries: list):
+        """Mark the end of a batch
+
+        Parameters
+        ----------
+        entries : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            entries of the batch
+        """
+        if self._profile is not None:
+            self._profile.disable()
+        if not entries:
+            # polls which returned nothing aren't counted as batches, and
+            # a profile which has only seen such polls is dropped
+            if self._batches == 0 and self._profile is not None:
+                self._close()
+            return
+
+        self._batch_index += 1
+        if self._profile is None:
+            return
+        self._batches += 1
+        self._data_types.update(entry.get_data_type() for entry in entries)
+        if time.monotonic() - self._start_time >= self.window:
+            try:
+                self._dump()
+            finally:
+                self._close()
+
+    def _close(self):
+        """Drop the current profile, letting other profilers start one"""
+        self._profile = None
+        BatchProfiler._active.release()
+
+    def _dump(self):
+        """Write the current profile and its tags"""
+        entry_count = sum(self._data_types.values())
+        mix = "-".join(f"{data_type}{count}" for data_type, count in sorted(self._data_types.items()))
+        name = f"{self.prefix}-{os.getpid()}-batch{self._first_batch}-x{self._batches}-n{entry_count}"
+        if mix:
+            name += f"-{mix}"
+        path = os.path.join(self.directory, name)
+
+        self._profile.dump_stats(f"{path}.prof")
+        tags = {
+            "pid": os.getpid(),
+            "first_batch": self._first_batch,
+            "batches": self._batches,
+            "entries": entry_count,
+            "data_types": dict(self._data_types),
+            "seconds": time.monotonic() - self._start_time,
+        }
+        with open(f"{path}.json", "w") as f:
+            json.dump(tags, f)
+        LOGGER.info("wrote profile %s.prof: %s", path, tags)
@@ -0,0 +1,327 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import gzip
+import logging
+import queue
+import threading
+import time
+from collections.abc import Iterator
+
+from lsst.ctrl.ingestd.config import Config
+from lsst.ctrl.ingestd.entries.entryFactory import EntryFactory
+from lsst.ctrl.ingestd.ingestedIndex import IngestedIndex
+from lsst.ctrl.ingestd.mapper import Mapper
+from lsst.ctrl.ingestd.message import Message
+from lsst.ctrl.ingestd.metrics import Metrics
+from lsst.ctrl.ingestd.rseButler import RseButler
+
+LOGGER = logging.getLogger(__name__)
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class ReplayMessage:
+    """Stand-in for a Kafka message, holding one line of a replay file
+
+    Parameters
+    ----------
+    value : `bytes`
+        the Hermes message
+    filename : `str`
+        name of the file the message was read from
+    offset : `int`
+        line number of the message in its file
+    """
+
+    __slots__ = ("_offset", "_value", "filename")
+
+    def __init__(self, value: bytes, filename: str, offset: int):
+        self._value = value
+        self.filename = filename
+        self._offset = offset
+
+    def value(self) -> bytes:
+        return self._value
+
+    def topic(self):
+        return None
+
+    def partition(self):
+        return None
+
+    def offset(self) -> int:
+        return self._offset
+
+    def error(self):
+        return None
+
+
+def read_messages(filenames: list[str]) -> Iterator[ReplayMessage]:
+    """Read the Hermes messages in JSONL files, one message per line;
+    gzipped files are recognized by their contents.  Blank lines are
+    skipped.
+
+    Parameters
+    ----------
+    filenames : `list` [`str`]
+        files to read
+
+    Yields
+    ------
+    message : `ReplayMessage`
+        each message, in order
+    """
+    for filename in filenames:
+        with open(filename, "rb") as f:
+            gzipped = f.read(2) == GZIP_MAGIC
+        opener = gzip.open if gzipped else open
+        with opener(filename, "rb") as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if line:
+                    yield ReplayMessage(line, filename, line_number)
+
+
+class Replay:
+    """Ingests Hermes messages read from files rather than from Kafka
+
+    Batches of messages are handed to ``workers`` threads, each with a
+    Butler of its own, which turn them into entries and ingest them.  As
+    there's no Kafka topic to map a message's URL with, the topic named
+    after the message's destination RSE and scope, "<dst-rse>-<scope>",
+    is used, unless a topic is given, in which case the URLs of all the
+    messages are mapped with that topic.
+
+    Parameters
+    ----------
+    config : `lsst.ctrl.ingestd.config.Config`
+        configuration; the Kafka settings aren't used
+    batch_size : `int`, optional
+        number of messages ingested together; defaults to the batch_size
+        of the configuration
+    workers : `int`, optional
+        number of threads ingesting batches
+    failed_file : `str`, optional
+        file to write the messages which couldn't be ingested to, one per
+        line, so they can be replayed again later
+    topic : `str`, optional
+        topic used to map the URLs of all messages
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        batch_size: int | None = None,
+        workers: int = 1,
+        failed_file: str | None = None,
+        topic: str | None = None,
+    ):
+        self.config = config
+        self.topic = topic
+        self.batch_size = batch_size if batch_size is not None else config.batch_size
+        self.workers = workers
+        self.failed_file = failed_file
+        if topic is None:
+            self.mapper = Mapper(config.topics)
+        else:
+            if topic not in config.topics:
+                raise ValueError(f"couldn't find {topic} in topics list")
+            self.mapper = _TopicMapper(config.topics, topic)
+        self.metrics = Metrics()
+        self.ingested_index = None
+        if config.ingested_index is not None:
+            self.ingested_index = IngestedIndex(config.ingested_index, config.ingested_index_capacity)
+        self._failed_output = None
+        self._lock = threading.Lock()
+
+    def run(self, filenames: list[str]) -> dict:
+        """Ingest all the messages in a list of files
+
+        Parameters
+        ----------
+        filenames : `list` [`str`]
+            JSONL files to read, which may be gzipped
+
+        Returns
+        -------
+        summary : `dict`
+            counts of messages and files, and the time taken; see
+            format_summary
+        """
+        start = time.monotonic()
+        batches = queue.Queue(maxsize=2 * self.workers)
+        threads = [
+            threading.Thread(target=self._work, args=(batches,), name=f"replay-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        if self.failed_file is not None:
+            self._failed_output = open(self.failed_file, "wb")
+        try:
+            for thread in threads:
+                thread.start()
+            batch = []
+            read = 0
+            for message in read_messages(filenames):
+                read += 1
+                batch.append(message)
+                if len(batch) == self.batch_size:
+                    batches.put(batch)
+                    batch = []
+            if batch:
+                batches.put(batch)
+            for _ in threads:
+                batches.put(None)
+            for thread in threads:
+                thread.join()
+        finally:
+            if self._failed_output is not None:
+                self._failed_output.close()
+                self._failed_output = None
+
+        def total(counter):
+            return int(sum(counter.snapshot().values()))
+
+        return {
+            "messages": read,
+            "message_errors": total(self.metrics.message_errors),
+            "ingested": total(self.metrics.files_ingested),
+            "failed": total(self.metrics.files_failed),
+            "skipped": total(self.metrics.files_skipped),
+            "seconds": time.monotonic() - start,
+        }
+
+    def _work(self, batches: queue.Queue):
+        """Ingest batches of messages until None is read; runs in its own
+        thread
+
+        Parameters
+        ----------
+        batches : `queue.Queue`
+            queue to read lists of messages from
+        """
+        rse_butler = RseButler(
+            self.config.butler_repo,
+            zip_workers=self.config.zip_workers,
+            merge_dim_files=self.config.merge_dim_files,
+            metrics=self.metrics,
+            ingested_index=self.ingested_index,
+            raw_processes=self.config.raw_processes,
+            group_size=self.config.ingest_group_size,
+        )
+        entry_factory = EntryFactory(rse_butler, self.mapper)
+        while True:
+            batch = batches.get()
+            if batch is None:
+                return
+            try:
+                self._ingest(batch, rse_butler, entry_factory)
+            except Exception:
+                LOGGER.exception("couldn't ingest batch of %d messages", len(batch))
+                self._write_failed(batch)
+
+    def _ingest(self, batch: list, rse_butler: RseButler, entry_factory: EntryFactory):
+        """Decode and ingest one batch of messages
+
+        Parameters
+        ----------
+        batch : `list` [`ReplayMessage`]
+            messages to ingest
+        rse_butler : `lsst.ctrl.ingestd.rseButler.RseButler`
+            Butler of this thread
+        entry_factory : `lsst.ctrl.ingestd.entries.entryFactory.EntryFactory`
+            entry factory of this thread
+        """
+        values = {}
+        messages = []
+        unusable = []
+        for msg in batch:
+            try:
+                message = Message(msg)
+            except Exception as e:
+                LOGGER.info("%s line %d: %s", msg.filename, msg.offset(), e)
+                self.metrics.message_errors.inc(topic=msg.filename)
+                unusable.append(msg)
+                continue
+            message.topic = self.topic or f"{message.dst_rse}-{message.scope}"
+            values[id(message)] = msg
+            messages.append(message)
+            self.metrics.messages_consumed.inc(topic=message.topic)
+
+        entries, errors = entry_factory.create_entries(messages)
+        for message, _ in errors:
+            self.metrics.message_errors.inc(topic=message.topic)
+            unusable.append(values[id(message)])
+        failed = rse_butler.ingest(entries) if entries else []
+        self._write_failed(unusable + [values[id(entry.message)] for entry in failed])
+
+    def _write_failed(self, msgs: list):
+        """Write messages which couldn't be ingested to the failed file,
+        if there is one
+        """
+        if self._failed_output is None or not msgs:
+            return
+        with self._lock:
+            for msg in msgs:
+                self._failed_output.write(msg.value() + b"\n")
+
+
+class _TopicMapper(Mapper):
+    """Mapper which rewrites every URL with the same topic, whatever the
+    topic its entry names
+
+    Parameters
+    ----------
+    topic_dict : `dict`
+        topic prefix to physical location prefix dictionary
+    topic : `str`
+        topic used to rewrite all URLs
+    """
+
+    def __init__(self, topic_dict: dict, topic: str):
+        super().__init__(topic_dict)
+        self.topic = topic
+
+    def rewrite(self, topic: str, url: str) -> str:
+        return super().rewrite(self.topic, url)
+
+
+def format_summary(summary: dict) -> str:
+    """Return a replay summary as text
+
+    Parameters
+    ----------
+    summary : `dict`
+        summary returned by Replay.run
+
+    Returns
+    -------
+    text : `str`
+        the summary
+    """
+    seconds = summary["seconds"]
+    rate = summary["messages"] / seconds if seconds > 0 else 0.0
+    return (
+        f"{summary['messages']} messages in {seconds:.1f} seconds ({rate:.1f} messages/sec): "
+        f"{summary['ingested']} files ingested, {summary['skipped']} skipped as already ingested, "
+        f"{summary['failed']} failed, {summary['message_errors']} unusable messages"
+    )
@@ -0,0 +1,289 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from lsst.ctrl.ingestd.message import Message
+
+LOGGER = logging.getLogger(__name__)
+
+# seconds between two checks of the spool for retries which are due
+POLL_INTERVAL = 5.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS retries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    message TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    next_retry REAL
+)
+"""
+_INDEX = "CREATE INDEX IF NOT EXISTS retries_next_retry ON retries (next_retry)"
+
+
+class RetrySpool:
+    """On-disk spool of messages whose files couldn't be ingested, kept in
+    a SQLite database so they survive restarts
+
+    Each message is stored with the number of attempts made to ingest it
+    and the time of its next retry.  The delay before a retry doubles with
+    each failed attempt, starting at ``base_delay`` and capped at
+    ``max_delay``.  After ``max_attempts`` attempts, counting the one which
+    put it in the spool, a message is given up on: it stays in the spool,
+    but is no longer retried.
+
+    Parameters
+    ----------
+    filename : `str`
+        name of the SQLite database file; created if it doesn't exist
+    base_delay : `float`, optional
+        seconds before the first retry
+    max_delay : `float`, optional
+        maximum number of seconds between two retries
+    max_attempts : `int`, optional
+        number of attempts after which a message is given up on
+    """
+
+    def __init__(
+        self, filename: str, base_delay: float = 30.0, max_delay: float = 3600.0, max_attempts: int = 10
+    ):
+        self.filename = filename
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # the spool is written by the ingest thread and read by the
+        # scheduler thread, so the connection is shared under a lock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(_SCHEMA)
+            self._connection.execute(_INDEX)
+
+    def delay(self, attempts: int) -> float:
+        """Return the number of seconds to wait before the next retry
+
+        Parameters
+        ----------
+        attempts : `int`
+            number of attempts made so far
+
+        Returns
+        -------
+        delay : `float`
+            seconds to wait
+        """
+        return min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+
+    def add(self, messages: list, now: float | None = None):
+        """Spool messages after their first failed attempt
+
+        Parameters
+        ----------
+        messages : `list` [`lsst.ctrl.ingestd.message.Message`]
+            messages to spool
+        now : `float`, optional
+            current time, as returned by time.time()
+        """
+        if not messages:
+            return
+        now = time.time() if now is None else now
+        rows = [(json.dumps(message.to_dict()), 1, now + self.delay(1)) for message in messages]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO retries (message, attempts, next_retry) VALUES (?, ?, ?)", rows
+            )
+        LOGGER.info("spooled %d messages for retry", len(rows))
+
+    def due(self, limit: int, now: float | None = None) -> list[tuple[int, int, Message]]:
+        """Return the messages whose next retry is due, oldest first
+
+        Parameters
+        ----------
+        limit : `int`
+            maximum number of messages to return
+        now : `float`, optional
+            current time, as returned by time.time()
+
+        Returns
+        -------
+        due : `list` [`tuple`]
+            (id, attempts, message) of each message
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, attempts, message FROM retries WHERE next_retry <= ? ORDER BY next_retry LIMIT ?",
+                (now, limit),
+            ).fetchall()
+        return [
+            (row_id, attempts, Message.from_dict(json.loads(message))) for row_id, attempts, message in rows
+        ]
+
+    def succeeded(self, ids: list[int]):
+        """Remove messages which have been ingested from the spool
+
+        Parameters
+        ----------
+        ids : `list` [`int`]
+            ids of the messages, as returned by due
+        """
+        if not ids:
+            return
+        with self._lock, self._connection:
+            self._connection.executemany("DELETE FROM retries WHERE id = ?", [(row_id,) for row_id in ids])
+
+    def failed(self, retries: list[tuple[int, int]], now: float | None = None) -> list[int]:
+        """Record another failed attempt for each of a list of messages,
+        scheduling their next retry or giving up on them
+
+        Parameters
+        ----------
+        retries : `list` [`tuple`]
+            (id, attempts) of each message, as returned by due
+        now : `float`, optional
+            current time, as returned by time.time()
+
+        Returns
+        -------
+        abandoned : `list` [`int`]
+            ids of the messages given up on
+        """
+        now = time.time() if now is None else now
+        rows = []
+        abandoned = []
+        for row_id, attempts in retries:
+            attempts += 1
+            if attempts >= self.max_attempts:
+                next_retry = None
+                abandoned.append(row_id)
+            else:
+                next_retry = now + self.delay(attempts)
+            rows.append((attempts, next_retry, row_id))
+        with self._lock, self._connection:
+            self._connection.executemany("UPDATE retries SET attempts = ?, next_retry = ? WHERE id = ?", rows)
+        return abandoned
+
+    def pending(self) -> int:
+        """Return the number of messages waiting to be retried"""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM retries WHERE next_retry IS NOT NULL"
+            ).fetchone()[0]
+
+    def close(self):
+        """Close the spool's database connection"""
+        with self._lock:
+            self._connection.close()
+
+
+class RetryScheduler:
+    """Re-ingests the messages in a retry spool as they come due, from a
+    background thread
+
+    Due messages are ingested together, up to ``batch_size`` at a time,
+    with a Butler of their own so the main ingest loop is never blocked.
+
+    Parameters
+    ----------
+    spool : `RetrySpool`
+        spool to take messages from
+    rse_butler : `lsst.ctrl.ingestd.rseButler.RseButler`
+        Butler used only for retries
+    entry_factory : `lsst.ctrl.ingestd.entries.entryFactory.EntryFactory`
+        factory creating entries with ``rse_butler``
+    batch_size : `int`, optional
+        maximum number of messages retried at once
+    metrics : `lsst.ctrl.ingestd.metrics.Metrics`, optional
+        metrics to record abandoned retries in
+    """
+
+    def __init__(self, spool: RetrySpool, rse_butler, entry_factory, batch_size: int = 50, metrics=None):
+        self.spool = spool
+        self.rse_butler = rse_butler
+        self.entry_factory = entry_factory
+        self.batch_size = batch_size
+        self.metrics = metrics
+        self._thread = None
+
+    def start(self):
+        """Start retrying in a background thread"""
+        self._thread = threading.Thread(target=self._run, name="retry", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                # keep going while there's a full batch of due retries
+                while self.run_once() == self.batch_size:
+                    pass
+            except Exception:
+                LOGGER.exception("retry failed")
+            time.sleep(POLL_INTERVAL)
+
+    def run_once(self, now: float | None = None) -> int:
+        """Retry one batch of due messages
+
+        Parameters
+        ----------
+        now : `float`, optional
+            current time, as returned by time.time()
+
+        Returns
+        -------
+        count : `int`
+            number of messages retried
+        """
+        due = self.spool.due(self.batch_size, now)
+        if not due:
+            return 0
+        LOGGER.info("retrying %d spooled messages", len(due))
+
+        attempts = {}
+        messages = {}
+        for row_id, attempt_count, message in due:
+            attempts[id(message)] = (row_id, attempt_count)
+            messages[row_id] = message
+
+        entries, errors = self.entry_factory.create_entries(list(messages.values()))
+        retries = [attempts[id(message)] for message, _ in errors]
+        if entries:
+            failed = {id(entry) for entry in self.rse_butler.ingest(entries)}
+            retries.extend(attempts[id(entry.message)] for entry in entries if id(entry) in failed)
+        retry_ids = {row_id for row_id, _ in retries}
+        self.spool.succeeded([row_id for row_id in messages if row_id not in retry_ids])
+
+        for row_id in self.spool.failed(retries, now):
+            message = messages[row_id]
+            LOGGER.error("giving up on %s after %d attempts", message, self.spool.max_attempts)
+            if self.metrics is not None:
+                self.metrics.retries_abandoned.inc(topic=message.topic)
+        return len(due)
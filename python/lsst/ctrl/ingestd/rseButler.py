@@ -20,43 +20,207 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from lsst.ctrl.ingestd.entries.dataType import DataType
+from lsst.ctrl.ingestd.metrics import Metrics
 from lsst.daf.butler import Butler, FileDataset
-from lsst.obs.base.ingest import RawIngestConfig, RawIngestTask
+from lsst.daf.butler.transfers import YamlRepoImportBackend
+from lsst.resources import ResourcePath
 
 LOGGER = logging.getLogger(__name__)
 
+# maximum number of dataset refs resolved in a single registry lookup
+LOOKUP_CHUNK_SIZE = 500
+
+
+class RawIngestResults:
+    """Per-file results of a RawIngestTask run, gathered through the
+    task's callbacks
+
+    The task may be pickled to extract metadata in other processes, so
+    this holds nothing but the results; callbacks made in those processes
+    are lost, but on_success is always called in the process which runs
+    the task.
+    """
+
+    def __init__(self):
+        self.ingested: list[str] = []
+        self.failures: list[str] = []
+
+    def reset(self):
+        """Forget the results of the previous run"""
+        self.ingested = []
+        self.failures = []
+
+    def on_success(self, datasets):
+        """Callback used on successful ingest. Used to transmit
+        successful data ingestion status
+
+        Parameters
+        ----------
+        datasets: `list`
+            list of FileDatasets
+        """
+        for dataset in datasets:
+            self.ingested.append(str(dataset.path))
+            LOGGER.info("file %s successfully ingested", dataset.path)
+
+    def on_ingest_failure(self, exposures, exc):
+        """Callback used on ingest failure. Used to transmit
+        unsuccessful data ingestion status
+
+        Parameters
+        ----------
+        exposures: `RawExposureData`
+            exposures that failed in ingest
+        exc: `Exception`
+            Exception which explains what happened
+
+        """
+        for f in exposures.files:
+            filename = f.filename
+            self.failures.append(str(filename))
+            cause = self.extract_cause(exc)
+            LOGGER.info(f"{filename}: ingest failure: {cause}")
+
+    def on_metadata_failure(self, filename, exc):
+        """Callback used on metadata extraction failure. Used to transmit
+        unsuccessful data ingestion status
+
+        Parameters
+        ----------
+        filename: `ButlerURI`
+            ButlerURI that failed in ingest
+        exc: `Exception`
+            Exception which explains what happened
+        """
+        self.failures.append(str(filename))
+        cause = self.extract_cause(exc)
+        LOGGER.info(f"{filename}: metadata failure: {cause}")
+
+    def extract_cause(self, e):
+        """extract the cause of an exception
+
+        Parameters
+        ----------
+        e : `BaseException`
+            exception to extract cause from
+
+        Returns
+        -------
+        s : `str`
+            A string containing the cause of an exception
+        """
+        if e.__cause__ is None:
+            return f"{e}"
+        cause = self.extract_cause(e.__cause__)
+        if cause is None:
+            return f"{e.__cause__!s}"
+        else:
+            return f"{e.__cause__!s};  {cause}"
+
 
 class RseButler:
     """Object that wraps an instance of a Butler with files in an RSE
 
+    The Butler is created on first use, and so is the RawIngestTask used
+    for raw files, along with the obs_base import it needs, so a daemon
+    which never sees a raw file never pays for them.
+
     Parameters
     ----------
     repo : `str`
         Butler repo location
+    zip_workers : `int`, optional
+        number of zip files to ingest concurrently
+    merge_dim_files : `bool`, optional
+        merge the records of all dimension files in a batch and insert them
+        in one transaction
+    metrics : `lsst.ctrl.ingestd.metrics.Metrics`, optional
+        metrics to record ingest results in
+    ingested_index : `lsst.ctrl.ingestd.ingestedIndex.IngestedIndex`, optional
+        index of files already ingested, which are skipped without
+        calling the Butler
+    raw_processes : `int`, optional
+        number of processes RawIngestTask extracts the metadata of raw
+        files with
+    group_size : `int`, optional
+        maximum number of datasets ingested in one Butler call
     """
 
-    def __init__(self, repo: str):
-        self.butler = Butler(repo, writeable=True)
-        cfg = RawIngestConfig()
-        cfg.transfer = "direct"
-        self.task = RawIngestTask(
-            config=cfg,
-            butler=self.butler,
-            on_success=self.on_success,
-            on_ingest_failure=self.on_ingest_failure,
-            on_metadata_failure=self.on_metadata_failure,
-        )
-
-    def ingest(self, entries: list):
+    def __init__(
+        self,
+        repo: str,
+        zip_workers: int = 1,
+        merge_dim_files: bool = False,
+        metrics=None,
+        ingested_index=None,
+        raw_processes: int = 1,
+        group_size: int = 500,
+    ):
+        self.repo = repo
+        self.ingested_index = ingested_index
+        self.raw_processes = raw_processes
+        self.group_size = group_size
+        self._butler = None
+        self._task = None
+        self._raw_pool = None
+        self._raw_results = RawIngestResults()
+        self.zip_workers = zip_workers
+        self.merge_dim_files = merge_dim_files
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._zip_executor = None
+        self._thread_local = threading.local()
+
+    @property
+    def butler(self) -> Butler:
+        """The Butler, created on first use"""
+        if self._butler is None:
+            start = time.monotonic()
+            self._butler = Butler(self.repo, writeable=True)
+            LOGGER.info("created butler for %s in %.2f seconds", self.repo, time.monotonic() - start)
+        return self._butler
+
+    @property
+    def task(self):
+        """The RawIngestTask used to ingest raw files, created on first
+        use
+        """
+        if self._task is None:
+            start = time.monotonic()
+            from lsst.obs.base.ingest import RawIngestConfig, RawIngestTask
+
+            cfg = RawIngestConfig()
+            cfg.transfer = "direct"
+            self._task = RawIngestTask(
+                config=cfg,
+                butler=self.butler,
+                on_success=self._raw_results.on_success,
+                on_ingest_failure=self._raw_results.on_ingest_failure,
+                on_metadata_failure=self._raw_results.on_metadata_failure,
+            )
+            LOGGER.info("created raw ingest task in %.2f seconds", time.monotonic() - start)
+        return self._task
+
+    def ingest(self, entries: list) -> list:
         """ingest a list of datasets
 
         Parameters
         ----------
         entries : `list[Entry]`
             List of Entry
+
+        Returns
+        -------
+        failed : `list[Entry]`
+            entries which could not be ingested
         """
+        if self.ingested_index is not None:
+            entries = self._skip_indexed(entries)
 
         #
         # group entries by data type, so they can be run in batches
@@ -69,217 +233,505 @@ class RseButler:
                 data_type_dict[data_type] = []
             data_type_dict[data_type].append(entry)
 
+        failed = []
         if DataType.ZIP_FILE in data_type_dict:
-            self._ingest_zip(data_type_dict[DataType.ZIP_FILE])
+            failed.extend(self._ingest_zip(data_type_dict[DataType.ZIP_FILE]))
         if DataType.RAW_FILE in data_type_dict:
-            self._ingest(data_type_dict[DataType.RAW_FILE], "direct", True)
+            failed.extend(self._ingest(data_type_dict[DataType.RAW_FILE], "direct", True))
         if DataType.DATA_PRODUCT in data_type_dict:
-            self._ingest(data_type_dict[DataType.DATA_PRODUCT], "auto", False)
+            failed.extend(self._ingest(data_type_dict[DataType.DATA_PRODUCT], "auto", False))
         if DataType.DIM_FILE in data_type_dict:
-            self._ingest_dim(data_type_dict[DataType.DIM_FILE])
+            failed.extend(self._ingest_dim(data_type_dict[DataType.DIM_FILE]))
+
+        failed_ids = {id(entry) for entry in failed}
+        for entry in entries:
+            counter = self.metrics.files_failed if id(entry) in failed_ids else self.metrics.files_ingested
+            counter.inc(topic=entry.message.topic, data_type=entry.get_data_type())
+        if self.ingested_index is not None:
+            self.ingested_index.add(
+                [key for entry in entries if id(entry) not in failed_ids for key in _index_keys(entry)]
+            )
+        return failed
+
+    def _skip_indexed(self, entries: list) -> list:
+        """Return the entries which aren't in the ingested index
+
+        Parameters
+        ----------
+        entries : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            List of Entry
+        """
+        keys = {id(entry): _index_keys(entry) for entry in entries}
+        known = self.ingested_index.known([key for entry_keys in keys.values() for key in entry_keys])
+        pending = []
+        for entry in entries:
+            if all(key in known for key in keys[id(entry)]):
+                LOGGER.debug("%s is in the ingested index; skipping", entry.file_to_ingest)
+                self.metrics.files_skipped.inc(topic=entry.message.topic, data_type=entry.get_data_type())
+            else:
+                pending.append(entry)
+        if len(pending) < len(entries):
+            LOGGER.info("skipped %d files already ingested", len(entries) - len(pending))
+        return pending
 
     def _get_non_registered_datasets(self, datasets: list[FileDataset]) -> list[FileDataset]:
         """Return the list of datasets which are unknown to this butler among
         the provided list of datasets
 
+        The refs of all the datasets are looked up in bulk, in chunks of
+        at most LOOKUP_CHUNK_SIZE refs, rather than one registry query per
+        ref.
+
         Parameters
         ----------
         datasets : `list`
             List of FileDataset objects.
         """
+        dataset_ids = list({ref.id for dataset in datasets for ref in dataset.refs})
+        known_ids = set()
+        for i in range(0, len(dataset_ids), LOOKUP_CHUNK_SIZE):
+            chunk = dataset_ids[i : i + LOOKUP_CHUNK_SIZE]
+            known_ids.update(ref.id for ref in self.butler.get_many_datasets(chunk))
+
         non_registered: list[FileDataset] = []
         for dataset in datasets:
-            for dataset_id in {ref.id for ref in dataset.refs}:
-                if self.butler.get_dataset(dataset_id) is None:
-                    non_registered.append(dataset)
-                else:
-                    LOGGER.debug("file %s is already ingested", dataset.path)
+            if all(ref.id in known_ids for ref in dataset.refs):
+                LOGGER.debug("file %s is already ingested", dataset.path)
+            else:
+                non_registered.append(dataset)
 
         return non_registered
 
-    def _ingest_dim(self, entries: list):
-        dim_files = [e.get_data() for e in entries]
-        for dim_file in dim_files:
+    def _get_non_registered_entries(self, entries: list) -> list:
+        """Return the entries whose datasets are unknown to this butler
+
+        Parameters
+        ----------
+        entries : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            List of Entry
+        """
+        pending = self._get_non_registered_datasets([e.get_data() for e in entries])
+        pending_ids = {id(dataset) for dataset in pending}
+        return [e for e in entries if id(e.get_data()) in pending_ids]
+
+    def _ingest_dim(self, entries: list) -> list:
+        """Import a list of dimension file entries
+
+        If merge_dim_files is set, the records of all the files are merged
+        first; see _merged_ingest_dim.
+
+        Parameters
+        ----------
+        entries : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            List of Entry
+
+        Returns
+        -------
+        failed : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            entries which could not be imported
+        """
+        if self.merge_dim_files and len(entries) > 1:
+            entries = self._merged_ingest_dim(entries)
+
+        failed = []
+        for entry in entries:
+            dim_file = entry.get_data()
             try:
                 LOGGER.info("importing dimension file %s", dim_file)
                 self.butler.import_(filename=dim_file)
                 LOGGER.info("imported %s", dim_file)
             except Exception as e:
                 LOGGER.info(e)
+                failed.append(entry)
+        return failed
+
+    def _merged_ingest_dim(self, entries: list) -> list:
+        """Import the dimension records of a list of dimension file entries
+        in a single transaction
+
+        Records which appear in more than one file are inserted once.
+        Files which hold anything besides dimension records, files which
+        can't be read, and files with records that conflict with the same
+        record in another file are not merged; neither are any of the files
+        if the merged insert fails.
+
+        Parameters
+        ----------
+        entries : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            List of Entry
 
-    def _ingest_zip(self, entries: list):
-        zip_files = [e.get_data() for e in entries]
-        for zip_file in zip_files:
+        Returns
+        -------
+        unmerged : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            entries which still need to be imported one at a time
+        """
+        merged: dict = {}
+        merged_entries = []
+        unmerged = []
+        record_count = 0
+        for entry in entries:
+            dim_file = entry.get_data()
             try:
-                self.butler.ingest_zip(zip_file)
-                LOGGER.info("ingested %s", zip_file)
+                with ResourcePath(dim_file).open("r") as stream:
+                    backend = YamlRepoImportBackend(stream, self.butler)
             except Exception as e:
-                LOGGER.info(e)
+                LOGGER.info("%s: %s", dim_file, e)
+                unmerged.append(entry)
+                continue
+
+            if not self._has_only_dimensions(backend):
+                LOGGER.debug("%s holds more than dimension records; importing on its own", dim_file)
+                unmerged.append(entry)
+                continue
+
+            # check the whole file for conflicts before merging any of it
+            conflict = False
+            for element, records in backend.dimensions.items():
+                element_records = merged.get(element, {})
+                for record in records:
+                    existing = element_records.get(record.dataId.required_values)
+                    if existing is not None and existing != record:
+                        conflict = True
+                        break
+                if conflict:
+                    break
+            if conflict:
+                LOGGER.info("%s has records which conflict with other files; importing on its own", dim_file)
+                unmerged.append(entry)
+                continue
+
+            for element, records in backend.dimensions.items():
+                element_records = merged.setdefault(element, {})
+                for record in records:
+                    if record.dataId.required_values not in element_records:
+                        element_records[record.dataId.required_values] = record
+                        record_count += 1
+            merged_entries.append(entry)
+
+        if not merged_entries:
+            return unmerged
+
+        try:
+            with self.butler.transaction():
+                for element in self.butler.dimensions.sorted(merged.keys()):
+                    records = merged[element].values()
+                    self.butler.registry.insertDimensionData(element, *records, skip_existing=True)
+        except Exception as e:
+            LOGGER.info("merged import of %d dimension files failed: %s", len(merged_entries), e)
+            return unmerged + merged_entries
+
+        for entry in merged_entries:
+            LOGGER.info("imported %s", entry.get_data())
+        LOGGER.info("imported %d records from %d dimension files", record_count, len(merged_entries))
+        return unmerged
+
+    def _has_only_dimensions(self, backend: YamlRepoImportBackend) -> bool:
+        """Return True if an import backend holds only dimension records
+
+        Parameters
+        ----------
+        backend : `lsst.daf.butler.transfers.YamlRepoImportBackend`
+            backend for a dimension file
+        """
+        return not (
+            backend.runs
+            or backend.chains
+            or backend.collections
+            or backend.datasetTypes
+            or backend.datasets
+            or backend.tagAssociations
+            or backend.calibAssociations
+        )
 
-    def _ingest_raw(self, entries: list):
-        files = [e.file_to_ingest for e in entries]
-        self.task.run(files)
+    def _ingest_zip(self, entries: list) -> list:
+        """Ingest a list of zip file entries
 
-    def _ingest(self, entries: list, transfer, retry_as_raw):
-        """Ingest a list of entries
+        If zip_workers is greater than one, the zip files are ingested
+        concurrently, each worker thread using its own Butler.
 
         Parameters
         ----------
         entries : `list` [`lsst.ctrl.ingestd.entries.Entry`]
             List of Entry
-        transfer : `str`
-            Butler transfer type
-        retry_as_raw : `bool`
-            on ingest failure, retry using RawIngestTask
+
+        Returns
+        -------
+        failed : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            entries which could not be ingested
         """
-        completed = False
+        if self.zip_workers > 1 and len(entries) > 1:
+            if self._zip_executor is None:
+                self._zip_executor = ThreadPoolExecutor(self.zip_workers, thread_name_prefix="zip")
+            results = list(self._zip_executor.map(self._ingest_one_zip_in_thread, entries))
+        else:
+            results = [self._ingest_one_zip(self.butler, entry) for entry in entries]
+        return [entry for entry, ingested in zip(entries, results, strict=True) if not ingested]
 
-        datasets = [e.get_data() for e in entries]
+    def _ingest_one_zip_in_thread(self, entry) -> bool:
+        """Ingest a zip file entry using the Butler of the current thread,
+        creating it on first use
 
-        dataset_count = len(datasets)
-        maximum_attempts = dataset_count + 2
+        Parameters
+        ----------
+        entry : `lsst.ctrl.ingestd.entries.Entry`
+            zip file entry to ingest
+        """
+        butler = getattr(self._thread_local, "butler", None)
+        if butler is None:
+            butler = self.butler.clone()
+            self._thread_local.butler = butler
+        return self._ingest_one_zip(butler, entry)
 
-        remaining_attempts = maximum_attempts
+    def _ingest_one_zip(self, butler, entry) -> bool:
+        """Ingest a zip file entry
 
-        while not completed:
-            error = "Unknown"
-            try:
-                remaining_attempts -= 1
-                self.butler.ingest(*datasets, transfer=transfer)
-                LOGGER.debug("ingest succeeded")
-                for dataset in datasets:
-                    LOGGER.info("ingested: %s", dataset.path)
-                completed = True
-            except Exception as e:
-                if retry_as_raw:
-                    LOGGER.info("%s - defaulting to raw ingest task", str(e))
-                    self._ingest_raw(entries)
-                    completed = True
-                else:
-                    LOGGER.warning(e)
-
-            if not completed:
-                pending_datasets = self._get_non_registered_datasets(datasets)
-                if not pending_datasets:
-                    LOGGER.info("all pending datasets ingested")
-                    return
-                elif remaining_attempts > 0:
-                    datasets = pending_datasets
-                    LOGGER.debug(
-                        "datasets left to ingest after %s error: %d out of %d",
-                        error,
-                        len(pending_datasets),
-                        dataset_count,
-                    )
-                else:
-                    LOGGER.info(
-                        "could not ingest %d/%d datasets but reached limit of %d ingest attempts"
-                        "; attempting single ingest",
-                        len(pending_datasets),
-                        dataset_count,
-                        maximum_attempts,
-                    )
-                    for dataset in pending_datasets:
-                        try:
-                            self._single_ingest(dataset, transfer, retry_as_raw)
-                        except RuntimeError as re:
-                            LOGGER.info(re)
-                            continue
-                    return
-        LOGGER.info("all %d datasets ingested", dataset_count)
-
-    def _single_ingest(self, dataset: FileDataset, transfer: str, retry_as_raw: bool):
-        """Use as a backup to do single ingest
+        Parameters
+        ----------
+        butler : `lsst.daf.butler.Butler`
+            Butler to ingest with
+        entry : `lsst.ctrl.ingestd.entries.Entry`
+            zip file entry to ingest
+
+        Returns
+        -------
+        ingested : `bool`
+            True if the zip file was ingested
+        """
+        zip_file = entry.get_data()
+        try:
+            butler.ingest_zip(zip_file)
+            LOGGER.info("ingested %s", zip_file)
+            return True
+        except Exception as e:
+            LOGGER.info("%s: %s", zip_file, e)
+            return False
+
+    def _ingest_raw(self, entries: list) -> list:
+        """Ingest a list of entries with RawIngestTask
 
         Parameters
         ----------
-        dataset : `lsst.daf.butler.FileDataset`
-            FileDataset to ingest
+        entries : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            List of Entry
+
+        Returns
+        -------
+        failed : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            entries which could not be ingested
+        """
+        ingested = self._run_raw_task([e.file_to_ingest for e in entries])
+        return [e for e in entries if str(ResourcePath(e.file_to_ingest)) not in ingested]
+
+    def _run_raw_task(self, files: list) -> set[str]:
+        """Ingest files with a single RawIngestTask run
+
+        With raw_processes greater than 1, the task extracts the metadata
+        of the files in a pool of that many processes, which is kept for
+        later runs.  A file counts as ingested only if the task reported
+        it through its on_success callback, which is always called in
+        this process.
+
+        Parameters
+        ----------
+        files : `list`
+            files to ingest
+
+        Returns
+        -------
+        ingested : `set` [`str`]
+            URIs of the files which were ingested
+        """
+        self._raw_results.reset()
+        pool = None
+        if self.raw_processes > 1 and len(files) > 1:
+            if self._raw_pool is None:
+                # started fresh rather than forked, since forking a process
+                # with running threads can leave the children deadlocked
+                self._raw_pool = multiprocessing.get_context("spawn").Pool(self.raw_processes)
+            pool = self._raw_pool
+        try:
+            self.task.run(files, pool=pool)
+        except Exception as e:
+            LOGGER.info(e)
+        ingested = set(self._raw_results.ingested)
+        LOGGER.info("raw ingest task ingested %d of %d files", len(ingested), len(files))
+        return ingested
+
+    def _ingest(self, entries: list, transfer, retry_as_raw) -> list:
+        """Ingest a list of entries
+
+        The entries are grouped by run collection and dataset type, in
+        groups of at most group_size entries, and each group is ingested
+        in one call, so a registry transaction only touches one run and
+        one dataset type, and a failure in one group doesn't hold up the
+        others.  If a group fails, the datasets in it which still aren't
+        registered are handed to _bisect_ingest to isolate the ones that
+        can't be ingested, or, with retry_as_raw, gathered with those of
+        the other failed groups and ingested by a single RawIngestTask
+        run.
+
+        Parameters
+        ----------
+        entries : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            List of Entry
         transfer : `str`
             Butler transfer type
         retry_as_raw : `bool`
             on ingest failure, retry using RawIngestTask
+
+        Returns
+        -------
+        failed : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            entries which could not be ingested
         """
-        LOGGER.debug("called")
+        failed = []
+        raw_entries = []
+        for group in self._group_entries(entries):
+            if self._ingest_group(group, transfer):
+                continue
+            pending_entries = self._get_non_registered_entries(group)
+            if not pending_entries:
+                LOGGER.info("all pending datasets ingested")
+                continue
+            LOGGER.debug("datasets left to ingest: %d out of %d", len(pending_entries), len(group))
+            if retry_as_raw:
+                raw_entries.extend(pending_entries)
+            else:
+                failed.extend(self._bisect_ingest(pending_entries, transfer))
+
+        if raw_entries:
+            LOGGER.info("defaulting to raw ingest task for %d files", len(raw_entries))
+            self.metrics.ingest_retries.inc(stage="raw")
+            failed.extend(self._ingest_raw(raw_entries))
+        return failed
+
+    def _group_entries(self, entries: list) -> list[list]:
+        """Split entries into groups which share a run collection and a
+        dataset type, of at most group_size entries each
+
+        Parameters
+        ----------
+        entries : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            List of Entry
 
-        still_attempting = True
-        datasets = [dataset]
+        Returns
+        -------
+        groups : `list` [`list` [`lsst.ctrl.ingestd.entries.Entry`]]
+            the groups, in the order their first entries appear
+        """
+        groups: dict[tuple, list] = {}
+        for entry in entries:
+            ref = entry.get_data().refs[0]
+            groups.setdefault((ref.run, ref.datasetType.name), []).append(entry)
 
-        while still_attempting:
-            still_attempting = False
-            try:
-                self.butler.ingest(*datasets, transfer=transfer)
-                LOGGER.info("ingested: %s", dataset.path)
-                return
-            except Exception as e:
-                if retry_as_raw:
-                    LOGGER.debug(f"{e} - defaulting to raw ingest task")
-                    self._ingest_raw([dataset.path])  # XYZZY - fix this
-                else:
-                    LOGGER.warning(e)
-            if not still_attempting:
-                raise RuntimeError(f"couldn't ingest {dataset.path}")
+        chunks = []
+        for (run, dataset_type), group in groups.items():
+            for i in range(0, len(group), self.group_size):
+                chunks.append(group[i : i + self.group_size])
+            LOGGER.debug("%d datasets of type %s in run %s", len(group), dataset_type, run)
+        return chunks
 
-    def on_success(self, datasets):
-        """Callback used on successful ingest. Used to transmit
-        successful data ingestion status
+    def _ingest_group(self, entries: list, transfer: str) -> bool:
+        """Ingest a group of entries in one call
 
         Parameters
         ----------
-        datasets: `list`
-            list of DatasetRefs
+        entries : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            List of Entry
+        transfer : `str`
+            Butler transfer type
+
+        Returns
+        -------
+        ingested : `bool`
+            True if the whole group was ingested
         """
+        datasets = [e.get_data() for e in entries]
+        try:
+            self.butler.ingest(*datasets, transfer=transfer)
+        except Exception as e:
+            LOGGER.warning(e)
+            return False
+        LOGGER.debug("ingest succeeded")
         for dataset in datasets:
-            LOGGER.info("file %s successfully ingested", dataset.path)
+            LOGGER.info("ingested: %s", dataset.path)
+        LOGGER.info("all %d datasets ingested", len(datasets))
+        return True
 
-    def on_ingest_failure(self, exposures, exc):
-        """Callback used on ingest failure. Used to transmit
-        unsuccessful data ingestion status
+    def _bisect_ingest(self, entries: list, transfer: str) -> list:
+        """Ingest a list of entries known to fail as a whole, by splitting
+        it in halves and ingesting each half, recursing into the halves
+        that fail.
+
+        Good datasets are ingested in large chunks, and k bad datasets
+        among n cost roughly k * log2(n) ingest attempts.  Single datasets
+        which still fail are handed to _single_ingest.
 
         Parameters
         ----------
-        exposures: `RawExposureData`
-            exposures that failed in ingest
-        exc: `Exception`
-            Exception which explains what happened
+        entries : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            List of Entry
+        transfer : `str`
+            Butler transfer type
 
+        Returns
+        -------
+        failed : `list` [`lsst.ctrl.ingestd.entries.Entry`]
+            entries which could not be ingested
         """
-        for f in exposures.files:
-            filename = f.filename
-            cause = self.extract_cause(exc)
-            LOGGER.info(f"{filename}: ingest failure: {cause}")
+        failed = []
+        middle = len(entries) // 2
+        for half in (entries[:middle], entries[middle:]):
+            if not half:
+                continue
+            if len(half) == 1:
+                try:
+                    self._single_ingest(half[0].get_data(), transfer)
+                except RuntimeError as re:
+                    LOGGER.info(re)
+                    failed.append(half[0])
+                continue
+            datasets = [e.get_data() for e in half]
+            self.metrics.ingest_retries.inc(stage="bisect")
+            try:
+                self.butler.ingest(*datasets, transfer=transfer)
+                for dataset in datasets:
+                    LOGGER.info("ingested: %s", dataset.path)
+            except Exception as e:
+                LOGGER.warning(e)
+                pending_entries = self._get_non_registered_entries(half)
+                LOGGER.debug("datasets left to ingest: %d out of %d", len(pending_entries), len(half))
+                if pending_entries:
+                    failed.extend(self._bisect_ingest(pending_entries, transfer))
+        return failed
 
-    def on_metadata_failure(self, filename, exc):
-        """Callback used on metadata extraction failure. Used to transmit
-        unsuccessful data ingestion status
+    def _single_ingest(self, dataset: FileDataset, transfer: str):
+        """Use as a backup to do single ingest; raises RuntimeError if the
+        dataset couldn't be ingested
 
         Parameters
         ----------
-        filename: `ButlerURI`
-            ButlerURI that failed in ingest
-        exc: `Exception`
-            Exception which explains what happened
+        dataset : `lsst.daf.butler.FileDataset`
+            FileDataset to ingest
+        transfer : `str`
+            Butler transfer type
         """
-        cause = self.extract_cause(exc)
-        LOGGER.info(f"{filename}: metadata failure: {cause}")
+        LOGGER.debug("called")
 
-    def extract_cause(self, e):
-        """extract the cause of an exception
+        self.metrics.ingest_retries.inc(stage="single")
+        try:
+            self.butler.ingest(dataset, transfer=transfer)
+        except Exception as e:
+            LOGGER.warning(e)
+            raise RuntimeError(f"couldn't ingest {dataset.path}") from e
+        LOGGER.info("ingested: %s", dataset.path)
 
-        Parameters
-        ----------
-        e : `BaseException`
-            exception to extract cause from
 
-        Returns
-        -------
-        s : `str`
-            A string containing the cause of an exception
-        """
-        if e.__cause__ is None:
-            return f"{e}"
-        cause = self.extract_cause(e.__cause__)
-        if cause is None:
-            return f"{e.__cause__!s}"
-        else:
-            return f"{e.__cause__!s};  {cause}"
+def _index_keys(entry) -> list[str]:
+    """Return the keys of an entry in the ingested index: the ids of its
+    datasets, or its path for entries which aren't a single file dataset
+    """
+    data = entry.get_data()
+    if isinstance(data, FileDataset):
+        return [str(ref.id) for ref in data.refs]
+    return [str(data)]
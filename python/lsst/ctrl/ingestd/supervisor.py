@@ -0,0 +1,283 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+
+from lsst.ctrl.ingestd.config import Config
+from lsst.ctrl.ingestd.metrics import Counter, Metrics
+
+LOGGER = logging.getLogger(__name__)
+
+# seconds to wait before restarting a worker which died
+RESTART_DELAY = 5.0
+
+# the environment variable lsst.ctrl.ingestd.ingestd checks to measure
+# startup; not imported from there, so this module doesn't need the Butler
+CTRL_INGESTD_MEASURE_STARTUP = "CTRL_INGESTD_MEASURE_STARTUP"
+
+
+class CombinedMetrics(Metrics):
+    """Metrics of all the workers of a supervisor, combined
+
+    Each worker periodically sends a snapshot of its metrics, which
+    replaces the previous snapshot sent by that worker.  The snapshots of
+    workers which have died are kept, so the totals don't go down when a
+    worker is restarted.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.worker_restarts = Counter("ingestd_worker_restarts_total", "worker processes restarted")
+        self._snapshots: dict[tuple, dict] = {}
+        self._lock = threading.Lock()
+
+    def update(self, worker: tuple, snapshot: dict):
+        """Record the latest snapshot of a worker's metrics
+
+        Parameters
+        ----------
+        worker : `tuple`
+            worker index and process id
+        snapshot : `dict`
+            snapshot of the worker's metrics
+        """
+        with self._lock:
+            self._snapshots[worker] = snapshot
+
+    def all(self) -> list:
+        """Return all the metrics, combined over all the workers"""
+        combined = Metrics()
+        with self._lock:
+            for snapshot in self._snapshots.values():
+                combined.merge(snapshot)
+        return combined.all() + [self.worker_restarts]
+
+
+def _run_worker(config: Config, index: int, stats: multiprocessing.Queue, interval: float):
+    """Run an ingestd worker; the target of each worker process
+
+    Parameters
+    ----------
+    config : `lsst.ctrl.ingestd.config.Config`
+        configuration
+    index : `int`
+        index of this worker
+    stats : `multiprocessing.Queue`
+        queue to send metric snapshots to the supervisor on
+    interval : `float`
+        seconds between two snapshots
+    """
+    # exit rather than die on SIGTERM, so the worker's own child processes,
+    # such as the raw ingest pool, are stopped with it
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    # imported here so the supervisor module doesn't need the Butler
+    from lsst.ctrl.ingestd.ingestd import IngestD
+    from lsst.ctrl.ingestd.lanes import Lanes
+
+    # workers share the consumer group; the supervisor serves the metrics
+    config = config.model_copy(
+        update={"client_id": f"{config.client_id}-{index}", "metrics_port": None, "workers": 1}
+    )
+    runner = Lanes(config) if config.lanes else IngestD(config)
+
+    def send_stats():
+        while True:
+            time.sleep(interval)
+            stats.put((index, multiprocessing.current_process().pid, runner.metrics.snapshot()))
+
+    threading.Thread(target=send_stats, name="stats", daemon=True).start()
+    runner.run()
+
+
+class Supervisor:
+    """Runs several ingestd worker processes in the same Kafka consumer
+    group, restarting any that die and combining their metrics
+
+    Each worker process has its own Kafka consumer and its own Butler, so
+    Kafka spreads the partitions of the topics over the workers.
+
+    Parameters
+    ----------
+    config : `lsst.ctrl.ingestd.config.Config`
+        configuration
+    """
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.workers = config.workers
+        self.stats_interval = config.stats_interval
+        # workers are started fresh rather than forked, so they don't
+        # inherit the supervisor's threads or connections
+        self._context = multiprocessing.get_context("spawn")
+        self._stats = self._context.Queue()
+        self._processes: dict[int, multiprocessing.Process] = {}
+        self._restart_at: dict[int, float] = {}
+        self._stopping = False
+
+        self.metrics = CombinedMetrics()
+        if config.metrics_port is not None:
+            self.metrics.start_server(config.metrics_port)
+
+        LOGGER.info("workers = %d", self.workers)
+        LOGGER.info("stats_interval = %s", self.stats_interval)
+
+    def run(self):
+        """start the workers, and keep them running until SIGTERM or
+        SIGINT is received
+
+        If the CTRL_INGESTD_MEASURE_STARTUP environment variable is set,
+        return once every worker is ready to consume instead, having
+        logged the time it took.
+        """
+        if os.environ.get(CTRL_INGESTD_MEASURE_STARTUP):
+            self.measure_startup()
+            return
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+
+        for index in range(self.workers):
+            self._start_worker(index)
+
+        next_report = time.monotonic() + self.stats_interval
+        try:
+            while not self._stopping:
+                self.poll(timeout=1.0)
+                self.check_workers()
+                if time.monotonic() >= next_report:
+                    self.report()
+                    next_report = time.monotonic() + self.stats_interval
+        finally:
+            self.stop()
+
+    def measure_startup(self):
+        """Start the workers and wait for them to be ready to consume;
+        each worker returns as soon as it is, rather than being restarted
+        """
+        start = time.monotonic()
+        for index in range(self.workers):
+            self._start_worker(index)
+        try:
+            for index, process in self._processes.items():
+                process.join()
+                if process.exitcode != 0:
+                    LOGGER.warning("worker %d exited with code %s", index, process.exitcode)
+        finally:
+            self.stop()
+        LOGGER.info(
+            "all %d workers ready to consume %.2f seconds after they were started",
+            self.workers,
+            time.monotonic() - start,
+        )
+
+    def _handle_signal(self, signum, frame):
+        LOGGER.info("received signal %d, stopping workers", signum)
+        self._stopping = True
+
+    def _start_worker(self, index: int):
+        """Start worker process ``index``"""
+        process = self._context.Process(
+            target=_run_worker,
+            args=(self.config, index, self._stats, self.stats_interval),
+            name=f"ingestd-{index}",
+            # daemonic processes can't start the raw ingest pool; stop()
+            # terminates and joins the workers
+            daemon=False,
+        )
+        process.start()
+        self._processes[index] = process
+        LOGGER.info("started worker %d, pid %d", index, process.pid)
+
+    def poll(self, timeout: float = 0.0):
+        """Read the metric snapshots the workers have sent
+
+        Parameters
+        ----------
+        timeout : `float`, optional
+            seconds to wait for the first snapshot
+        """
+        try:
+            index, pid, snapshot = self._stats.get(timeout=timeout)
+            while True:
+                self.metrics.update((index, pid), snapshot)
+                index, pid, snapshot = self._stats.get_nowait()
+        except queue.Empty:
+            pass
+
+    def check_workers(self):
+        """Restart any workers which have died, after RESTART_DELAY
+        seconds
+        """
+        now = time.monotonic()
+        for index, process in self._processes.items():
+            if process.is_alive():
+                continue
+            if index not in self._restart_at:
+                LOGGER.warning(
+                    "worker %d (pid %d) exited with code %s; restarting in %s seconds",
+                    index,
+                    process.pid,
+                    process.exitcode,
+                    RESTART_DELAY,
+                )
+                self._restart_at[index] = now + RESTART_DELAY
+            elif now >= self._restart_at[index]:
+                del self._restart_at[index]
+                self.metrics.worker_restarts.inc()
+                self._start_worker(index)
+
+    def report(self):
+        """Log the combined counts of all the workers"""
+        alive = sum(1 for process in self._processes.values() if process.is_alive())
+        metrics = {metric.name: metric for metric in self.metrics.all()}
+
+        def total(name):
+            return sum(metrics[name].snapshot().values())
+
+        LOGGER.info(
+            "%d/%d workers running; messages consumed: %d, files ingested: %d, files failed: %d",
+            alive,
+            self.workers,
+            total("ingestd_messages_consumed_total"),
+            total("ingestd_files_ingested_total"),
+            total("ingestd_files_failed_total"),
+        )
+
+    def stop(self):
+        """Stop all the workers"""
+        self._stopping = True
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        for index, process in self._processes.items():
+            process.join(timeout=10)
+            if process.is_alive():
+                LOGGER.warning("worker %d (pid %d) didn't stop; killing it", index, process.pid)
+                process.kill()
+                process.join()
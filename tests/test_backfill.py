@@ -0,0 +1,186 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import json
+import os.path
+import shutil
+import tempfile
+
+import lsst.utils.tests
+from lsst.ctrl.ingestd.backfill import Backfill, DirectoryScanner, data_type_of
+from lsst.ctrl.ingestd.config import Config
+from lsst.ctrl.ingestd.entries.dataType import DataType
+from lsst.ctrl.ingestd.replay import read_messages
+from lsst.daf.butler import Butler, DatasetType
+
+CONFIG = """
+brokers:
+    - kafka:9092
+group_id: "my_test_group"
+butler_repo: {repo}
+topics:
+    XRD5-test:
+        rucio_prefix: root://xrd5:1098//rucio
+        fs_prefix: file://{files}
+"""
+
+
+RAW_SIDECAR = json.dumps(
+    {
+        "id": "5f0b3b7e-8d1a-4a0e-9a55-3c8f1f6c2b11",
+        "datasetType": {
+            "name": "raw",
+            # a storage class daf_butler has a formatter for on its own
+            "storageClass": "StructuredDataDict",
+            "dimensions": ["instrument", "detector", "exposure"],
+        },
+        "dataId": {"dataId": {"instrument": "HSC", "detector": 0, "exposure": 330}},
+        "run": "HSC/raw/all",
+    }
+)
+
+
+class BackfillTestCase(lsst.utils.tests.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.abspath(os.path.dirname(__file__))
+        self.tmp_dir = tempfile.mkdtemp()
+        self.files = os.path.join(self.tmp_dir, "files")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _touch(self, *path):
+        filename = os.path.join(self.files, *path)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        shutil.copy(os.path.join(self.test_dir, "data", "prep.yaml"), filename)
+
+    def testDataType(self):
+        self.assertEqual(data_type_of("a.fits", RAW_SIDECAR), DataType.RAW_FILE)
+        self.assertEqual(data_type_of("a.fits.fz", RAW_SIDECAR), DataType.RAW_FILE)
+        self.assertEqual(data_type_of("a.fits", "{}"), DataType.DATA_PRODUCT)
+        self.assertEqual(data_type_of("a.parq", RAW_SIDECAR), DataType.DATA_PRODUCT)
+        self.assertIsNone(data_type_of("a.fits", None))
+        self.assertEqual(data_type_of("a.zip", None), DataType.ZIP_FILE)
+        self.assertEqual(data_type_of("a.yaml", None), DataType.DIM_FILE)
+        self.assertIsNone(data_type_of("a.txt", None))
+
+    def testScanner(self):
+        expected = set()
+        for i in range(5):
+            for j in range(3):
+                self._touch(f"d{i}", f"e{j}", "a.yaml")
+                expected.add((os.path.join(self.files, f"d{i}", f"e{j}"), ("a.yaml",)))
+        self._touch("top.yaml")
+        expected.add((self.files, ("top.yaml",)))
+        for i in range(5):
+            expected.add((os.path.join(self.files, f"d{i}"), ()))
+
+        scanner = DirectoryScanner([("XRD5-test", self.files)], workers=4)
+        found = {(directory, tuple(names)) for _, directory, names in scanner.scan()}
+        self.assertEqual(found, expected)
+
+    def testBackfill(self):
+        repo = os.path.join(self.tmp_dir, "repo")
+        Butler.makeRepo(repo)
+        self._touch("a", "one.yaml")
+        self._touch("a", "b", "two.yaml")
+        self._touch("c", "three.yaml")
+        with open(os.path.join(self.files, "c", "notes.txt"), "w") as f:
+            f.write("notes\n")
+        # a data product whose sidecar doesn't describe a dataset
+        with open(os.path.join(self.files, "c", "bad.fits"), "w") as f:
+            f.write("fits\n")
+        with open(os.path.join(self.files, "c", "bad.fits.json"), "w") as f:
+            f.write("{}")
+        config_file = os.path.join(self.tmp_dir, "ingestd.yml")
+        with open(config_file, "w") as f:
+            f.write(CONFIG.format(repo=repo, files=self.files))
+        config = Config.load(config_file)
+        checkpoint = os.path.join(self.tmp_dir, "checkpoint.sqlite3")
+        failed_file = os.path.join(self.tmp_dir, "failed.jsonl")
+
+        backfill = Backfill(config, batch_size=2, checkpoint=checkpoint, failed_file=failed_file)
+        summary = backfill.run()
+        self.assertEqual(summary["directories"], 4)
+        self.assertEqual(summary["files"], 4)
+        self.assertEqual(summary["unknown"], 1)
+        self.assertEqual(summary["ingested"], 3)
+        self.assertEqual(summary["failed"] + summary["message_errors"], 1)
+
+        # the failed data product can be replayed with its sidecar
+        failed = [json.loads(msg.value())["payload"] for msg in read_messages([failed_file])]
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(failed[0]["dst-url"], "root://xrd5:1098//rucio/c/bad.fits")
+        self.assertEqual(failed[0]["rubin_butler"], DataType.DATA_PRODUCT)
+        self.assertEqual(failed[0]["rubin_sidecar"], "{}")
+
+        # a second run skips the directories which were done, but not the
+        # one holding the file which failed
+        self._touch("d", "four.yaml")
+        summary = Backfill(config, batch_size=2, checkpoint=checkpoint).run()
+        self.assertEqual(summary["directories"], 5)
+        self.assertEqual(summary["directories_skipped"], 3)
+        self.assertEqual(summary["files"], 3)
+        self.assertEqual(summary["failed"] + summary["message_errors"], 1)
+
+    def testRawBackfill(self):
+        repo = os.path.join(self.tmp_dir, "repo")
+        Butler.makeRepo(repo)
+        butler = Butler.from_config(repo, writeable=True)
+        butler.import_(filename=os.path.join(self.test_dir, "data", "prep.yaml"))
+        butler.registry.registerDatasetType(
+            DatasetType(
+                "raw",
+                ["instrument", "detector", "exposure"],
+                "StructuredDataDict",
+                universe=butler.dimensions,
+            )
+        )
+        butler.registry.registerRun("HSC/raw/all")
+
+        self._touch("raw", "HSCA00033000.fits")
+        with open(os.path.join(self.files, "raw", "HSCA00033000.fits.json"), "w") as f:
+            f.write(RAW_SIDECAR)
+        # a raw file without a sidecar can't be ingested
+        self._touch("raw", "HSCA00033200.fits")
+        config_file = os.path.join(self.tmp_dir, "ingestd.yml")
+        with open(config_file, "w") as f:
+            f.write(CONFIG.format(repo=repo, files=self.files))
+
+        backfill = Backfill(Config.load(config_file))
+        summary = backfill.run()
+        self.assertEqual(summary["files"], 1)
+        self.assertEqual(summary["unknown"], 1)
+        self.assertEqual(backfill.metrics.files_ingested.snapshot(), {("XRD5-test", DataType.RAW_FILE): 1})
+        self.assertEqual(summary["failed"] + summary["message_errors"], 0)
+
+        butler = Butler.from_config(repo)
+        refs = butler.query_datasets("raw", collections="HSC/raw/all", instrument="HSC")
+        self.assertEqual([str(ref.id) for ref in refs], [json.loads(RAW_SIDECAR)["id"]])
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
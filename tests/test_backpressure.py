@@ -0,0 +1,86 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import lsst.utils.tests
+from lsst.ctrl.ingestd.backpressure import Backpressure
+from lsst.ctrl.ingestd.metrics import Metrics
+
+
+class FakeConsumer:
+    def __init__(self):
+        self.partitions = ["p0", "p1"]
+        self.paused = set()
+
+    def assignment(self):
+        return list(self.partitions)
+
+    def pause(self, partitions):
+        self.paused.update(partitions)
+
+    def resume(self, partitions):
+        self.paused.difference_update(partitions)
+
+
+class BackpressureTestCase(lsst.utils.tests.TestCase):
+    def testMessages(self):
+        consumer = FakeConsumer()
+        metrics = Metrics()
+        backpressure = Backpressure(consumer, 100, 40, metrics=metrics)
+
+        backpressure.add(60, 6000)
+        self.assertFalse(backpressure.paused)
+        backpressure.add(60, 6000)
+        self.assertTrue(backpressure.paused)
+        self.assertEqual(consumer.paused, {"p0", "p1"})
+        self.assertEqual(metrics.consumer_pauses.get(), 1)
+
+        # partitions assigned after the pause are paused before polling
+        consumer.partitions.append("p2")
+        backpressure.before_consume()
+        self.assertEqual(consumer.paused, {"p0", "p1", "p2"})
+
+        backpressure.remove(60, 6000)
+        self.assertTrue(backpressure.paused)
+        backpressure.remove(20, 2000)
+        self.assertFalse(backpressure.paused)
+        self.assertEqual(consumer.paused, set())
+
+    def testBytes(self):
+        consumer = FakeConsumer()
+        backpressure = Backpressure(consumer, 0, 0, high_bytes=1000, low_bytes=500)
+
+        backpressure.add(1000, 900)
+        self.assertFalse(backpressure.paused)
+        backpressure.add(1, 200)
+        self.assertTrue(backpressure.paused)
+        backpressure.remove(1, 500)
+        self.assertTrue(backpressure.paused)
+        backpressure.remove(1, 100)
+        self.assertFalse(backpressure.paused)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -0,0 +1,58 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import lsst.utils.tests
+from lsst.ctrl.ingestd.batchController import BatchController
+
+
+class BatchControllerTestCase(lsst.utils.tests.TestCase):
+    def testGrow(self):
+        controller = BatchController(1, 100, 5.0)
+        self.assertEqual(controller.size, 1)
+        self.assertEqual(controller.update(1, 1.0, 0), 6)
+        self.assertEqual(controller.update(6, 1.0, 0), 11)
+
+        # batch wasn't full, so there's no evidence a bigger one would help
+        self.assertEqual(controller.update(3, 1.0, 0), 11)
+
+        for _ in range(100):
+            controller.update(controller.size, 1.0, 0)
+        self.assertEqual(controller.size, 100)
+
+    def testShrink(self):
+        controller = BatchController(10, 100, 5.0)
+        controller.size = 100
+
+        # too slow
+        self.assertEqual(controller.update(100, 6.0, 0), 50)
+        # too many failures
+        self.assertEqual(controller.update(50, 1.0, 10), 25)
+        self.assertEqual(controller.update(25, 10.0, 0), 12)
+        self.assertEqual(controller.update(12, 10.0, 0), 10)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -54,6 +54,14 @@ class ConfigTestCase(lsst.utils.tests.TestCase):
 
         self.assertEqual(self.config.num_messages, 50)
         self.assertEqual(self.config.timeout, 1)
+        self.assertEqual(self.config.batch_size, 50)
+        self.assertEqual(self.config.batch_bytes, 0)
+        self.assertEqual(self.config.linger, 0.0)
+        self.assertFalse(self.config.adaptive_batching)
+        self.assertEqual(self.config.min_num_messages, 1)
+        self.assertEqual(self.config.target_latency, 5.0)
+        self.assertFalse(self.config.pipelined)
+        self.assertEqual(self.config.pipeline_depth, 2)
 
         topic_dict = self.config.topics
         self.assertTrue("XRD1-test1" in topic_dict)
@@ -64,6 +72,7 @@ class ConfigTestCase(lsst.utils.tests.TestCase):
 
         self.assertEqual(topic_dict["XRD1-test1"].rucio_prefix, "root://xrd1:1094//rucio/")
         self.assertEqual(topic_dict["XRD1-test1"].fs_prefix, "file:///rucio/disks/xrd1a/rucio/")
+        self.assertEqual(topic_dict["XRD1-test1"].concurrency, 1)
 
         self.assertEqual(topic_dict["XRD1-test2"].rucio_prefix, "root://xrd1:1094//rucio/")
         self.assertEqual(topic_dict["XRD1-test2"].fs_prefix, "file:///rucio/disks/xrd1b/rucio/")
@@ -90,6 +99,35 @@ class ConfigTestCase(lsst.utils.tests.TestCase):
 
         butler_repo = self.config.butler_repo
         self.assertEqual(butler_repo, "/tmp/repo")
+        self.assertEqual(self.config.backpressure_high_messages, 0)
+        self.assertEqual(self.config.backpressure_low_messages, 0)
+        self.assertEqual(self.config.backpressure_high_bytes, 0)
+        self.assertEqual(self.config.backpressure_low_bytes, 0)
+        self.assertTrue(self.config.enable_auto_commit)
+        self.assertEqual(self.config.commit_interval, 5.0)
+        self.assertEqual(self.config.commit_messages, 1000)
+        self.assertEqual(self.config.zip_workers, 1)
+        self.assertFalse(self.config.merge_dim_files)
+        self.assertEqual(self.config.raw_processes, 1)
+        self.assertEqual(self.config.ingest_group_size, 500)
+        self.assertIsNone(self.config.metrics_port)
+        self.assertIsNone(self.config.profile_dir)
+        self.assertEqual(self.config.profile_every, 100)
+        self.assertEqual(self.config.profile_window, 0.0)
+        self.assertIsNone(self.config.ingested_index)
+        self.assertEqual(self.config.ingested_index_capacity, 1_000_000)
+        self.assertIsNone(self.config.retry_spool_dir)
+        self.assertEqual(self.config.retry_base_delay, 30.0)
+        self.assertEqual(self.config.retry_max_delay, 3600.0)
+        self.assertEqual(self.config.retry_max_attempts, 10)
+        self.assertFalse(self.config.preflight)
+        self.assertEqual(self.config.preflight_workers, 16)
+        self.assertEqual(self.config.preflight_delay, 5.0)
+        self.assertEqual(self.config.preflight_max_attempts, 12)
+        self.assertEqual(self.config.preflight_timeout, 10.0)
+        self.assertFalse(self.config.lanes)
+        self.assertEqual(self.config.workers, 1)
+        self.assertEqual(self.config.stats_interval, 10.0)
 
 
 class MemoryTester(lsst.utils.tests.MemoryTestCase):
@@ -0,0 +1,77 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import json
+import os.path
+import shutil
+import tempfile
+
+import lsst.utils.tests
+from lsst.ctrl.ingestd.entries.datasetRefResolver import DatasetRefResolver
+from lsst.daf.butler import Butler, DatasetRef
+
+
+class DatasetRefResolverTestCase(lsst.utils.tests.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.abspath(os.path.dirname(__file__))
+        self.repo_dir = tempfile.mkdtemp()
+        Butler.makeRepo(self.repo_dir)
+        self.butler = Butler(self.repo_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.repo_dir, ignore_errors=True)
+
+    def getSidecar(self, json_name):
+        json_file = os.path.join(self.test_dir, "data", json_name)
+        with open(json_file) as f:
+            return json.load(f)["payload"]["rubin_sidecar"]
+
+    def testResolve(self):
+        sidecar = self.getSidecar("message.json")
+        resolver = DatasetRefResolver(self.butler)
+
+        ref = resolver.resolve(sidecar)
+        self.assertEqual(ref, DatasetRef.from_json(sidecar, registry=self.butler.registry))
+        self.assertEqual(ref.run, "HSC/runs/RC2/w_2023_32/DM-40356/20230814T170253Z")
+
+        # the dataset type is only built once
+        ref2 = resolver.resolve(self.getSidecar("message440.json"))
+        self.assertIs(ref.datasetType, ref2.datasetType)
+
+    def testEviction(self):
+        sidecar = self.getSidecar("message.json")
+        other = json.loads(sidecar)
+        other["datasetType"]["name"] = "otherSummary"
+        other_sidecar = json.dumps(other)
+
+        resolver = DatasetRefResolver(self.butler, cache_size=1)
+        ref = resolver.resolve(sidecar)
+        resolver.resolve(other_sidecar)
+        self.assertIsNot(resolver.resolve(sidecar).datasetType, ref.datasetType)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
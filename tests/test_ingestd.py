@@ -0,0 +1,252 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os.path
+import shutil
+import tempfile
+import threading
+import time
+
+import lsst.utils.tests
+from lsst.ctrl.ingestd.config import Config
+from lsst.ctrl.ingestd.ingestd import IngestD
+from lsst.daf.butler import Butler
+
+TOPIC = "XRD5-test"
+
+
+class FakeKafkaMessage:
+    def __init__(self, value, offset):
+        self._value = value
+        self._offset = offset
+
+    def value(self):
+        return self._value
+
+    def topic(self):
+        return TOPIC
+
+    def partition(self):
+        return 0
+
+    def offset(self):
+        return self._offset
+
+    def error(self):
+        return None
+
+
+class FakeConsumer:
+    """Consumer handing out messages from a list; an exception in the list
+    is raised instead of being returned
+    """
+
+    def __init__(self, items):
+        self.items = list(items)
+        self.lock = threading.Lock()
+        self.consumed = 0
+        self.seeks = []
+        self.commits = []
+
+    def consume(self, num_messages=1, timeout=-1):
+        with self.lock:
+            if self.items and isinstance(self.items[0], BaseException):
+                raise self.items.pop(0)
+            msgs = []
+            while self.items and len(msgs) < num_messages and not isinstance(self.items[0], BaseException):
+                msgs.append(self.items.pop(0))
+            self.consumed += len(msgs)
+        if not msgs:
+            time.sleep(min(timeout, 0.01))
+        return msgs
+
+    def seek(self, partition):
+        self.seeks.append((partition.topic, partition.partition, partition.offset))
+
+    def commit(self, offsets=None, asynchronous=True):
+        self.commits.append([(tp.topic, tp.partition, tp.offset) for tp in offsets])
+
+    def assignment(self):
+        return []
+
+    def pause(self, partitions):
+        pass
+
+    def resume(self, partitions):
+        pass
+
+
+class IngestDTestCase(lsst.utils.tests.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.abspath(os.path.dirname(__file__))
+        self.repo_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.test_dir, "data", "dim_message.json"), "rb") as f:
+            self.value = f.read().strip()
+
+    def tearDown(self):
+        shutil.rmtree(self.repo_dir, ignore_errors=True)
+
+    def make_config(self, **settings) -> Config:
+        config = {
+            "brokers": ["kafka:9092"],
+            "group_id": "my_test_group",
+            "butler_repo": self.repo_dir,
+            "topics": {TOPIC: {"rucio_prefix": "root://xrd5:1098//rucio", "fs_prefix": "file:///tmp"}},
+        }
+        config.update(settings)
+        return Config.model_validate(config)
+
+    def make_messages(self, count, start=0):
+        return [FakeKafkaMessage(self.value, offset) for offset in range(start, start + count)]
+
+    def testLingerBatchSize(self):
+        consumer = FakeConsumer(self.make_messages(20))
+        ingestd = IngestD(self.make_config(num_messages=2, batch_size=5, linger=10.0), consumer=consumer)
+        start = time.monotonic()
+        self.assertEqual(len(ingestd.consume()), 5)
+        self.assertLess(time.monotonic() - start, 5.0)
+        self.assertEqual(consumer.consumed, 5)
+
+    def testLingerBatchBytes(self):
+        consumer = FakeConsumer(self.make_messages(20))
+        config = self.make_config(num_messages=2, batch_size=10, batch_bytes=3 * len(self.value), linger=10.0)
+        ingestd = IngestD(config, consumer=consumer)
+        start = time.monotonic()
+        # the second consume() reaches batch_bytes
+        self.assertEqual(len(ingestd.consume()), 4)
+        self.assertLess(time.monotonic() - start, 5.0)
+
+    def testLingerDeadline(self):
+        consumer = FakeConsumer(self.make_messages(3))
+        ingestd = IngestD(self.make_config(num_messages=2, batch_size=10, linger=0.3), consumer=consumer)
+        start = time.monotonic()
+        self.assertEqual(len(ingestd.consume()), 3)
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)
+
+    def testNoLinger(self):
+        consumer = FakeConsumer(self.make_messages(20))
+        ingestd = IngestD(self.make_config(num_messages=2, batch_size=10), consumer=consumer)
+        self.assertEqual(len(ingestd.consume()), 2)
+
+    def testUnreachableButler(self):
+        consumer = FakeConsumer(self.make_messages(3))
+        config = self.make_config(butler_repo="/nonexistent/repo", enable_auto_commit=False)
+        ingestd = IngestD(config, consumer=consumer)
+
+        # the messages aren't blamed for the Butler, and aren't committed
+        with self.assertRaises(FileNotFoundError):
+            ingestd.fetch()
+        ingestd.offsets.commit(asynchronous=False)
+        self.assertEqual(consumer.commits, [[(TOPIC, 0, 0)]])
+
+    def testUnusableMessage(self):
+        Butler.makeRepo(self.repo_dir)
+        bad = FakeKafkaMessage(self.value.replace(b'"dim_file"', b'"unknown"'), 0)
+        consumer = FakeConsumer([bad, FakeKafkaMessage(self.value, 1)])
+        ingestd = IngestD(self.make_config(enable_auto_commit=False), consumer=consumer)
+
+        entries = ingestd.fetch()
+        self.assertEqual([entry.message.offset for entry in entries], [1])
+        # the unusable message is done with; the other waits for its ingest
+        ingestd.offsets.commit(asynchronous=False)
+        self.assertEqual(consumer.commits, [[(TOPIC, 0, 1)]])
+
+    def testFailedOffsets(self):
+        Butler.makeRepo(self.repo_dir)
+        spool_dir = os.path.join(self.repo_dir, "spool")
+        for settings, committed in [({}, 0), ({"retry_spool_dir": spool_dir}, 2)]:
+            consumer = FakeConsumer(self.make_messages(2))
+            ingestd = IngestD(self.make_config(enable_auto_commit=False, **settings), consumer=consumer)
+            entries = ingestd.fetch()
+            ingestd.rse_butler.ingest = lambda entries: entries[:1]
+            ingestd.ingest(entries)
+
+            # a failed message is only done with once it's in the spool
+            ingestd.offsets.commit(asynchronous=False)
+            self.assertEqual(consumer.commits, [[(TOPIC, 0, committed)]])
+
+    def testRewindUncommitted(self):
+        Butler.makeRepo(self.repo_dir)
+        consumer = FakeConsumer(self.make_messages(4))
+        ingestd = IngestD(self.make_config(enable_auto_commit=False, num_messages=2), consumer=consumer)
+        ingestd.rse_butler.ingest = lambda entries: []
+        ingestd.process()
+
+        # the second batch fails; it's rewound as it was fetched
+        def fail(entries):
+            raise RuntimeError("ingest failed")
+
+        ingestd.rse_butler.ingest = fail
+        with self.assertRaises(RuntimeError):
+            ingestd.process()
+        self.assertEqual(consumer.seeks, [(TOPIC, 0, 2)])
+
+        # and again to the first message not dealt with before restarting
+        ingestd.rewind_uncommitted()
+        self.assertEqual(consumer.seeks, [(TOPIC, 0, 2), (TOPIC, 0, 2)])
+
+    def testPipeline(self):
+        Butler.makeRepo(self.repo_dir)
+        consumer = FakeConsumer(self.make_messages(6) + [RuntimeError("broker gone")])
+        config = self.make_config(num_messages=2, pipelined=True, pipeline_depth=1)
+        ingestd = IngestD(config, consumer=consumer)
+        batches = []
+        ingestd.ingest = lambda entries: batches.append([entry.message.offset for entry in entries])
+
+        # an error in the fetch thread surfaces in the ingest thread
+        with self.assertRaisesRegex(RuntimeError, "fetch thread stopped") as cm:
+            ingestd.run_pipelined()
+        self.assertIsInstance(cm.exception.__cause__, RuntimeError)
+        self.assertEqual(batches, [[0, 1], [2, 3], [4, 5]])
+        self.assertFalse([t for t in threading.enumerate() if t.name == "fetch"])
+
+    def testPipelineIngestError(self):
+        Butler.makeRepo(self.repo_dir)
+        consumer = FakeConsumer(self.make_messages(20))
+        config = self.make_config(num_messages=2, pipelined=True, pipeline_depth=2)
+        ingestd = IngestD(config, consumer=consumer)
+        batches = []
+
+        def ingest(entries):
+            batches.append([entry.message.offset for entry in entries])
+            # let the fetch thread fill the queue before failing
+            while consumer.consumed < 8:
+                time.sleep(0.01)
+            raise RuntimeError("registry gone")
+
+        ingestd.ingest = ingest
+        with self.assertRaisesRegex(RuntimeError, "registry gone"):
+            ingestd.run_pipelined()
+
+        # the fetch thread is stopped, and the consumer is rewound to the
+        # first message of the batch which failed
+        self.assertFalse([t for t in threading.enumerate() if t.name == "fetch"])
+        self.assertEqual(batches, [[0, 1]])
+        self.assertEqual(consumer.seeks, [(TOPIC, 0, 0)])
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
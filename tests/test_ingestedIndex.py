@@ -0,0 +1,86 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os.path
+import shutil
+import tempfile
+
+import lsst.utils.tests
+from lsst.ctrl.ingestd.ingestedIndex import BloomFilter, IngestedIndex
+
+
+class BloomFilterTestCase(lsst.utils.tests.TestCase):
+    def testBloomFilter(self):
+        bloom = BloomFilter(1000, 0.01)
+        keys = [f"file:///rucio/{i}.fits" for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        for key in keys:
+            self.assertIn(key, bloom)
+
+        false_positives = sum(1 for i in range(10000) if f"file:///other/{i}.fits" in bloom)
+        self.assertLess(false_positives, 300)
+
+
+class IngestedIndexTestCase(lsst.utils.tests.TestCase):
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.index_dir, "ingested.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.index_dir, ignore_errors=True)
+
+    def testIndex(self):
+        index = IngestedIndex(self.filename, capacity=100)
+        self.assertEqual(index.known(["a", "b"]), set())
+        index.add(["a", "c"])
+        index.add(["a"])
+        self.assertEqual(index.known(["a", "b", "c"]), {"a", "c"})
+        index.close()
+
+        # the index survives being reopened
+        index = IngestedIndex(self.filename, capacity=100)
+        self.assertEqual(index.known(["a", "b", "c"]), {"a", "c"})
+
+        keys = [str(i) for i in range(1200)]
+        index.add(keys)
+        self.assertEqual(index.known(keys + ["b"]), set(keys))
+        index.close()
+
+    def testShared(self):
+        # indexes opened on the same file, as by different workers
+        first = IngestedIndex(self.filename, capacity=100)
+        second = IngestedIndex(self.filename, capacity=100)
+        first.add(["a", "b"])
+        self.assertEqual(second.known(["a", "b", "c"]), {"a", "b"})
+        second.add(["c"])
+        self.assertEqual(first.known(["a", "b", "c"]), {"a", "b", "c"})
+        first.close()
+        second.close()
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
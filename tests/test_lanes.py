@@ -0,0 +1,102 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os.path
+import shutil
+import tempfile
+import threading
+import unittest.mock
+
+import lsst.utils.tests
+from lsst.ctrl.ingestd.config import Config
+from lsst.ctrl.ingestd.lanes import Lanes
+from lsst.daf.butler import Butler
+
+
+class LanesTestCase(lsst.utils.tests.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.abspath(os.path.dirname(__file__))
+        self.repo_dir = tempfile.mkdtemp()
+        Butler.makeRepo(self.repo_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.repo_dir, ignore_errors=True)
+
+    def testLanes(self):
+        config_file = os.path.join(self.test_dir, "etc", "ingestd.yml")
+        config = Config.load(config_file)
+        config.butler_repo = self.repo_dir
+        config.lanes = True
+        config.topics["XRD2-test"].concurrency = 2
+
+        lanes = Lanes(config)
+        self.assertEqual(len(lanes.lanes), len(config.topics) + 1)
+
+        first = lanes.lanes["XRD2-test-0"]
+        second = lanes.lanes["XRD2-test-1"]
+        self.assertIsNot(first.rse_butler, second.rse_butler)
+        self.assertIs(first.metrics, lanes.metrics)
+        self.assertIs(second.metrics, lanes.metrics)
+        self.assertIsNone(lanes.ingested_index)
+
+        # each lane only rewrites the URLs of its own topic
+        self.assertEqual(
+            first.mapper.rewrite("XRD2-test", "root://xrd2:1095//rucio/test/a.fits"),
+            "file:///rucio/disks/xrd2/rucio/test/a.fits",
+        )
+        with self.assertRaisesRegex(Exception, "couldn't find XRD1-test1"):
+            first.mapper.rewrite("XRD1-test1", "root://xrd1:1094//rucio/test/a.fits")
+
+    def testSharedIndex(self):
+        config_file = os.path.join(self.test_dir, "etc", "ingestd.yml")
+        config = Config.load(config_file)
+        config.butler_repo = self.repo_dir
+        config.lanes = True
+        config.ingested_index = os.path.join(self.repo_dir, "ingested.sqlite3")
+
+        lanes = Lanes(config)
+        self.assertIsNotNone(lanes.ingested_index)
+        for lane in lanes.lanes.values():
+            self.assertIs(lane.ingested_index, lanes.ingested_index)
+            self.assertIs(lane.rse_butler.ingested_index, lanes.ingested_index)
+
+    def testMeasureStartup(self):
+        config_file = os.path.join(self.test_dir, "etc", "ingestd.yml")
+        config = Config.load(config_file)
+        config.butler_repo = self.repo_dir
+        config.lanes = True
+
+        # run() returns once every lane is ready, instead of restarting them
+        lanes = Lanes(config)
+        with unittest.mock.patch.dict(os.environ, {"CTRL_INGESTD_MEASURE_STARTUP": "1"}):
+            thread = threading.Thread(target=lanes.run, daemon=True)
+            thread.start()
+            thread.join(timeout=30)
+        self.assertFalse(thread.is_alive())
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -22,7 +22,7 @@
 import os
 
 import lsst.utils.tests
-from lsst.ctrl.ingestd.config import Config
+from lsst.ctrl.ingestd.config import Config, _TopicModel
 from lsst.ctrl.ingestd.mapper import Mapper
 
 
@@ -46,6 +46,36 @@ class MapperTestCase(lsst.utils.tests.TestCase):
         s = mapper.rewrite("XRD1-test4", "root://xrd4:1097//rucio/test/48/47/test")
         self.assertEqual(s, "file:///rucio3/test/48/47/test")
 
+        # only a leading prefix is rewritten
+        s = mapper.rewrite("XRD1-test1", "root://xrd2:1095//rucio/root://xrd1:1094//rucio/test")
+        self.assertEqual(s, "root://xrd2:1095//rucio/root://xrd1:1094//rucio/test")
+
+        with self.assertRaisesRegex(Exception, "couldn't find XRD9-test"):
+            mapper.rewrite("XRD9-test", "root://xrd1:1094//rucio/test/28/27/test")
+
+    def testMultiplePrefixes(self):
+        topics = {
+            "XRD1-test": _TopicModel(
+                rucio_prefix=[
+                    "root://xrd1:1094//rucio",
+                    "davs://xrd1:1094/rucio",
+                    "root://xrd1:1094//rucio/a",
+                ],
+                fs_prefix="file:///rucio0",
+            )
+        }
+        for cache_size in (0, 2):
+            mapper = Mapper(topics, cache_size=cache_size)
+            s = mapper.rewrite("XRD1-test", "root://xrd1:1094//rucio/test/28/27/test")
+            self.assertEqual(s, "file:///rucio0/test/28/27/test")
+            s = mapper.rewrite("XRD1-test", "davs://xrd1:1094/rucio/test/28/27/test2")
+            self.assertEqual(s, "file:///rucio0/test/28/27/test2")
+            # longest prefix wins
+            s = mapper.rewrite("XRD1-test", "root://xrd1:1094//rucio/a/28/27/test")
+            self.assertEqual(s, "file:///rucio0/28/27/test")
+            s = mapper.rewrite("XRD1-test", "root://xrd1:1094//rucio/test/28/27/test3")
+            self.assertEqual(s, "file:///rucio0/test/28/27/test3")
+
 
 class MemoryTester(lsst.utils.tests.MemoryTestCase):
     pass
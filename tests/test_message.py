@@ -19,6 +19,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import json
 import os.path
 
 import lsst.utils.tests
@@ -34,6 +35,17 @@ class FakeKafkaMessage:
         return self.val
 
 
+class FakeKafkaMessageWithOffset(FakeKafkaMessage):
+    def topic(self) -> str:
+        return "XRD5-test"
+
+    def partition(self) -> int:
+        return 3
+
+    def offset(self) -> int:
+        return 42
+
+
 class MessageTestCase(lsst.utils.tests.TestCase):
     def configure(self, json_name):
         testdir = os.path.abspath(os.path.dirname(__file__))
@@ -71,6 +83,38 @@ class MessageTestCase(lsst.utils.tests.TestCase):
             ),
         )
         self.assertEqual(self.msg.get_scope(), "test")
+        self.assertEqual(self.msg.get_file_size(), 1365120)
+
+    def testKafkaAttributes(self):
+        testdir = os.path.abspath(os.path.dirname(__file__))
+        with open(os.path.join(testdir, "data", "message.json")) as f:
+            fake_data = f.read()
+
+        msg = Message(FakeKafkaMessage(fake_data))
+        self.assertIsNone(msg.topic)
+        self.assertIsNone(msg.offset)
+        self.assertEqual(msg.size, len(fake_data))
+
+        msg = Message(FakeKafkaMessageWithOffset(fake_data))
+        self.assertEqual(msg.topic, "XRD5-test")
+        self.assertEqual(msg.partition, 3)
+        self.assertEqual(msg.offset, 42)
+        self.assertFalse(hasattr(msg, "__dict__"))
+
+    def testDict(self):
+        testdir = os.path.abspath(os.path.dirname(__file__))
+        with open(os.path.join(testdir, "data", "message.json")) as f:
+            fake_data = f.read()
+
+        msg = Message(FakeKafkaMessageWithOffset(fake_data))
+        copy = Message.from_dict(json.loads(json.dumps(msg.to_dict())))
+        self.assertEqual(copy.to_dict(), msg.to_dict())
+        self.assertEqual(copy.get_dst_url(), msg.get_dst_url())
+        self.assertEqual(copy.get_rubin_sidecar(), msg.get_rubin_sidecar())
+        self.assertEqual(copy.offset, 42)
+
+        msg.set_dst_url("file:///tmp/a.fits")
+        self.assertEqual(msg.get_dst_url(), "file:///tmp/a.fits")
 
     def testNoSidecar(self):
         self.configure("nosidecar.json")
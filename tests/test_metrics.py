@@ -0,0 +1,101 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import urllib.request
+
+import lsst.utils.tests
+from lsst.ctrl.ingestd.metrics import Counter, Histogram, Metrics
+
+
+class MetricsTestCase(lsst.utils.tests.TestCase):
+    def testCounter(self):
+        counter = Counter("test_total", "test counter", ("topic",))
+        counter.inc(topic="XRD1-test")
+        counter.inc(2, topic="XRD1-test")
+        counter.inc(topic='XRD2-"test"')
+        self.assertEqual(counter.get(topic="XRD1-test"), 3)
+        self.assertEqual(
+            counter.collect(),
+            [
+                "# HELP test_total test counter",
+                "# TYPE test_total counter",
+                'test_total{topic="XRD1-test"} 3.0',
+                'test_total{topic="XRD2-\\"test\\""} 1.0',
+            ],
+        )
+
+    def testHistogram(self):
+        histogram = Histogram("test_seconds", "test histogram", buckets=(1.0, 5.0, float("inf")))
+        histogram.observe(0.5)
+        histogram.observe(1.0)
+        histogram.observe(7.0)
+        self.assertEqual(
+            histogram.collect()[2:],
+            [
+                'test_seconds_bucket{le="1.0"} 2',
+                'test_seconds_bucket{le="5.0"} 2',
+                'test_seconds_bucket{le="+Inf"} 3',
+                "test_seconds_sum 8.5",
+                "test_seconds_count 3",
+            ],
+        )
+
+    def testMerge(self):
+        first = Metrics()
+        first.files_ingested.inc(2, topic="XRD1-test", data_type="raw_file")
+        first.ingest_seconds.observe(0.5)
+        second = Metrics()
+        second.files_ingested.inc(topic="XRD1-test", data_type="raw_file")
+        second.files_ingested.inc(topic="XRD2-test", data_type="zip_file")
+        second.ingest_seconds.observe(3.0)
+
+        combined = Metrics()
+        combined.merge(first.snapshot())
+        combined.merge(second.snapshot())
+        self.assertEqual(combined.files_ingested.get(topic="XRD1-test", data_type="raw_file"), 3)
+        self.assertEqual(combined.files_ingested.get(topic="XRD2-test", data_type="zip_file"), 1)
+        lines = combined.ingest_seconds.collect()
+        self.assertIn('ingestd_ingest_seconds_bucket{le="0.5"} 1', lines)
+        self.assertIn("ingestd_ingest_seconds_sum 3.5", lines)
+        self.assertIn("ingestd_ingest_seconds_count 2", lines)
+
+    def testServer(self):
+        metrics = Metrics()
+        metrics.messages_consumed.inc(topic="XRD1-test")
+        server = metrics.start_server(0, "127.0.0.1")
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url) as response:
+                body = response.read().decode()
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertIn('ingestd_messages_consumed_total{topic="XRD1-test"} 1.0', body)
+        self.assertIn("# TYPE ingestd_ingest_seconds histogram", body)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -0,0 +1,104 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from confluent_kafka import TopicPartition
+
+import lsst.utils.tests
+from lsst.ctrl.ingestd.offsetTracker import OffsetTracker
+
+
+class FakeKafkaMessage:
+    def __init__(self, topic, partition, offset):
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def error(self):
+        return None
+
+
+class FakeConsumer:
+    def __init__(self):
+        self.commits = []
+
+    def commit(self, offsets, asynchronous=True):
+        self.commits.append(({(tp.topic, tp.partition): tp.offset for tp in offsets}, asynchronous))
+
+
+class OffsetTrackerTestCase(lsst.utils.tests.TestCase):
+    def testCommit(self):
+        consumer = FakeConsumer()
+        tracker = OffsetTracker(consumer, interval=3600.0, messages=3)
+        tracker.track([FakeKafkaMessage("XRD1-test", 0, offset) for offset in range(10, 15)])
+        tracker.track([FakeKafkaMessage("XRD1-test", 1, 7)])
+
+        # nothing has been dealt with yet
+        tracker.commit()
+        self.assertEqual(consumer.commits, [({("XRD1-test", 0): 10, ("XRD1-test", 1): 7}, True)])
+
+        # offset 10 is held back by 11, which is still pending
+        tracker.done([("XRD1-test", 0, 10), ("XRD1-test", 0, 12)])
+        tracker.maybe_commit()
+        self.assertEqual(len(consumer.commits), 1)
+
+        tracker.done([("XRD1-test", 0, 11), ("XRD2-test", 0, 5)])
+        tracker.maybe_commit()
+        self.assertEqual(len(consumer.commits), 2)
+        self.assertEqual(consumer.commits[-1], ({("XRD1-test", 0): 13}, True))
+
+        # partitions with nothing new aren't committed again
+        tracker.done([("XRD1-test", 0, 13), ("XRD1-test", 0, 14), ("XRD1-test", 1, 7)])
+        tracker.commit()
+        self.assertEqual(consumer.commits[-1], ({("XRD1-test", 0): 15, ("XRD1-test", 1): 8}, True))
+        tracker.commit()
+        self.assertEqual(len(consumer.commits), 3)
+
+    def testRevoke(self):
+        consumer = FakeConsumer()
+        tracker = OffsetTracker(consumer)
+        tracker.track([FakeKafkaMessage("XRD1-test", 0, 3), FakeKafkaMessage("XRD1-test", 1, 4)])
+        tracker.done([("XRD1-test", 0, 3)])
+
+        tracker.revoke([TopicPartition("XRD1-test", 0)])
+        self.assertEqual(consumer.commits, [({("XRD1-test", 0): 4}, False)])
+
+        # a revoked partition is no longer tracked
+        tracker.done([("XRD1-test", 0, 4)])
+        tracker.commit()
+        self.assertEqual(consumer.commits[-1], ({("XRD1-test", 1): 4}, True))
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
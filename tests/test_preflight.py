@@ -0,0 +1,107 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os.path
+import shutil
+import tempfile
+import threading
+import unittest.mock
+from types import SimpleNamespace
+
+import lsst.utils.tests
+from lsst.ctrl.ingestd.metrics import Metrics
+from lsst.ctrl.ingestd.preflight import Preflight, _file_complete
+
+
+def make_entry(url, file_size=None):
+    message = SimpleNamespace(topic="XRD5-test", file_size=file_size)
+    return SimpleNamespace(file_to_ingest=url, message=message, get_data_type=lambda: "raw_file")
+
+
+class PreflightTestCase(lsst.utils.tests.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.metrics = Metrics()
+        self.preflight = Preflight(workers=4, delay=5.0, max_attempts=3, metrics=self.metrics)
+
+    def tearDown(self):
+        self.preflight.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _write(self, name, size):
+        filename = os.path.join(self.tmp_dir, name)
+        with open(filename, "wb") as f:
+            f.write(b"x" * size)
+        return filename
+
+    def testCheck(self):
+        complete = make_entry("file://" + self._write("complete.fits", 10), 10)
+        unsized = make_entry(self._write("unsized.fits", 1))
+        remote = make_entry("root://xrd5:1098//rucio/remote.fits", 10)
+        growing_file = self._write("growing.fits", 5)
+        growing = make_entry("file://" + growing_file, 10)
+        missing = make_entry("file://" + os.path.join(self.tmp_dir, "missing.fits"))
+
+        ready = self.preflight.check([complete, unsized, remote, growing, missing], now=0.0)
+        self.assertEqual(ready, [complete, unsized, remote])
+        self.assertEqual(self.preflight.pending(), 2)
+        self.assertEqual(self.metrics.files_requeued.snapshot()[("XRD5-test", "raw_file")], 2)
+
+        # held back entries aren't checked again before the delay
+        self.assertEqual(self.preflight.check([], now=1.0), [])
+        self.assertEqual(self.preflight.pending(), 2)
+
+        self._write("growing.fits", 10)
+        self.assertEqual(self.preflight.check([], now=5.0), [growing])
+        self.assertEqual(self.preflight.pending(), 1)
+
+        # the missing file is let through after max_attempts checks
+        self.assertEqual(self.preflight.check([], now=10.0), [missing])
+        self.assertEqual(self.preflight.pending(), 0)
+
+    def testTimeout(self):
+        complete = make_entry("file://" + self._write("complete.fits", 10), 10)
+        hung = make_entry("file://" + self._write("hung.fits", 10), 10)
+        release = threading.Event()
+
+        def file_complete(entry):
+            if entry is hung:
+                release.wait()
+            return _file_complete(entry)
+
+        # a lookup which doesn't return in time holds its entry back
+        preflight = Preflight(workers=4, delay=5.0, max_attempts=3, timeout=0.2)
+        try:
+            with unittest.mock.patch("lsst.ctrl.ingestd.preflight._file_complete", file_complete):
+                self.assertEqual(preflight.check([complete, hung], now=0.0), [complete])
+            self.assertEqual(preflight.pending(), 1)
+        finally:
+            release.set()
+            preflight.close()
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -0,0 +1,105 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import glob
+import json
+import os.path
+import shutil
+import tempfile
+
+import lsst.utils.tests
+from lsst.ctrl.ingestd.profiler import BatchProfiler
+
+
+class FakeEntry:
+    def __init__(self, data_type):
+        self.data_type = data_type
+
+    def get_data_type(self):
+        return self.data_type
+
+
+class BatchProfilerTestCase(lsst.utils.tests.TestCase):
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+    def runBatch(self, profiler, entries):
+        profiler.begin()
+        sum(range(1000))
+        profiler.end(entries)
+
+    def testEvery(self):
+        profiler = BatchProfiler(self.profile_dir, every=2)
+        entries = [FakeEntry("data_product"), FakeEntry("data_product"), FakeEntry("raw_file")]
+        for _ in range(4):
+            self.runBatch(profiler, entries)
+            # idle polls don't count as batches
+            self.runBatch(profiler, [])
+
+        profiles = sorted(glob.glob(os.path.join(self.profile_dir, "*.prof")))
+        self.assertEqual(len(profiles), 2)
+        self.assertIn("batch0-x1-n3-data_product2-raw_file1", profiles[0])
+        self.assertIn("batch2-x1-n3-data_product2-raw_file1", profiles[1])
+
+        with open(profiles[0].replace(".prof", ".json")) as f:
+            tags = json.load(f)
+        self.assertEqual(tags["entries"], 3)
+        self.assertEqual(tags["data_types"], {"data_product": 2, "raw_file": 1})
+
+    def testWindow(self):
+        profiler = BatchProfiler(self.profile_dir, every=1, window=3600.0)
+        for _ in range(3):
+            self.runBatch(profiler, [FakeEntry("zip_file")])
+        self.assertEqual(glob.glob(os.path.join(self.profile_dir, "*.prof")), [])
+
+        profiler.window = 0.0
+        self.runBatch(profiler, [FakeEntry("zip_file")])
+        profiles = glob.glob(os.path.join(self.profile_dir, "*.prof"))
+        self.assertEqual(len(profiles), 1)
+        self.assertIn("batch0-x4-n4-zip_file4", profiles[0])
+
+    def testOneAtATime(self):
+        first = BatchProfiler(self.profile_dir, every=1, window=3600.0, prefix="first")
+        second = BatchProfiler(self.profile_dir, every=1, prefix="second")
+        self.runBatch(first, [FakeEntry("zip_file")])
+        # the first profile is still open, so the second profiler skips
+        self.runBatch(second, [FakeEntry("zip_file")])
+        self.assertEqual(glob.glob(os.path.join(self.profile_dir, "*.prof")), [])
+
+        first.window = 0.0
+        self.runBatch(first, [FakeEntry("zip_file")])
+        self.runBatch(second, [FakeEntry("zip_file")])
+        profiles = sorted(os.path.basename(p) for p in glob.glob(os.path.join(self.profile_dir, "*.prof")))
+        self.assertEqual(len(profiles), 2)
+        self.assertTrue(profiles[0].startswith("first-"))
+        self.assertIn("batch1-x1", profiles[1])
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -0,0 +1,141 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import gzip
+import json
+import os.path
+import shutil
+import tempfile
+
+import lsst.utils.tests
+from lsst.ctrl.ingestd.config import Config
+from lsst.ctrl.ingestd.replay import Replay, format_summary, read_messages
+from lsst.daf.butler import Butler
+
+CONFIG = """
+brokers:
+    - kafka:9092
+group_id: "my_test_group"
+butler_repo: {repo}
+topics:
+    XRD5-test:
+        rucio_prefix: root://xrd5:1098//rucio
+        fs_prefix: file://{files}
+"""
+
+
+class ReplayTestCase(lsst.utils.tests.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.abspath(os.path.dirname(__file__))
+        self.tmp_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.test_dir, "data", "dim_message.json")) as f:
+            self.message = json.load(f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _write_messages(self, filename: str, names: list[str], opener=open, dst_rse: str = "XRD5"):
+        """Write a JSONL file of dim_file messages for the given names"""
+        with opener(filename, "wt") as f:
+            for name in names:
+                message = json.loads(json.dumps(self.message))
+                message["payload"]["dst-url"] = f"root://xrd5:1098//rucio/{name}"
+                message["payload"]["dst-rse"] = dst_rse
+                f.write(json.dumps(message) + "\n")
+
+    def _write_config(self, names: list[str]) -> str:
+        """Create a repo and the files of the given names, and return the
+        name of a configuration file using them
+        """
+        repo = os.path.join(self.tmp_dir, "repo")
+        files = os.path.join(self.tmp_dir, "files")
+        os.mkdir(files)
+        Butler.makeRepo(repo)
+        for name in names:
+            shutil.copy(os.path.join(self.test_dir, "data", "prep.yaml"), os.path.join(files, name))
+        config_file = os.path.join(self.tmp_dir, "ingestd.yml")
+        with open(config_file, "w") as f:
+            f.write(CONFIG.format(repo=repo, files=files))
+        return config_file
+
+    def testReadMessages(self):
+        plain = os.path.join(self.tmp_dir, "messages.jsonl")
+        self._write_messages(plain, ["a.yaml", "b.yaml"])
+        with open(plain, "a") as f:
+            f.write("\n")
+        compressed = os.path.join(self.tmp_dir, "messages.jsonl.gz")
+        self._write_messages(compressed, ["c.yaml"], opener=gzip.open)
+
+        msgs = list(read_messages([plain, compressed]))
+        self.assertEqual(len(msgs), 3)
+        self.assertEqual([msg.filename for msg in msgs], [plain, plain, compressed])
+        self.assertEqual([msg.offset() for msg in msgs], [1, 2, 1])
+        self.assertTrue(json.loads(msgs[2].value())["payload"]["dst-url"].endswith("/c.yaml"))
+
+    def testReplay(self):
+        config_file = self._write_config(["a.yaml", "b.yaml", "c.yaml"])
+
+        messages = os.path.join(self.tmp_dir, "messages.jsonl.gz")
+        self._write_messages(messages, ["a.yaml", "b.yaml", "c.yaml", "missing.yaml"], opener=gzip.open)
+        with gzip.open(messages, "at") as f:
+            f.write("not json\n")
+        failed_file = os.path.join(self.tmp_dir, "failed.jsonl")
+
+        replay = Replay(Config.load(config_file), batch_size=2, workers=2, failed_file=failed_file)
+        summary = replay.run([messages])
+        self.assertEqual(summary["messages"], 5)
+        self.assertEqual(summary["message_errors"], 1)
+        self.assertEqual(summary["ingested"], 3)
+        self.assertEqual(summary["failed"], 1)
+        self.assertIn("5 messages", format_summary(summary))
+
+        # the failed messages can be replayed again
+        failed = list(read_messages([failed_file]))
+        self.assertEqual(len(failed), 2)
+
+    def testTopic(self):
+        config_file = self._write_config(["a.yaml"])
+        # the messages name an RSE which has no topic of its own
+        messages = os.path.join(self.tmp_dir, "messages.jsonl")
+        self._write_messages(messages, ["a.yaml"], dst_rse="XRD9")
+
+        # the URLs are mapped with the topic given
+        replay = Replay(Config.load(config_file), topic="XRD5-test")
+        summary = replay.run([messages])
+        self.assertEqual(summary["ingested"], 1)
+        self.assertEqual(summary["message_errors"], 0)
+
+        # without it, the messages can't be mapped, and are counted once
+        summary = Replay(Config.load(config_file)).run([messages])
+        self.assertEqual(summary["messages"], 1)
+        self.assertEqual(summary["message_errors"], 1)
+
+        with self.assertRaisesRegex(ValueError, "couldn't find XRD9-test"):
+            Replay(Config.load(config_file), topic="XRD9-test")
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -123,7 +123,7 @@ class RetriesTestCase(lsst.utils.tests.TestCase):
 
         dataset = entry.get_data()
         with self.assertRaises(RuntimeError) as context:
-            rse_butler._single_ingest(dataset, transfer="auto", retry_as_raw=False)
+            rse_butler._single_ingest(dataset, transfer="auto")
         self.assertEqual(str(context.exception), f"couldn't ingest {data_path}")
 
     def testBadFile(self):
@@ -154,7 +154,8 @@ class RetriesTestCase(lsst.utils.tests.TestCase):
         """Test ingest bad file, then good file"""
 
         rse_butler, good_entry, bad_entry = self.createMultiTestEnv()
-        rse_butler.ingest([bad_entry, good_entry])
+        failed = rse_butler.ingest([bad_entry, good_entry])
+        self.assertEqual(failed, [bad_entry])
 
     def testGoodBad(self):
         """Test ingest good file file, then bad file"""
@@ -166,9 +167,35 @@ class RetriesTestCase(lsst.utils.tests.TestCase):
         """Test ingest good file, then re-ingest of good file"""
 
         rse_butler, good_entry, bad_entry = self.createMultiTestEnv()
-        rse_butler._single_ingest(good_entry.get_data(), transfer="auto", retry_as_raw=False)
+        rse_butler._single_ingest(good_entry.get_data(), transfer="auto")
         with self.assertRaises(RuntimeError):
-            rse_butler._single_ingest(good_entry.get_data(), transfer="auto", retry_as_raw=False)
+            rse_butler._single_ingest(good_entry.get_data(), transfer="auto")
+
+    def testNonRegistered(self):
+        """Test bulk lookup of datasets unknown to the butler"""
+
+        rse_butler, good_entry, bad_entry = self.createMultiTestEnv()
+        good = good_entry.get_data()
+        bad = bad_entry.get_data()
+
+        pending = rse_butler._get_non_registered_datasets([good, bad])
+        self.assertEqual(pending, [good, bad])
+
+        rse_butler._single_ingest(good, transfer="auto")
+        pending = rse_butler._get_non_registered_datasets([good, bad])
+        self.assertEqual(pending, [bad])
+
+    def testBisect(self):
+        """Test that bisection ingests the good file of a failing batch"""
+
+        rse_butler, good_entry, bad_entry = self.createMultiTestEnv()
+        good = good_entry.get_data()
+        bad = bad_entry.get_data()
+
+        failed = rse_butler._bisect_ingest([bad_entry, good_entry], transfer="auto")
+        self.assertEqual(failed, [bad_entry])
+        pending = rse_butler._get_non_registered_datasets([good, bad])
+        self.assertEqual(pending, [bad])
 
     def _copy_tmp_file(self, prep_file, dest_dir):
         src_path = unquote(urlparse(prep_file).path)
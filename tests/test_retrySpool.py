@@ -0,0 +1,131 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os.path
+import shutil
+import tempfile
+
+import lsst.utils.tests
+from lsst.ctrl.ingestd.message import Message
+from lsst.ctrl.ingestd.metrics import Metrics
+from lsst.ctrl.ingestd.retrySpool import RetryScheduler, RetrySpool
+
+
+def make_message(url: str) -> Message:
+    return Message.from_dict({"dst_url": url, "topic": "XRD1-test", "rubin_butler": 1})
+
+
+class FakeEntry:
+    def __init__(self, message):
+        self.message = message
+
+
+class FakeEntryFactory:
+    def create_entries(self, messages):
+        entries = []
+        errors = []
+        for message in messages:
+            if message.get_dst_url().endswith("bad_message"):
+                errors.append((message, ValueError("bad message")))
+            else:
+                entries.append(FakeEntry(message))
+        return entries, errors
+
+
+class FakeRseButler:
+    def __init__(self):
+        self.ingested = []
+
+    def ingest(self, entries):
+        self.ingested.extend(entry.message.get_dst_url() for entry in entries)
+        return [entry for entry in entries if entry.message.get_dst_url().endswith("bad_file")]
+
+
+class RetrySpoolTestCase(lsst.utils.tests.TestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.spool_dir, "retry.sqlite3")
+        self.spool = RetrySpool(self.filename, base_delay=10.0, max_delay=25.0, max_attempts=3)
+
+    def tearDown(self):
+        self.spool.close()
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+    def testDelay(self):
+        self.assertEqual(self.spool.delay(1), 10.0)
+        self.assertEqual(self.spool.delay(2), 20.0)
+        self.assertEqual(self.spool.delay(3), 25.0)
+
+    def testSpool(self):
+        self.spool.add([make_message("file:///a"), make_message("file:///b")], now=100.0)
+        self.assertEqual(self.spool.pending(), 2)
+        self.assertEqual(self.spool.due(10, now=109.0), [])
+
+        due = self.spool.due(10, now=110.0)
+        self.assertEqual([message.get_dst_url() for _, _, message in due], ["file:///a", "file:///b"])
+        self.assertEqual(due[0][2].topic, "XRD1-test")
+
+        (first_id, first_attempts, _), (second_id, second_attempts, _) = due
+        self.spool.succeeded([first_id])
+        self.assertEqual(self.spool.failed([(second_id, second_attempts)], now=110.0), [])
+        self.assertEqual(self.spool.due(10, now=129.0), [])
+        self.assertEqual(len(self.spool.due(10, now=130.0)), 1)
+
+        # the third attempt is the last one
+        self.assertEqual(self.spool.failed([(second_id, 2)], now=130.0), [second_id])
+        self.assertEqual(self.spool.pending(), 0)
+        self.assertEqual(self.spool.due(10, now=1000.0), [])
+
+        # the spool survives being reopened
+        self.spool.add([make_message("file:///c")], now=100.0)
+        self.spool.close()
+        self.spool = RetrySpool(self.filename)
+        self.assertEqual(self.spool.pending(), 1)
+
+    def testScheduler(self):
+        urls = ["file:///good", "file:///bad_file", "file:///bad_message"]
+        self.spool.add([make_message(url) for url in urls], now=100.0)
+        rse_butler = FakeRseButler()
+        metrics = Metrics()
+        scheduler = RetryScheduler(self.spool, rse_butler, FakeEntryFactory(), batch_size=2, metrics=metrics)
+
+        self.assertEqual(scheduler.run_once(now=105.0), 0)
+        # due retries are batched, up to batch_size at a time
+        self.assertEqual(scheduler.run_once(now=110.0), 2)
+        self.assertEqual(rse_butler.ingested, ["file:///good", "file:///bad_file"])
+        self.assertEqual(scheduler.run_once(now=110.0), 1)
+        self.assertEqual(self.spool.pending(), 2)
+
+        # the first ingest and two retries make three attempts, after which
+        # both failures are given up on
+        self.assertEqual(scheduler.run_once(now=129.0), 0)
+        self.assertEqual(scheduler.run_once(now=130.0), 2)
+        self.assertEqual(self.spool.pending(), 0)
+        self.assertEqual(metrics.retries_abandoned.get(topic="XRD1-test"), 2)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
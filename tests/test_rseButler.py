@@ -22,6 +22,7 @@
 import os.path
 import shutil
 import tempfile
+from types import SimpleNamespace
 from urllib.parse import unquote, urlparse
 
 import lsst.utils.tests
@@ -32,6 +33,7 @@ from lsst.ctrl.ingestd.message import Message
 from lsst.ctrl.ingestd.rseButler import RseButler
 from lsst.daf.butler import Butler
 from lsst.pipe.base import Instrument
+from lsst.resources import ResourcePath
 
 
 class FakeKafkaMessage:
@@ -166,6 +168,36 @@ class RseButlerTestCase(lsst.utils.tests.TestCase):
 
         butler.ingest([entry])
 
+    def testMergedDim(self):
+        """Test merged import of dimension files"""
+
+        self.test_dir = os.path.abspath(os.path.dirname(__file__))
+
+        prep_file = os.path.join(self.test_dir, "data", "prep.yaml")
+        dest_paths = [self._copy_tmp_file(prep_file, d) for d in (self.dm_dir, self.dp_dir)]
+
+        json_file = os.path.join(self.test_dir, "data", "dim_message.json")
+        with open(json_file) as f:
+            fake_data = f.read()
+
+        Butler.makeRepo(self.repo_dir)
+        butler = RseButler(self.repo_dir, merge_dim_files=True)
+
+        config_file = os.path.join(self.test_dir, "etc", "ingestd.yml")
+        config = Config.load(config_file)
+        mapper = Mapper(config.topics)
+        event_factory = EntryFactory(butler, mapper)
+
+        entries = []
+        for dest_path in dest_paths:
+            msg = Message(FakeKafkaMessage(fake_data))
+            msg.set_dst_url(dest_path)
+            entries.append(event_factory.create_entry(msg))
+
+        failed = butler.ingest(entries)
+        self.assertEqual(failed, [])
+        self.assertIsNotNone(butler.butler.registry.expandDataId(instrument="HSC", detector=0))
+
     def testRetry(self):
         """Test data product ingest"""
 
@@ -203,6 +235,74 @@ class RseButlerTestCase(lsst.utils.tests.TestCase):
         entry = event_factory.create_entry(self.msg)
         butler.ingest([entry])
 
+    def testLazy(self):
+        """Test that the Butler and RawIngestTask are created on first
+        use"""
+        Butler.makeRepo(self.repo_dir)
+        butler = RseButler(self.repo_dir)
+        self.assertIsNone(butler._butler)
+        self.assertIsNone(butler._task)
+
+        self.assertIs(butler.butler, butler.butler)
+        self.assertIsNone(butler._task)
+
+    def testRawResults(self):
+        """Test that the results of a raw ingest task run are reported per
+        file"""
+
+        class FakeRawIngestTask:
+            def __init__(self, results):
+                self.results = results
+                self.runs = []
+
+            def run(self, files, pool=None):
+                self.runs.append(list(files))
+                # the first file is ingested, the second fails; the task
+                # gives up before reporting the third
+                self.results.on_success([SimpleNamespace(path=ResourcePath(files[0]))])
+                self.results.on_metadata_failure(ResourcePath(files[1]), ValueError("bad header"))
+                raise RuntimeError("some files failed")
+
+        Butler.makeRepo(self.repo_dir)
+        butler = RseButler(self.repo_dir)
+        task = FakeRawIngestTask(butler._raw_results)
+        butler._task = task
+
+        entries = [SimpleNamespace(file_to_ingest=f"file://{self.raw_dir}/{i}.fits") for i in range(3)]
+        failed = butler._ingest_raw(entries)
+        self.assertEqual(task.runs, [[entry.file_to_ingest for entry in entries]])
+        self.assertEqual(failed, entries[1:])
+        self.assertEqual(butler._raw_results.failures, [f"file://{self.raw_dir}/1.fits"])
+
+    def testGroupEntries(self):
+        """Test that entries are grouped by run and dataset type, with
+        the size of the groups capped"""
+
+        def make_entry(run, dataset_type):
+            ref = SimpleNamespace(run=run, datasetType=SimpleNamespace(name=dataset_type))
+            dataset = SimpleNamespace(refs=[ref])
+            return SimpleNamespace(get_data=lambda: dataset, name=(run, dataset_type))
+
+        Butler.makeRepo(self.repo_dir)
+        butler = RseButler(self.repo_dir, group_size=2)
+        entries = [
+            make_entry("run1", "calexp"),
+            make_entry("run2", "calexp"),
+            make_entry("run1", "calexp"),
+            make_entry("run1", "src"),
+            make_entry("run1", "calexp"),
+        ]
+        groups = butler._group_entries(entries)
+        self.assertEqual(
+            [[entry.name for entry in group] for group in groups],
+            [
+                [("run1", "calexp"), ("run1", "calexp")],
+                [("run1", "calexp")],
+                [("run2", "calexp")],
+                [("run1", "src")],
+            ],
+        )
+
     def _copy_tmp_file(self, prep_file, dest_dir):
         src_path = unquote(urlparse(prep_file).path)
         base_name = os.path.basename(src_path)
@@ -0,0 +1,55 @@
+# This file is part of ctrl_ingestd
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import lsst.utils.tests
+from lsst.ctrl.ingestd.metrics import Metrics
+from lsst.ctrl.ingestd.supervisor import CombinedMetrics
+
+
+class CombinedMetricsTestCase(lsst.utils.tests.TestCase):
+    def snapshot(self, count):
+        metrics = Metrics()
+        metrics.files_ingested.inc(count, topic="XRD1-test", data_type="raw_file")
+        return metrics.snapshot()
+
+    def testUpdate(self):
+        combined = CombinedMetrics()
+        combined.update((0, 100), self.snapshot(1))
+        combined.update((1, 101), self.snapshot(2))
+        # a later snapshot from the same worker replaces the earlier one
+        combined.update((0, 100), self.snapshot(4))
+        # a restarted worker has a new process id, so the counts of the
+        # worker it replaced are kept
+        combined.update((1, 102), self.snapshot(8))
+        combined.worker_restarts.inc()
+
+        body = combined.render()
+        self.assertIn('ingestd_files_ingested_total{topic="XRD1-test",data_type="raw_file"} 14.0', body)
+        self.assertIn("ingestd_worker_restarts_total 1.0", body)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()